@@ -1,6 +1,7 @@
 import io_control
 import sd_control
 import math
+from array import array
 import lib.extended_ticks_us as extended_ticks_us
 import display
 import time
@@ -182,6 +183,166 @@ def eis(settings_obj, current, min_freq, max_freq, measurement_points):
     
 
 
+def multisine_harmonics(min_freq, max_freq, components):
+    # Odd multiples of min_freq, log spaced between min_freq and max_freq.
+    # Sums and differences of two odd harmonics are even, so second order
+    # distortion of the cell never lands on an excited frequency
+    if min_freq <= 0 or max_freq <= min_freq:
+        raise ValueError("multisine needs 0 < min_freq < max_freq.")
+    if components < 2:
+        raise ValueError("components must be at least 2.")
+
+    highest = int(max_freq / min_freq + 1e-9)
+    step = math.log10(highest) / (components - 1)
+    harmonics = []
+    for i in range(components):
+        h = int(round(10 ** (i * step)))
+        if h % 2 == 0:
+            h = h + 1 if h + 1 <= highest else h - 1
+        if h not in harmonics:
+            harmonics.append(h)
+    return harmonics
+
+
+def multisine_phases(harmonics, trials=8):
+    # Schroeder phases keep the crest factor low for dense spectra. The
+    # log spaced harmonics are sparse, so one pass of coordinate search
+    # over `trials` phase shifts per component lowers the peak further,
+    # giving each component a larger share of the DAC range
+    count = len(harmonics)
+    phases = [-math.pi * k * (k - 1) / count for k in range(1, count + 1)]
+
+    samples = 4 * harmonics[-1]
+    x_step = 2 * math.pi / samples
+    total = array('f', [0] * samples)
+    for h, p in zip(harmonics, phases):
+        for n in range(samples):
+            total[n] += math.sin(h * n * x_step + p)
+
+    for k, h in enumerate(harmonics):
+        for n in range(samples):
+            total[n] -= math.sin(h * n * x_step + phases[k])
+        best_peak = None
+        best_phase = phases[k]
+        for j in range(trials):
+            p = phases[k] + 2 * math.pi * j / trials
+            peak = 0
+            for n in range(samples):
+                value = abs(total[n] + math.sin(h * n * x_step + p))
+                if value > peak:
+                    peak = value
+            if best_peak is None or peak < best_peak:
+                best_peak = peak
+                best_phase = p
+        phases[k] = best_phase
+        for n in range(samples):
+            total[n] += math.sin(h * n * x_step + best_phase)
+    return phases
+
+
+def multisine_peak(harmonics, phases, oversample=16):
+    # Largest |sum of sines| over one base period, found by sampling
+    samples = oversample * harmonics[-1]
+    peak = 0
+    for n in range(samples):
+        x = 2 * math.pi * n / samples
+        value = abs(sum(math.sin(h * x + p) for h, p in zip(harmonics, phases)))
+        if value > peak:
+            peak = value
+    return peak
+
+
+multisine_cache = {}
+
+def multisine_waveform(min_freq, max_freq, components):
+    # The phase search takes a while on the MCU, do it once per program
+    key = (min_freq, max_freq, components)
+    if key not in multisine_cache:
+        harmonics = multisine_harmonics(min_freq, max_freq, components)
+        phases = multisine_phases(harmonics)
+        multisine_cache[key] = (harmonics, phases, multisine_peak(harmonics, phases))
+    return multisine_cache[key]
+
+
+def eis_multisine(settings_obj, current, min_freq, max_freq, components, periods=2):
+    if state.is_in_progress == 0: return
+
+    harmonics, phases, peak = multisine_waveform(min_freq, max_freq, components)
+    # 2% headroom for peaks between the sampled points, the DAC code wraps above full scale
+    scale = current * 0.5 / (peak * 1.02)
+
+    # One extra period lets the cell settle and is not logged
+    settle_time = 1_000_000 / min_freq
+    time_us = periods * 1_000_000 / min_freq
+    print(f"DC Multisine EIS started {current}mA, {len(harmonics)} frequencies, {(settle_time + time_us)/1_000_000}s")
+
+    # A flush holds the DAC, so the whole excitation must fit the buffer:
+    # empty it now and log on a time grid of at most buffer_size - 1 records
+    if sd_control.buffer_state.current_index:
+        sd_control.log_to_sd(state.filename)
+    log_interval = time_us // (sd_control.buffer_state.buffer_size - 1) + 1
+    if log_interval * max_freq * 3 > 1_000_000:
+        print(f"DC Multisine log rate {1_000_000/log_interval:.0f} SPS is below 3x {max_freq}Hz, shorten the sweep!")
+
+    # Logged with negative f: multisine on top of base frequency |f|
+    state.freq = min_freq
+    low_voltage_counter = 0
+    previous_voltage = 0
+    resample_counter = 0
+    base_const = 2 * math.pi * min_freq / 1_000_000
+
+    previous_time = extended_ticks_us.time_tracker.ticks_us()
+    start_time = previous_time
+    log_start_time = start_time + settle_time
+    end_time = log_start_time + time_us
+    next_log_time = log_start_time
+
+    while extended_ticks_us.time_tracker.ticks_us() < end_time:
+        current_inner_time = extended_ticks_us.time_tracker.ticks_us() - start_time
+        x = base_const * current_inner_time
+        sin_current = current * 0.5 + scale * sum(math.sin(h * x + p) for h, p in zip(harmonics, phases))
+        io_control.set_current(sin_current)
+        read_ADS1265()
+
+        while previous_voltage != 0 and abs(previous_voltage - state.last_voltage) > settings_obj.filter_voltage and resample_counter < 50: #0.1uV
+            if resample_counter == 0 or resample_counter == 49:
+                print(f"ADS V diff {(previous_voltage - state.last_voltage)/10_000:.3f}mV!")
+            time.sleep_us(500)
+            read_ADS1265()
+            resample_counter = resample_counter + 1
+        resample_counter = 0
+        previous_voltage = state.last_voltage
+
+        current_time = extended_ticks_us.time_tracker.ticks_us()
+        state.energy += int(state.last_current*(current_time - previous_time) / 36_000) #0.1uA * us / 36000 -> pAh
+        previous_time = current_time
+
+        if current_time >= next_log_time:
+            sd_control.store_record(current_time, sin_current, state.last_current, state.last_voltage, -min_freq, state.energy, state.loop_iteration)
+            next_log_time += log_interval
+            if next_log_time < current_time: next_log_time = current_time
+
+        if state.last_voltage < settings_obj.end_voltage:
+            low_voltage_counter += 1
+            if low_voltage_counter > state.max_low_voltage_count:
+                state.is_in_progress = 0
+                break
+        else: low_voltage_counter = 0
+
+        if sd_control.buffer_state.current_index >= sd_control.buffer_state.buffer_size:
+            sd_control.log_to_sd(state.filename)
+            print("DC buffer save occured during critical section!")
+            display.display_disharge_status()
+
+    io_control.set_current(0)
+    if sd_control.buffer_state.current_index:
+        print(f"SD saving {sd_control.buffer_state.current_index} records, avg {sd_control.buffer_state.current_index*1_000_000/time_us} SPS")
+        sd_control.log_to_sd(state.filename)
+
+    display.display_disharge_status()
+    state.freq = 0
+
+
 def discharge_program():
     #import sdcard.settings as settings     #get settings from internal memory
     import settings                         #get settings from SD card 
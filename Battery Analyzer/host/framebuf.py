@@ -0,0 +1,44 @@
+# Stand-in for the MicroPython framebuf module. Drawing is not rendered,
+# the display drivers only need the FrameBuffer interface.
+
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.format = format
+
+    def fill(self, c):
+        pass
+
+    def pixel(self, x, y, c=None):
+        return 0
+
+    def hline(self, x, y, w, c):
+        pass
+
+    def vline(self, x, y, h, c):
+        pass
+
+    def line(self, x1, y1, x2, y2, c):
+        pass
+
+    def rect(self, x, y, w, h, c, f=False):
+        pass
+
+    def fill_rect(self, x, y, w, h, c):
+        pass
+
+    def text(self, s, x, y, c=1):
+        pass
+
+    def scroll(self, xstep, ystep):
+        pass
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        pass
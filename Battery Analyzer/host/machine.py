@@ -0,0 +1,173 @@
+# Stand-in for the MicroPython machine module. The DAC (MCP4725 on I2C)
+# and the ADC (ADS1256 on SPI bus 1) are wired to a simulated cell, so
+# discharge_control runs on Linux and writes a realistic log.
+import math
+import random
+import utime
+
+RESISTANCE = 7.8  # Ohm, load shunt, as in io_control
+DAC_ADDRESSES = (0x60, 0x61)
+DISPLAY_ADDRESS = 0x3C
+ADS_SPI_BUS = 1
+
+ADS_CMD_RDATA = 0x01
+ADS_CMD_WREG = 0x50
+ADS_REG_MUX = 0x01
+ADS_VOLTAGE_LSB = 2.5 * 4076 / 0x7FFFFF  # mV per code, input channel
+ADS_CURRENT_LSB = 2.5 * 3968 / (0x7FFFFF * RESISTANCE)  # mA per code, feedback channel
+
+
+class Cell:
+    """
+    Rs + (Rp||Cp) cell with a linear open circuit voltage curve, driven
+    by the DAC current and advanced on the emulated clock.
+    """
+    def __init__(self, R_s=0.05, R_p=0.03, C_p=20.0, capacity=3000.0, full_voltage=4.2, empty_voltage=3.0,
+                 voltage_noise=0.02, current_noise=0.05):
+        self.R_s = R_s
+        self.R_p = R_p
+        self.C_p = C_p
+        self.capacity = capacity  # mAh
+        self.full_voltage = full_voltage
+        self.empty_voltage = empty_voltage
+        self.voltage_noise = voltage_noise  # mV
+        self.current_noise = current_noise  # mA
+        self.current = 0.0  # mA
+        self.v_rc = 0.0  # V
+        self.energy = 0.0  # mAh
+        self.last_ticks = utime.ticks_us()
+
+    def set_dac(self, code):
+        self.update()
+        self.current = code * 3300 / 4095 / RESISTANCE
+
+    def update(self):
+        now = utime.ticks_us()
+        dt = utime.ticks_diff(now, self.last_ticks) / 1_000_000
+        self.last_ticks = now
+        if dt <= 0:
+            return
+        steady = self.R_p * self.current * 1e-3
+        self.v_rc = steady + (self.v_rc - steady) * math.exp(-dt / (self.R_p * self.C_p))
+        self.energy += self.current * dt / 3600
+
+    def voltage(self):
+        self.update()
+        ocv = self.full_voltage - (self.full_voltage - self.empty_voltage) * self.energy / self.capacity
+        return (ocv - self.R_s * self.current * 1e-3 - self.v_rc) * 1000 + random.gauss(0, self.voltage_noise)
+
+    def measured_current(self):
+        return self.current + random.gauss(0, self.current_noise)
+
+
+cell = Cell()
+
+
+def freq(value=None):
+    return 240_000_000
+
+
+def sleep(ms):
+    utime.sleep_ms(ms)
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = 0 if value is None else value
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if value is not None:
+            self._value = value
+
+    def value(self, value=None):
+        # DRDY of the ADS1256 reads 0, a conversion is always ready
+        if value is None:
+            return self._value
+        self._value = value
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400000):
+        self.id = id
+
+    def scan(self):
+        return [DISPLAY_ADDRESS, DAC_ADDRESSES[0]]
+
+    def writeto(self, addr, buf, stop=True):
+        if addr in DAC_ADDRESSES and len(buf) == 2:
+            # MCP4725 fast mode write, 12 bit code
+            cell.set_dac(((buf[0] & 0x0F) << 8) | buf[1])
+        return len(buf)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        for i in range(len(buf)):
+            buf[i] = 0
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return bytes(nbytes)
+
+
+class SPI:
+    def __init__(self, id, baudrate=1_000_000, polarity=0, phase=0, sck=None, mosi=None, miso=None):
+        self.id = id
+        self.channel = 1
+        self.last_command = None
+
+    def init(self, baudrate=1_000_000, polarity=0, phase=0):
+        pass
+
+    def write(self, buf):
+        if self.id == ADS_SPI_BUS and len(buf):
+            self.last_command = buf[0]
+            if buf[0] == ADS_CMD_WREG | ADS_REG_MUX and len(buf) == 3:
+                self.channel = buf[2] >> 4
+
+    def read(self, nbytes, write=0x00):
+        if self.id == ADS_SPI_BUS and self.last_command == ADS_CMD_RDATA and nbytes == 3:
+            self.last_command = None
+            return self._conversion()
+        # Nothing answers on the SD card bus
+        return bytes([0xFF] * nbytes) if self.id != ADS_SPI_BUS else bytes(nbytes)
+
+    def readinto(self, buf, write=0x00):
+        data = self.read(len(buf), write)
+        buf[:] = data
+
+    def write_readinto(self, write_buf, read_buf):
+        self.write(write_buf)
+        self.readinto(read_buf)
+
+    def _conversion(self):
+        if self.channel == 1:
+            code = int(cell.voltage() / ADS_VOLTAGE_LSB)
+        else:
+            code = int(cell.measured_current() / ADS_CURRENT_LSB)
+        code = max(-0x800000, min(0x7FFFFF, code)) & 0xFFFFFF
+        return bytes([(code >> 16) & 0xFF, (code >> 8) & 0xFF, code & 0xFF])
+
+
+class ADC:
+    def __init__(self, pin, atten=None):
+        self.pin = pin
+
+    def read(self):
+        return 0
+
+    def read_u16(self):
+        return 0
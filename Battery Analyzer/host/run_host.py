@@ -0,0 +1,70 @@
+"""
+Run discharge_control.discharge_program on Linux.
+
+The stand-in machine, framebuf, micropython and utime modules in this
+directory replace the MicroPython ones, with a simulated cell behind the
+DAC and ADC. Logs are written to --sd instead of the SD card.
+
+    python host/run_host.py --sd /tmp/sd --speed 100 --repetitions 1
+"""
+import argparse
+import gc
+import importlib.util
+import os
+import sys
+import time
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+FIRMWARE = os.path.dirname(HOST)
+
+
+def install(speed):
+    sys.path.insert(0, FIRMWARE)
+    sys.path.insert(0, HOST)
+    import utime
+    utime.SPEED = speed
+
+    # The firmware imports time and gc, patch in the MicroPython extras
+    for name in ("ticks_us", "ticks_ms", "ticks_diff", "ticks_add", "sleep", "sleep_ms", "sleep_us"):
+        setattr(time, name, getattr(utime, name))
+    gc.mem_free = lambda: 0
+    gc.mem_alloc = lambda: 0
+
+
+def load_settings(path, repetitions):
+    spec = importlib.util.spec_from_file_location("settings", path)
+    settings = importlib.util.module_from_spec(spec)
+    sys.modules["settings"] = settings
+    spec.loader.exec_module(settings)
+    if repetitions is not None:
+        settings.Settings.repetitions = repetitions
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the discharge program against a simulated cell.")
+    parser.add_argument("--sd", default="sd", help="directory standing in for the SD card")
+    parser.add_argument("--settings", default=os.path.join(FIRMWARE, "sdcard", "settings.py"))
+    parser.add_argument("--repetitions", type=int, default=None)
+    parser.add_argument("--speed", type=float, default=1.0, help="emulated seconds per real second")
+    parser.add_argument("--R-s", type=float, default=0.05)
+    parser.add_argument("--R-p", type=float, default=0.03)
+    parser.add_argument("--C-p", type=float, default=20.0)
+    args = parser.parse_args()
+
+    install(args.speed)
+    import machine
+    machine.cell.R_s, machine.cell.R_p, machine.cell.C_p = args.R_s, args.R_p, args.C_p
+
+    import sd_control
+    os.makedirs(args.sd, exist_ok=True)
+    sd_control.SD_ROOT = os.path.join(args.sd, "")
+
+    import discharge_control
+    load_settings(args.settings, args.repetitions)
+    discharge_control.discharge_program()
+    print(f"Log written to {os.path.join(args.sd, discharge_control.state.filename)}")
+
+
+if __name__ == "__main__":
+    main()
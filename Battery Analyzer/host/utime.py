@@ -0,0 +1,46 @@
+# MicroPython time functions on top of the host clock, for running the
+# firmware on Linux. SPEED > 1 makes the emulated clock run faster than
+# real time, so an hour long program can be tried in a minute.
+# Bound here, run_host.py replaces the attributes of the time module
+from time import perf_counter as _perf_counter, sleep as _sleep, time as _wall_time
+
+SPEED = 1.0
+TICKS_PERIOD = 2**30
+
+_start = _perf_counter()
+
+
+def _elapsed_us():
+    return (_perf_counter() - _start) * 1_000_000 * SPEED
+
+
+def ticks_us():
+    return int(_elapsed_us()) % TICKS_PERIOD
+
+
+def ticks_ms():
+    return int(_elapsed_us() / 1000) % TICKS_PERIOD
+
+
+def ticks_diff(end, start):
+    return ((end - start + TICKS_PERIOD // 2) % TICKS_PERIOD) - TICKS_PERIOD // 2
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % TICKS_PERIOD
+
+
+def sleep(seconds):
+    _sleep(seconds / SPEED)
+
+
+def sleep_ms(ms):
+    _sleep(ms / 1000 / SPEED)
+
+
+def sleep_us(us):
+    _sleep(us / 1_000_000 / SPEED)
+
+
+def time():
+    return _wall_time()
@@ -10,6 +10,8 @@ import sys
 spi = SPI(2, baudrate=5_000_000, polarity=0, phase=0, sck=Pin(47), mosi=Pin(18), miso=Pin(21))
 sd_cs = Pin(38, Pin.OUT, value = 0)
 
+SD_ROOT = "/sd/" # mount point of the card, host/run_host.py points it to a directory
+
 class BufferState:
     def __init__(self):
         self.buffer_size = 8000 # Ustawienie rozmiaru bufora
@@ -79,7 +81,7 @@ def initialize_sd_card():
 
 def log_to_sd(filename):
     try:
-        with open("/sd/" + filename, "a") as f:
+        with open(SD_ROOT + filename, "a") as f:
             for i in range(buffer_state.current_index):
                 offset = i * 34
                 time_us, current, last_current, last_voltage, freq, energy, loop = \
@@ -104,7 +106,7 @@ def log_to_sd(filename):
 
 def get_new_filename():
     try:
-        existing_files = os.listdir("/sd/")
+        existing_files = os.listdir(SD_ROOT)
         print(f"SD Found SD card filesystem")
         index = 1
         while True:
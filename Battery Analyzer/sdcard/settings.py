@@ -10,10 +10,13 @@ class Settings:
 
     #discharge(Current [mA], Time[us], Log_downsample)
     #eis(Max Current [mA], Min Freq [Hz], Max Freq [Hz], No of points)
+    #eis_multisine(Max Current [mA], Min Freq [Hz], Max Freq [Hz], No of frequencies, Periods)
     def Program(self):
         
         discharge(self, 0, 60_000_000, 100)
 
         eis(self, 200, 0.05, 50, 40)
+        #from discharge_control import eis_multisine
+        #eis_multisine(self, 200, 0.05, 50, 20, 2)    #whole spectrum in 3 periods of 0.05Hz
         
         discharge(self, 420, 900_000_000, 20)
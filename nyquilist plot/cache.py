@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+from loader import load_columns, selected_ranges, data_offset, stream_columns, USED_COLUMNS
+import profiling
+from segments import find_segments
+
+
+CACHE_VERSION = 1
+HASH_BLOCK = 1024 * 1024  # bytes hashed at the start and end of the log
+STREAM_ROWS = 1 << 20  # rows per chunk when streaming the sidecar
+# A selection reading more than this share of the log parses all of it,
+# so the sidecar gets written for the next run
+PARTIAL_PARSE_SHARE = 0.5
+
+
+def sidecar_path(filename):
+    return filename + ".cache"
+
+
+def source_signature(filename):
+    """
+    Size, mtime and a hash of the first and last block of the log.
+    Hashing the ends only keeps the check cheap on multi-GB files.
+    """
+    stat = os.stat(filename)
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        digest.update(f.read(HASH_BLOCK))
+        if stat.st_size > HASH_BLOCK:
+            f.seek(max(HASH_BLOCK, stat.st_size - HASH_BLOCK))
+            digest.update(f.read(HASH_BLOCK))
+    return {
+        "version": CACHE_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha1": digest.hexdigest(),
+    }
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_sidecar(filename, columns=USED_COLUMNS):
+    """
+    Memory-map cached columns and the segment index of a log.
+
+    Returns:
+        (dict, np.ndarray) or None if the sidecar is missing, stale
+        or does not hold all requested columns.
+    """
+    path = sidecar_path(filename)
+    meta = _read_meta(path)
+    if meta is None or meta.get("source") != source_signature(filename):
+        return None
+    if not set(columns) <= set(meta["columns"]):
+        return None
+
+    data = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode='r') for name in columns}
+    segments = np.load(os.path.join(path, "segments.npy"), mmap_mode='r')
+    return data, segments
+
+
+def _save_columns(path, data, segments):
+    os.makedirs(path, exist_ok=True)
+    for name, values in data.items():
+        np.save(os.path.join(path, name + ".npy"), np.asarray(values, dtype=np.float64))
+    np.save(os.path.join(path, "segments.npy"), segments)
+
+
+def _clear_columns(path):
+    # Stale columns go, other files stay: fit_memo's fits.json is keyed
+    # by the spectra themselves, so it holds for a rewritten log too
+    if not os.path.isdir(path):
+        return
+    for entry in os.listdir(path):
+        if entry.endswith(".npy") or entry == "meta.json":
+            os.remove(os.path.join(path, entry))
+
+
+def write_sidecar(filename, data, segments):
+    """
+    Write columns and segment index next to the log. meta.json is
+    written last, so an interrupted write is never mistaken for a
+    valid cache.
+    """
+    path = sidecar_path(filename)
+    signature = source_signature(filename)
+
+    meta = _read_meta(path)
+    if meta is not None and meta.get("source") == signature:
+        columns = sorted(set(meta["columns"]) | set(data))
+    else:
+        _clear_columns(path)
+        columns = sorted(data)
+
+    meta_file = os.path.join(path, "meta.json")
+    if os.path.exists(meta_file):
+        os.remove(meta_file)
+
+    _save_columns(path, data, segments)
+
+    with open(meta_file, "w") as f:
+        json.dump({"source": signature, "columns": columns}, f)
+
+
+def write_shared(directory, data, segments):
+    """
+    Save parsed columns and the segment index for pool workers to map
+    with load_shared, e.g. the rows of a partial parse, which get no
+    sidecar. The directory belongs to the caller, no meta is written.
+    """
+    _save_columns(directory, data, segments)
+
+
+def load_shared(directory, columns=USED_COLUMNS):
+    data = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode='r') for name in columns}
+    return data, np.load(os.path.join(directory, "segments.npy"), mmap_mode='r')
+
+
+def _partial_parse(filename, selection):
+    # Whether parsing only the selected iterations beats a full parse
+    if selection is None or not selection.iterations:
+        return selection is not None and selection.freq is not None
+    start, stop = data_offset(filename), os.path.getsize(filename)
+    selected = sum(b - a for a, b in selected_ranges(filename, selection))
+    return selected < PARTIAL_PARSE_SHARE * max(stop - start, 1)
+
+
+def load_cached(filename, columns=USED_COLUMNS, workers=None, selection=None):
+    """
+    Load log columns through the sidecar cache. The first call parses
+    the text log and writes the sidecar, later calls map it with no copy.
+
+    A selection (loader.Selection) only matters while there is no
+    sidecar: a small one parses just its rows and writes no sidecar,
+    so a look at one or two iterations of a large log skips the full
+    parse. With a sidecar all rows are mapped, as mapping costs nothing
+    per row; callers select iterations through the segment index.
+
+    Returns:
+        (dict, np.ndarray): Column name → array, and the segment index.
+    """
+    with profiling.stage("load: sidecar map"):
+        cached = load_sidecar(filename, columns)
+    if cached is not None:
+        return cached
+
+    if _partial_parse(filename, selection):
+        with profiling.stage("load: partial parse"):
+            data = load_columns(filename, tuple(columns) + tuple(
+                name for name in ("freq", "iteration") if name not in columns), workers=workers, selection=selection)
+        profiling.count("rows parsed", len(data["iteration"]))
+        with profiling.stage("segmenting"):
+            segments = find_segments(data["iteration"], data["freq"])
+        return {name: data[name] for name in columns}, segments
+
+    with profiling.stage("load: text parse"):
+        data = load_columns(filename, columns, workers=workers)
+        if "iteration" in data and "freq" in data:
+            iteration, freq = data["iteration"], data["freq"]
+        else:
+            index = load_columns(filename, ("freq", "iteration"), workers=workers)
+            iteration, freq = index["iteration"], index["freq"]
+    profiling.count("rows parsed", len(iteration))
+    with profiling.stage("segmenting"):
+        segments = find_segments(iteration, freq)
+
+    try:
+        with profiling.stage("load: sidecar write"):
+            write_sidecar(filename, data, segments)
+    except OSError as e:
+        print(f"Cache not written for {filename}: {e}", file=sys.stderr)
+        return data, segments
+
+    return load_sidecar(filename, columns) or (data, segments)
+
+
+def stream_cached(filename, columns=USED_COLUMNS, rows=STREAM_ROWS):
+    """
+    Columns of a log in chunks of rows, from the sidecar when it is
+    valid and otherwise parsed from the text without writing one, so
+    memory stays bounded by a chunk whatever the log's length.
+
+    Yields:
+        dict: Column name → array of the chunk's rows.
+    """
+    cached = load_sidecar(filename, columns)
+    if cached is None:
+        yield from stream_columns(filename, columns)
+        return
+    data, _ = cached
+    n = len(data[columns[0]])
+    for start in range(0, n, rows):
+        yield {name: np.asarray(data[name][start:start + rows]) for name in columns}
@@ -0,0 +1,231 @@
+import re
+from functools import lru_cache
+import numpy as np
+
+
+# Element type → parameter suffixes, initial guesses, lower and upper bounds
+ELEMENTS = {
+    "R": (("",), (0.1,), (1e-6,), (np.inf,)),           # resistor [Ohm]
+    "C": (("",), (1e-6,), (1e-9,), (np.inf,)),          # capacitor [F]
+    "L": (("",), (1e-6,), (1e-12,), (np.inf,)),         # inductor [H]
+    "W": (("",), (0.1,), (1e-6,), (np.inf,)),           # semi-infinite Warburg [Ohm s^-1/2]
+    "CPE": (("_Q", "_alpha"), (1e-6, 0.8), (1e-9, 0.0), (np.inf, 1.0)),  # constant phase element
+}
+
+TOKEN = re.compile(r"\s*(?:(CPE\d+|[RCLW]\d+)|(p\()|([-,)]))")
+
+
+class Element:
+    def __init__(self, kind, index):
+        self.kind = kind
+        self.index = index  # position of the first parameter
+
+    def value(self, omega, params):
+        return self.gradient(omega, params)[0]
+
+    def gradient(self, omega, params):
+        """
+        Returns:
+            (np.ndarray, dict): Impedance, and parameter index → dZ/dp.
+        """
+        p = params[..., self.index, None]
+        i = self.index
+        if self.kind == "R":
+            Z = p * np.ones_like(omega)
+            return Z, {i: np.ones_like(Z)}
+        if self.kind == "C":
+            Z = 1 / (1j * omega * p)
+            return Z, {i: -Z / p}
+        if self.kind == "L":
+            Z = 1j * omega * p
+            return Z, {i: 1j * omega * np.ones_like(p)}
+        if self.kind == "W":
+            shape = (1 - 1j) / np.sqrt(omega)
+            return p * shape, {i: shape * np.ones_like(p)}
+        # CPE: 1 / (Q (jω)^α)
+        alpha = params[..., i + 1, None]
+        log_jomega = np.log(omega) + 0.5j * np.pi
+        Z = np.exp(-alpha * log_jomega) / p
+        return Z, {i: -Z / p, i + 1: -log_jomega * Z}
+
+
+class Series:
+    def __init__(self, parts):
+        self.parts = parts
+
+    def value(self, omega, params):
+        return sum(part.value(omega, params) for part in self.parts)
+
+    def gradient(self, omega, params):
+        Z = 0
+        derivatives = {}
+        for part in self.parts:
+            Z_part, d_part = part.gradient(omega, params)
+            Z = Z + Z_part
+            derivatives.update(d_part)
+        return Z, derivatives
+
+
+class Parallel:
+    def __init__(self, parts):
+        self.parts = parts
+
+    def value(self, omega, params):
+        return 1 / sum(1 / part.value(omega, params) for part in self.parts)
+
+    def gradient(self, omega, params):
+        gradients = [part.gradient(omega, params) for part in self.parts]
+        Z = 1 / sum(1 / Z_part for Z_part, _ in gradients)
+        # dZ/dp = Z² / Z_i² · dZ_i/dp for the branch i holding p
+        derivatives = {}
+        for Z_part, d_part in gradients:
+            scale = (Z / Z_part) ** 2
+            for index, d in d_part.items():
+                derivatives[index] = scale * d
+        return Z, derivatives
+
+
+class Circuit:
+    """
+    Equivalent circuit compiled from a description such as
+    "R0-p(R1,C1)-W1" or "R0-p(R1,CPE1)": "-" joins elements in series,
+    p(a,b,...) in parallel. Elements are R, C, L, W (Warburg) and CPE,
+    each followed by a number that makes its name unique.
+
+    The impedance and the Jacobian are evaluated with NumPy over any
+    batch of parameter sets at once: params has shape (..., parameters)
+    and broadcasts against freq as params[..., k, None].
+
+    Parameters with a positive lower bound are fitted in log space,
+    the others (e.g. a series resistance allowed to reach 0) linearly.
+    """
+    def __init__(self, description, root, parameters, initial_guess, lower_bounds, upper_bounds):
+        self.description = description
+        self.root = root
+        self.parameters = tuple(parameters)
+        self.initial_guess = np.array(initial_guess, dtype=float)
+        self.lower_bounds = np.array(lower_bounds, dtype=float)
+        self.upper_bounds = np.array(upper_bounds, dtype=float)
+        self.log_scaled = self.lower_bounds > 0
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def with_bounds(self, initial_guess=None, lower_bounds=None, upper_bounds=None, parameters=None):
+        """
+        Same circuit with other starting values, bounds or parameter
+        names.
+        """
+        return Circuit(
+            self.description, self.root, self.parameters if parameters is None else parameters,
+            self.initial_guess if initial_guess is None else initial_guess,
+            self.lower_bounds if lower_bounds is None else lower_bounds,
+            self.upper_bounds if upper_bounds is None else upper_bounds)
+
+    def impedance(self, freq, params):
+        omega = 2 * np.pi * np.asarray(freq, dtype=float)
+        return self.root.value(omega, np.asarray(params, dtype=float))
+
+    __call__ = impedance
+
+    def jacobian(self, freq, params):
+        """
+        Derivatives of the impedance with respect to each parameter,
+        stacked on the last axis: (..., frequencies, parameters).
+        """
+        omega = 2 * np.pi * np.asarray(freq, dtype=float)
+        Z, derivatives = self.root.gradient(omega, np.asarray(params, dtype=float))
+        return np.stack([np.broadcast_to(derivatives[k], Z.shape) for k in range(len(self))], axis=-1)
+
+    def fit_jacobian(self, freq, params):
+        # Chain rule for the log-scaled parameters, d/dlog(p) = p d/dp
+        scale = np.where(self.log_scaled, params, 1.0)
+        return self.jacobian(freq, params) * scale[..., None, :]
+
+    def to_fit_space(self, params):
+        params = np.asarray(params, dtype=float)
+        return np.where(self.log_scaled, np.log(np.maximum(params, 1e-300)), params)
+
+    def from_fit_space(self, theta):
+        return np.where(self.log_scaled, np.exp(np.where(self.log_scaled, theta, 0)), theta)
+
+    def fit_bounds(self):
+        with np.errstate(divide='ignore'):
+            return self.to_fit_space(self.lower_bounds), np.where(
+                self.log_scaled, np.log(self.upper_bounds), self.upper_bounds)
+
+    def __repr__(self):
+        return f"Circuit({self.description!r})"
+
+
+def _tokens(description):
+    position = 0
+    while position < len(description.rstrip()):
+        match = TOKEN.match(description, position)
+        if match is None:
+            raise ValueError(f"Unexpected {description[position:].strip()[:10]!r} at {position} in {description!r}")
+        yield match.group(1) or match.group(2) or match.group(3), position
+        position = match.end()
+
+
+@lru_cache(maxsize=64)
+def compile_circuit(description):
+    """
+    Parse a circuit description once into a Circuit.
+
+    Raises:
+        ValueError: On a syntax error or a repeated element name.
+    """
+    tokens = list(_tokens(description)) + [(None, len(description))]
+    position = 0
+    names = []
+    initial_guess = []
+    lower_bounds = []
+    upper_bounds = []
+
+    def expect(token):
+        nonlocal position
+        found, at = tokens[position]
+        if found != token:
+            raise ValueError(f"Expected {token!r} at {at} in {description!r}, found {found!r}")
+        position += 1
+
+    def series():
+        parts = [term()]
+        while tokens[position][0] == "-":
+            expect("-")
+            parts.append(term())
+        return parts[0] if len(parts) == 1 else Series(parts)
+
+    def term():
+        nonlocal position
+        token, at = tokens[position]
+        if token == "p(":
+            position += 1
+            parts = [series()]
+            while tokens[position][0] == ",":
+                expect(",")
+                parts.append(series())
+            expect(")")
+            if len(parts) < 2:
+                raise ValueError(f"p(...) at {at} in {description!r} needs at least two branches")
+            return Parallel(parts)
+        if token is None or token in "-,)":
+            raise ValueError(f"Expected an element at {at} in {description!r}, found {token!r}")
+
+        position += 1
+        kind = token.rstrip("0123456789")
+        if any(name.startswith(token + "_") or name == token for name in names):
+            raise ValueError(f"Element {token} appears twice in {description!r}")
+        suffixes, guesses, lowers, uppers = ELEMENTS[kind]
+        element = Element(kind, len(names))
+        names.extend(token + suffix for suffix in suffixes)
+        initial_guess.extend(guesses)
+        lower_bounds.extend(lowers)
+        upper_bounds.extend(uppers)
+        return element
+
+    root = series()
+    if tokens[position][0] is not None:
+        raise ValueError(f"Unexpected {tokens[position][0]!r} at {tokens[position][1]} in {description!r}")
+    return Circuit(description, root, names, initial_guess, lower_bounds, upper_bounds)
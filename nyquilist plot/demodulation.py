@@ -0,0 +1,164 @@
+import numpy as np
+
+
+def period_window(time, f):
+    """
+    Number of leading samples covering a whole number of periods of f.
+    Returns 0 when the segment is shorter than one period.
+    """
+    periods = np.floor((time[-1] - time[0]) * f)
+    if periods < 1:
+        return 0
+    return int(np.searchsorted(time, time[0] + periods / f, side='right'))
+
+
+def integration_weights(time):
+    # Trapezoid weights, so jittery firmware timestamps need no resampling
+    weights = np.empty(len(time))
+    dt = np.diff(time)
+    weights[0] = dt[0] / 2
+    weights[-1] = dt[-1] / 2
+    weights[1:-1] = (dt[:-1] + dt[1:]) / 2
+    return weights
+
+
+def lockin_phasors(time, f, *signals):
+    """
+    Single-frequency DFT of each signal at exactly f, computed on the
+    raw non-uniform samples in O(n).
+
+    Parameters:
+        time (np.ndarray): Sample times [s], ascending.
+        f (float): Demodulation frequency [Hz].
+        *signals (np.ndarray): Signals sampled at `time`.
+
+    Returns:
+        np.ndarray: Complex amplitude of each signal at f.
+    """
+    n = period_window(time, f) or len(time)
+    t = time[:n] - time[0]
+
+    # Hann taper over whole periods, it suppresses the leakage of
+    # battery voltage drift into the excitation frequency
+    weights = integration_weights(t) * (1 - np.cos(2 * np.pi * t / t[-1]))
+    weights /= weights.sum()
+
+    carrier = weights * np.exp(-2j * np.pi * f * t)
+    x = np.vstack([signal[:n] for signal in signals])
+    x = x - (x @ weights)[:, None]
+    return 2 * (x @ carrier)
+
+
+def lockin_impedance(time, voltage, current, current_set, f):
+    """
+    Impedance at f from lock-in demodulation of voltage and current,
+    with the commanded sinusoid (I set) as phase reference.
+
+    Returns:
+        (complex, complex, complex): Z, and the voltage and current
+        phasors relative to I set, or None if the command carries no
+        excitation at f.
+    """
+    V, I, R = lockin_phasors(time, f, voltage, current, current_set)
+    if abs(R) == 0:
+        return None
+    reference = R / abs(R)
+    V = V / reference
+    I = I / reference
+    return V / I, V, I
+
+
+def sine_fit_phasors(time, f, *signals):
+    """
+    Least-squares fit of offset + drift + cos + sin at f to each signal,
+    directly on the raw non-uniform timestamps. All signals share one
+    design matrix and are solved together.
+
+    Returns:
+        np.ndarray: Complex amplitude of each signal at f, in the same
+        convention as lockin_phasors and the FFT bins.
+    """
+    return multisine_phasors(time, [f], *signals)[0]
+
+
+def multisine_phasors(time, freqs, *signals):
+    """
+    Joint least-squares fit of offset + drift + cos + sin at every
+    frequency in freqs, so the components of a multisine are separated
+    exactly instead of leaking into each other.
+
+    Returns:
+        np.ndarray: (frequencies, signals) complex amplitudes.
+    """
+    t = time - time[0]
+    omega_t = 2 * np.pi * np.outer(t, freqs)
+    drift = (t - t.mean()) / max(t[-1], 1e-12)
+    design = np.column_stack([np.cos(omega_t), np.sin(omega_t), np.ones_like(t), drift])
+
+    coefficients, *_ = np.linalg.lstsq(design, np.column_stack(signals), rcond=None)
+    # x = a cos(ωt) + b sin(ωt) has complex amplitude a - jb
+    count = len(freqs)
+    return coefficients[:count] - 1j * coefficients[count:2 * count]
+
+
+def multisine_components(time, current, f0, threshold=0.5, candidates=0.05, max_candidates=64):
+    """
+    Frequencies excited in a multisine segment with base frequency f0.
+
+    The firmware gives every component the same amplitude, so the
+    excited set is found in two steps: harmonics above `candidates`
+    times the strongest one in the spectrum of all logged periods are
+    candidates, then one least-squares fit of all candidates on the raw
+    timestamps keeps those above `threshold` times the strongest.
+    Resampling across logging gaps leaks into the spectrum, but not
+    into the fit, which sees the leaked harmonics at noise level. Only
+    harmonics below a third of the sample rate are considered,
+    eis_multisine logs at least that fast for its highest component.
+
+    Parameters:
+        current (np.ndarray): Preferably the commanded I set column,
+            which carries the excitation without noise, else the
+            measured current.
+
+    Returns:
+        np.ndarray: Excited frequencies [Hz], ascending.
+    """
+    # The segment loses a few rows at its ends, count periods it nearly covers
+    periods = int(np.floor((time[-1] - time[0]) * f0 + 0.01))
+    if periods < 1:
+        return np.empty(0)
+    n = np.searchsorted(time, time[0] + periods / f0, side='right')
+    uniform = np.linspace(time[0], time[0] + periods / f0, n, endpoint=False)
+    spectrum = np.abs(np.fft.rfft(np.interp(uniform, time, current)))
+
+    sample_rate = (len(time) - 1) / (time[-1] - time[0])
+    highest = min(int(sample_rate / 3 / f0), (len(spectrum) - 1) // periods)
+    harmonics = np.arange(1, highest + 1)
+    amplitude = spectrum[harmonics * periods]
+    if len(amplitude) == 0 or amplitude.max() == 0:
+        return np.empty(0)
+    found = np.flatnonzero(amplitude > candidates * amplitude.max())
+    found = np.sort(found[np.argsort(amplitude[found])[::-1][:max_candidates]])
+
+    fitted = np.abs(multisine_phasors(time, harmonics[found] * f0, current)[:, 0])
+    return harmonics[found][fitted > threshold * fitted.max()] * f0
+
+
+def multisine_impedance(time, voltage, current, f0, current_set=None):
+    """
+    Impedance at every excited component of a multisine segment, found
+    in current_set when given.
+
+    Returns:
+        (np.ndarray, np.ndarray): Frequencies and impedances.
+    """
+    freqs = multisine_components(time, current if current_set is None else current_set, f0)
+    if len(freqs) == 0:
+        return freqs, np.empty(0, dtype=complex)
+    V, I = multisine_phasors(time, freqs, voltage, current).T
+    return freqs, V / I
+
+
+def sine_fit_impedance(time, voltage, current, f):
+    V, I = sine_fit_phasors(time, f, voltage, current)
+    return V / I
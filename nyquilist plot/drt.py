@@ -0,0 +1,287 @@
+from functools import lru_cache
+import numpy as np
+
+
+# Time constants of the distribution per decade, and decades the grid
+# reaches beyond 1/(2πf) of the highest and lowest frequency
+TAU_PER_DECADE = 10
+TAU_MARGIN = 1.0
+# Regularization strengths swept for every spectrum, relative to the
+# mean diagonal of KᵀK so they do not depend on the grid or on units
+LAMBDAS = np.geomspace(1e-6, 1e-1, 11)
+MAX_PIVOTS = 100  # steps of the non-negative solver, a few are usual
+
+
+class DRTKernel:
+    """
+    Discretized distribution of relaxation times on one frequency grid:
+
+        Z(f) = R_inf + Σ_n γ_n Δlnτ / (1 + j2πfτ_n)
+
+    with γ piecewise constant on log-spaced τ. Real and imaginary parts
+    are stacked into one real system K x ≈ [Re Z, Im Z] with
+    x = [R_inf, γ_1, ..., γ_N]. K, KᵀK and the regularized systems of
+    each λ depend only on the grid, so they are built once and shared
+    by every spectrum measured on it.
+    """
+    def __init__(self, freqs, taus):
+        self.freqs = freqs
+        self.taus = taus
+        self.step = np.log(taus[1] / taus[0]) if len(taus) > 1 else 1.0
+
+        wt = 2 * np.pi * freqs[:, None] * taus[None, :]
+        denominator = 1 + wt ** 2
+        ones, zeros = np.ones((len(freqs), 1)), np.zeros((len(freqs), 1))
+        self.matrix = np.concatenate([
+            np.concatenate([ones, self.step / denominator], axis=1),
+            np.concatenate([zeros, -self.step * wt / denominator], axis=1)])
+        self.gram = self.matrix.T @ self.matrix
+        # R_inf is not penalized, only the distribution
+        self.penalty = np.diag(np.r_[0.0, np.ones(len(taus))])
+        self.scale = np.trace(self.gram) / len(self.gram)
+        self._systems = {}
+
+    def __len__(self):
+        return len(self.taus)
+
+    def systems(self, lambdas):
+        """
+        Regularized normal matrices KᵀK + λD of every λ with their
+        inverses and effective degrees of freedom
+        tr(K (KᵀK + λD)⁻¹ Kᵀ), cached per λ sweep.
+        """
+        key = tuple(np.asarray(lambdas, dtype=float).tolist())
+        systems = self._systems.get(key)
+        if systems is None:
+            regularized = self.gram + (np.asarray(key) * self.scale)[:, None, None] * self.penalty
+            inverse = np.linalg.inv(regularized)
+            dof = np.einsum('lij,ji->l', inverse, self.gram)
+            systems = self._systems[key] = (regularized, inverse, dof)
+        return systems
+
+    def impedance(self, x):
+        # Model impedance of (..., 1 + N) solutions on this grid
+        stacked = x @ self.matrix.T
+        m = len(self.freqs)
+        return stacked[..., :m] + 1j * stacked[..., m:]
+
+
+def tau_grid(freqs, per_decade=TAU_PER_DECADE, margin=TAU_MARGIN):
+    low = np.log10(1 / (2 * np.pi * np.max(freqs))) - margin
+    high = np.log10(1 / (2 * np.pi * np.min(freqs))) + margin
+    return np.logspace(low, high, int(np.ceil((high - low) * per_decade)) + 1)
+
+
+@lru_cache(maxsize=16)
+def _kernel(freq_bytes, per_decade, margin):
+    freqs = np.frombuffer(freq_bytes)
+    return DRTKernel(freqs, tau_grid(freqs, per_decade, margin))
+
+
+def drt_kernel(freqs, per_decade=TAU_PER_DECADE, margin=TAU_MARGIN):
+    """
+    DRTKernel of a frequency grid, built on the first call and reused
+    for every later spectrum on the same grid.
+    """
+    return _kernel(np.ascontiguousarray(freqs, dtype=float).tobytes(), per_decade, margin)
+
+
+def _nonnegative_solve(hessian, rhs, free, max_iter=MAX_PIVOTS):
+    """
+    Block principal pivoting (Kim & Park) for min ½xᵀHx - bᵀx, x ≥ 0,
+    over a batch of problems: each step solves the free variables of
+    every unfinished problem in one batched solve, then swaps the
+    variables that violate x ≥ 0 or the gradient ≥ 0 between the free
+    and the bound set, all of them while that reduces the violations
+    and only the last one otherwise, which terminates. Its loose
+    tolerances keep round-off from cycling the pivoting, so _refine
+    then finishes each problem at the exact optimum.
+
+    Parameters:
+        hessian (np.ndarray): (P, P) symmetric positive definite.
+        rhs (np.ndarray): (problems, P).
+        free (np.ndarray): (problems, P) starting guess of x > 0.
+    """
+    problems, size = rhs.shape
+    x = np.zeros((problems, size))
+    free = free.copy()
+    fewest = np.full(problems, size + 1)
+    exchanges = np.full(problems, 3)
+    identity = np.eye(size, dtype=bool)
+    # Round-off of the ill-conditioned small-λ systems must not count as
+    # a violation, or the pivoting cycles
+    tolerance = 1e-6 * np.max(np.abs(rhs), axis=1, initial=0.0)
+    todo = np.arange(problems)
+    for _ in range(max_iter):
+        b, F = rhs[todo], free[todo]
+        system = np.where(F[:, :, None] & F[:, None, :], hessian, identity)
+        solution = np.linalg.solve(system, np.where(F, b, 0)[..., None])[..., 0]
+        gradient = solution @ hessian - b
+        infeasible = np.where(F, solution < -1e-6 * np.max(np.abs(solution), axis=1, keepdims=True),
+                              gradient < -tolerance[todo, None])
+        x[todo] = np.maximum(solution, 0)
+
+        violations = infeasible.sum(axis=1)
+        improved = violations < fewest[todo]
+        fewest[todo[improved]] = violations[improved]
+        exchanges[todo[improved]] = 3
+        block = improved | (exchanges[todo] > 0)
+        exchanges[todo[~improved & block]] -= 1
+        # Backup rule: swap only the last violating variable
+        last = size - 1 - np.argmax(infeasible[:, ::-1], axis=1)
+        single = np.zeros_like(infeasible)
+        single[np.arange(len(todo)), last] = True
+        swap = np.where(block[:, None], infeasible, single & infeasible)
+        free[todo] = F ^ swap
+
+        todo = todo[violations > 0]
+        if len(todo) == 0:
+            break
+    return _refine(hessian, rhs, x, max_iter)
+
+
+def _refine(hessian, rhs, x, max_iter=MAX_PIVOTS):
+    """
+    Lawson-Hanson active set steps from feasible x ≥ 0 until the KKT
+    conditions hold to round-off: the passive variables (x > 0) solve
+    their subsystem exactly and no bound one has a descent direction.
+    A passive solution leaving x ≥ 0 is cut back to the boundary, which
+    drops a variable, else the bound variable of the steepest descent
+    is freed. Every step lowers the objective, so nothing cycles, and
+    from the pivoting result it usually takes only a few steps.
+    """
+    problems, size = rhs.shape
+    x = x.copy()
+    passive = x > 0
+    identity = np.eye(size, dtype=bool)
+    eps = np.finfo(float).eps
+    todo = np.arange(problems)
+    for _ in range(max_iter):
+        b, P, current = rhs[todo], passive[todo], x[todo]
+        system = np.where(P[:, :, None] & P[:, None, :], hessian, identity)
+        solution = np.where(P, np.linalg.solve(system, np.where(P, b, 0)[..., None])[..., 0], 0)
+
+        # Passive entries at or below zero: move to the boundary instead
+        leaving = P & (solution <= 0)
+        cut = leaving.any(axis=1)
+        ratio = np.full_like(current, np.inf)
+        np.divide(current, current - solution, out=ratio, where=leaving & (current > solution))
+        ratio[leaving & (current <= solution)] = 0
+        alpha = np.minimum(ratio.min(axis=1), 1.0)[:, None]
+        stepped = np.where(cut[:, None], current + alpha * (solution - current), solution)
+        blocking = cut[:, None] & (ratio <= alpha)
+        stepped = np.where(blocking | (stepped < 0), 0, stepped)
+        x[todo] = stepped
+        passive[todo] = P & (stepped > 0)
+
+        # Optimal passive solutions: free the most promising bound variable
+        descent = b - stepped @ hessian
+        noise = 64 * eps * (np.abs(stepped) @ np.abs(hessian) + np.abs(b))
+        candidate = np.where(~P & (descent > noise), descent, -np.inf)
+        entering = np.argmax(candidate, axis=1)
+        enters = ~cut & np.isfinite(candidate[np.arange(len(todo)), entering])
+        passive[todo[enters], entering[enters]] = True
+
+        todo = todo[cut | enters]
+        if len(todo) == 0:
+            break
+    return x
+
+
+def solve_drt(kernel, impedances, lambdas=LAMBDAS, max_iter=MAX_PIVOTS):
+    """
+    Non-negative Tikhonov solutions of many spectra on one grid for a
+    whole sweep of λ at once:
+
+        min ½‖K x - z‖² + ½ λ ‖γ‖²   subject to x ≥ 0
+
+    The unconstrained solutions come from the cached inverses. Their
+    positive entries start a block principal pivoting search over all
+    spectra and λ together, which usually ends within a few steps.
+
+    Parameters:
+        kernel (DRTKernel): Kernel of the spectra's frequency grid.
+        impedances (np.ndarray): (spectra, frequencies) complex [Ohm].
+        lambdas (np.ndarray): Relative regularization strengths.
+
+    Returns:
+        (np.ndarray, np.ndarray): (λ, spectra, 1 + N) solutions
+        [R_inf, γ...] and (λ, spectra) generalized cross-validation
+        scores, lower is better.
+    """
+    impedances = np.atleast_2d(impedances)
+    z = np.concatenate([impedances.real, impedances.imag], axis=1)
+    rhs = z @ kernel.matrix
+    regularized, inverse, dof = kernel.systems(lambdas)
+
+    # Strongest regularization first: its solution is nearly the
+    # unconstrained one, and each solution's support starts the next λ
+    x = np.empty((len(regularized), len(z), len(kernel) + 1))
+    free = rhs @ inverse[np.argmax(lambdas)] > 0
+    for l in np.argsort(lambdas)[::-1]:
+        x[l] = _nonnegative_solve(regularized[l], rhs, free, max_iter)
+        free = x[l] > 0
+
+    residual = x @ kernel.matrix.T - z
+    points = z.shape[1]
+    gcv = points * np.einsum('lsm,lsm->ls', residual, residual) / np.maximum(points - dof, 1)[:, None] ** 2
+    return x, gcv
+
+
+def drt_batch(frequencies, impedances, lambdas=LAMBDAS, per_decade=TAU_PER_DECADE, margin=TAU_MARGIN):
+    """
+    DRT of many spectra, e.g. every iteration of a log. Spectra are
+    grouped by frequency grid, normally a single one since every
+    iteration sweeps the same descending_log_list, and each group is
+    solved in one solve_drt call. λ is chosen per spectrum by
+    generalized cross-validation.
+
+    Returns:
+        list: One dict per spectrum with taus [s], gamma [Ohm per unit
+        of ln τ], R_inf and R_pol (the integral of gamma) [Ohm], the
+        chosen lambda and the rms residual [Ohm]; None where a spectrum
+        has fewer than 3 finite points.
+    """
+    results = [None] * len(frequencies)
+    groups = {}
+    for k, (f, Z) in enumerate(zip(frequencies, impedances)):
+        f, Z = np.asarray(f, dtype=float), np.asarray(Z)
+        finite = np.isfinite(f) & np.isfinite(Z) & (f > 0)
+        if finite.sum() >= 3:
+            groups.setdefault(f[finite].tobytes(), []).append((k, Z[finite]))
+
+    lambdas = np.asarray(lambdas, dtype=float)
+    for freq_bytes, members in groups.items():
+        kernel = _kernel(freq_bytes, per_decade, margin)
+        x, gcv = solve_drt(kernel, np.array([Z for _, Z in members]), lambdas)
+        best = np.argmin(gcv, axis=0)
+        for s, (k, Z) in enumerate(members):
+            solution = x[best[s], s]
+            rms = np.sqrt(np.mean(np.abs(kernel.impedance(solution) - Z) ** 2))
+            results[k] = {
+                "taus": kernel.taus,
+                "gamma": solution[1:],
+                "R_inf": float(solution[0]),
+                "R_pol": float(solution[1:].sum() * kernel.step),
+                "lambda": float(lambdas[best[s]]),
+                "rms": float(rms),
+            }
+    return results
+
+
+def drt_table(results, lambdas=LAMBDAS):
+    """
+    DRT of the spectra of analyze_files results as rows for
+    output.write_table, one per iteration and time constant.
+    """
+    distributions = drt_batch([r["freqs"] for r in results], [r["Z"] for r in results], lambdas)
+    rows = []
+    for result, distribution in zip(results, distributions):
+        if distribution is None:
+            continue
+        head = {"file": result["file"], "iteration": int(result["iteration"]), "energy": float(result["energy"]),
+                "lambda": distribution["lambda"], "R_inf": distribution["R_inf"], "R_pol": distribution["R_pol"],
+                "rms": distribution["rms"]}
+        for tau, gamma in zip(distribution["taus"], distribution["gamma"]):
+            rows.append(dict(head, tau=float(tau), gamma=float(gamma)))
+    return rows
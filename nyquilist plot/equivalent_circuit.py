@@ -1,43 +1,281 @@
 import numpy as np
-from scipy.optimize import least_squares
+from circuits import compile_circuit
 
-def equivalent_circuit_fit(frequency, impedance):
+
+INITIAL_GUESS = np.array([0.1, 0.1, 1e-6])
+LOWER_BOUNDS = np.array([0, 1e-2, 1e-6])
+UPPER_BOUNDS = np.array([np.inf, np.inf, np.inf])
+MAX_STEP = 2.0  # largest LM step, a factor of e² per iteration for R_p and C_p
+# A warm-started fit seeds the next spectrum only when it converged
+# inside the bounds and its rms misfit relative to |Z| is below this
+MAX_SEED_RESIDUAL = 0.1
+# Spectra per batch of a warm-started fit_spectra
+WARM_BLOCK = 32
+
+
+def circuit_model(freq, R_s, R_p, C_p):
+    omega = 2 * np.pi * freq
+    Z_parallel = 1 / (1/R_p + 1j * omega * C_p)
+    return R_s + Z_parallel
+
+
+# Rs + (Rp||Cp), with R_s free to reach 0 and so fitted linearly, while
+# R_p and C_p six orders of magnitude apart are fitted in log space
+DEFAULT_CIRCUIT = compile_circuit("R0-p(R1,C1)").with_bounds(
+    INITIAL_GUESS, LOWER_BOUNDS, UPPER_BOUNDS, parameters=("R_s", "R_p", "C_p"))
+
+
+def get_circuit(description=None):
+    """
+    Circuit of a description (see circuits.compile_circuit),
+    DEFAULT_CIRCUIT with its R_s, R_p and C_p if None or the default's.
+
+    Raises:
+        ValueError: On an invalid description.
     """
-    Fit impedance data to Rs + 1 / (1/Rp + jωCp)
-    using least squares on complex values directly.
+    if description is None or description.replace(" ", "") == DEFAULT_CIRCUIT.description:
+        return DEFAULT_CIRCUIT
+    return compile_circuit(description)
+
+
+def _pad_spectra(frequencies, impedances):
+    # Spectra of different iterations may miss points, pad with zero weight
+    length = max((len(f) for f in frequencies), default=0)
+    freq = np.ones((len(frequencies), length))
+    Z_meas = np.zeros((len(frequencies), length), dtype=complex)
+    weight = np.zeros((len(frequencies), length))
+    for k, (f, Z) in enumerate(zip(frequencies, impedances)):
+        freq[k, :len(f)] = f
+        Z_meas[k, :len(f)] = Z
+        weight[k, :len(f)] = 1
+    return freq, Z_meas, weight
+
+
+def equivalent_circuit_fit_batch(frequencies, impedances, initial_guess=None, max_iter=200, tol=1e-12, circuit=None,
+                                 full_output=False):
+    """
+    Fit many spectra to an equivalent circuit at once, by default
+    Rs + 1 / (1/Rp + jωCp).
+
+    A vectorized Levenberg-Marquardt iteration runs with the analytic
+    Jacobian of the compiled circuit, with parameters of positive lower
+    bound in log space, since C_p is six orders of magnitude smaller
+    than the resistances. All spectra advance together, so hundreds of
+    spectra cost about as much as a few.
+
+    Parameters:
+        frequencies (list): Frequency array of each spectrum [Hz].
+        impedances (list): Complex impedance array of each spectrum [Ohm].
+        initial_guess (np.ndarray): (parameters,) or (spectra, parameters)
+            starting values, the circuit's own when None.
+        max_iter (int): Iteration limit.
+        tol (float): Relative cost decrease that counts as converged.
+        circuit (circuits.Circuit): Model to fit, DEFAULT_CIRCUIT if None.
+        full_output (bool): Also return which fits converged.
+
+    Returns:
+        np.ndarray: (spectra, parameters) array, e.g. R_s, R_p, C_p,
+        and with full_output a (spectra,) bool array, True where the
+        cost decrease fell below tol or the step could not improve it.
     """
-    def circuit_model(freq, R_s, R_p, C_p):
-        omega = 2 * np.pi * freq
-        Z_parallel = 1 / (1/R_p + 1j * omega * C_p)
-        return R_s + Z_parallel
+    circuit = circuit or DEFAULT_CIRCUIT
+    size = len(circuit)
+    freq, Z_meas, weight = _pad_spectra(frequencies, impedances)
+    count = len(freq)
+    if count == 0:
+        return (np.empty((0, size)), np.empty(0, dtype=bool)) if full_output else np.empty((0, size))
 
-    def residuals(params, freq, Z_meas):
-        R_s, R_p, C_p = params
-        Z_model = circuit_model(freq, R_s, R_p, C_p)
-        return np.concatenate([
-            (Z_model.real - Z_meas.real),
-            (Z_model.imag - Z_meas.imag)
-        ])
+    if initial_guess is None:
+        initial_guess = circuit.initial_guess
+    lower, upper = circuit.fit_bounds()
+    initial_guess = np.broadcast_to(initial_guess, (count, size))
+    theta = np.clip(circuit.to_fit_space(initial_guess), lower, upper)
 
-    freq = np.array(frequency)
-    Z_meas = np.array(impedance)
+    def evaluate(theta):
+        Z = circuit.impedance(freq, circuit.from_fit_space(theta)) - Z_meas
+        residual = np.concatenate([Z.real, Z.imag], axis=1) * np.tile(weight, 2)
+        return residual, np.einsum('ij,ij->i', residual, residual)
 
-    initial_guess = [0.1, 0.1, 1e-6]
-    bounds = ([0, 1e-2, 1e-6], [np.inf, np.inf, np.inf])
+    residual, cost = evaluate(theta)
+    damping = np.full(count, 1e-3)
+    active = np.ones(count, dtype=bool)
+    finished = np.zeros(count, dtype=bool)
 
-    result = least_squares(residuals, initial_guess, args=(freq, Z_meas), bounds=bounds)
+    for _ in range(max_iter):
+        if not active.any():
+            break
 
-    R_s, R_p, C_p = result.x
-    return R_s, R_p, C_p
+        J = circuit.fit_jacobian(freq, circuit.from_fit_space(theta)) * weight[..., None]
+        J = np.concatenate([J.real, J.imag], axis=1)
 
+        JTJ = np.einsum('kni,knj->kij', J, J)
+        gradient = np.einsum('kni,kn->ki', J, residual)
+        diagonal = np.diagonal(JTJ, axis1=1, axis2=2)
+        A = JTJ + (damping[:, None] * (diagonal + 1e-12))[:, :, None] * np.eye(size)
+        step = np.linalg.solve(A, -gradient[..., None])[..., 0]
+        step *= np.minimum(1, MAX_STEP / np.maximum(np.abs(step).max(axis=1), 1e-300))[:, None]
 
+        candidate = np.clip(theta + step, lower, upper)
+        new_residual, new_cost = evaluate(candidate)
 
+        improved = (new_cost < cost) & active
+        converged = improved & ((cost - new_cost) <= tol * np.maximum(cost, 1e-300))
+        stalled = ~improved & (damping > 1e12)
 
+        theta[improved] = candidate[improved]
+        residual[improved] = new_residual[improved]
+        cost[improved] = new_cost[improved]
+        damping = np.where(improved, damping / 3, damping * 4)
+        finished |= converged | stalled
+        active &= ~(converged | stalled)
 
+    if full_output:
+        return circuit.from_fit_space(theta), finished
+    return circuit.from_fit_space(theta)
 
 
+def fit_settings(max_iter=200, tol=1e-12, circuit=None):
+    # Everything besides the data and starting point that shapes a fit
+    circuit = circuit or DEFAULT_CIRCUIT
+    return {
+        "model": circuit.description,
+        "lower_bounds": circuit.lower_bounds.tolist(),
+        "upper_bounds": circuit.upper_bounds.tolist(),
+        "max_step": MAX_STEP,
+        "max_iter": max_iter,
+        "tol": tol,
+    }
 
 
+def relative_residual(freq, impedance, params, circuit=None):
+    # rms misfit of a fit relative to the rms |Z| of its spectrum
+    circuit = circuit or DEFAULT_CIRCUIT
+    impedance = np.asarray(impedance, dtype=complex)
+    misfit = circuit.impedance(np.asarray(freq, dtype=float)[None], np.asarray(params)[None])[0] - impedance
+    return np.sqrt(np.sum(np.abs(misfit) ** 2) / max(np.sum(np.abs(impedance) ** 2), 1e-300))
+
+
+def fit_usable(freq, impedance, params, converged, circuit=None):
+    """
+    Whether a fit can seed the next spectrum: it converged to finite
+    values off the bounds and its relative misfit is below
+    MAX_SEED_RESIDUAL.
+    """
+    circuit = circuit or DEFAULT_CIRCUIT
+    if not converged or len(freq) == 0 or not np.all(np.isfinite(params)):
+        return False
+    theta = circuit.to_fit_space(params)
+    lower, upper = circuit.fit_bounds()
+    if np.any(theta <= lower) or np.any(theta >= upper):
+        return False
+    return relative_residual(freq, impedance, params, circuit) <= MAX_SEED_RESIDUAL
+
+
+def warm_fit_batch(frequencies, impedances, seed, circuit=None):
+    """
+    Fit spectra from one seed, normally the last usable result before
+    them. A seed far from a spectrum, e.g. from an iteration glitched
+    into R_p → ∞, can leave its fit stuck where the gradient vanishes,
+    so unusable results are fitted again from the circuit's initial
+    guess, in one batch, and the lower misfit kept.
+
+    Returns:
+        (np.ndarray, np.ndarray): (spectra, parameters) array, and per
+        spectrum whether its fit is usable (fit_usable) as a seed.
+    """
+    circuit = circuit or DEFAULT_CIRCUIT
+    params, converged = equivalent_circuit_fit_batch(frequencies, impedances, seed, circuit=circuit,
+                                                     full_output=True)
+    usable = np.array([fit_usable(f, Z, p, c, circuit)
+                       for f, Z, p, c in zip(frequencies, impedances, params, converged)], dtype=bool)
+    retry = [k for k in np.flatnonzero(~usable) if len(frequencies[k])]
+    if not retry or np.array_equal(seed, circuit.initial_guess):
+        return params, usable
+
+    cold, cold_converged = equivalent_circuit_fit_batch(
+        [frequencies[k] for k in retry], [impedances[k] for k in retry], circuit=circuit, full_output=True)
+    for k, p, c in zip(retry, cold, cold_converged):
+        f, Z = frequencies[k], impedances[k]
+        if relative_residual(f, Z, p, circuit) < relative_residual(f, Z, params[k], circuit):
+            params[k] = p
+            usable[k] = fit_usable(f, Z, p, c, circuit)
+    return params, usable
+
+
+def fit_spectra(frequencies, impedances, warm_start=True, memo=None, circuit=None, seed_valid=None,
+                initial_guess=None, full_output=False):
+    """
+    Fit a sequence of spectra, usually consecutive iterations of one run.
+
+    Parameters:
+        frequencies (list), impedances (list): One array per spectrum.
+        warm_start (bool): Fit blocks of WARM_BLOCK spectra, each in one
+            batch started from the last result before the block instead
+            of INITIAL_GUESS. Neighbouring iterations have nearly the
+            same impedance, so this needs far fewer solver steps. See
+            warm_fit_batch for how a bad seed is recovered from.
+        memo (FitMemo): Optional store of earlier fits. Cached spectra
+            are not fitted again.
+        circuit (circuits.Circuit): Model to fit, DEFAULT_CIRCUIT if None.
+        seed_valid (list): Optional bool per spectrum, e.g. whether it
+            passed the Kramers-Kronig test. An invalid spectrum's fit
+            does not seed the next block.
+        initial_guess (np.ndarray): Seed of the first warm-started block,
+            e.g. from an earlier call on the iterations before, the
+            circuit's initial guess if None.
+        full_output (bool): Also return the seed of a next call.
+
+    Returns:
+        np.ndarray: (spectra, parameters) array, R_s, R_p, C_p by default,
+        and with full_output the seed of the spectra that would follow.
+    """
+    circuit = circuit or DEFAULT_CIRCUIT
+    settings = fit_settings(circuit=circuit)
+    params = np.empty((len(frequencies), len(circuit)))
+    seed = circuit.initial_guess if initial_guess is None else initial_guess
 
+    if not warm_start:
+        keys = [memo.key(f, Z, circuit.initial_guess, settings) if memo else None
+                for f, Z in zip(frequencies, impedances)]
+        missing = []
+        for k, key in enumerate(keys):
+            cached = memo.get(key) if memo else None
+            if cached is None:
+                missing.append(k)
+            else:
+                params[k] = cached
+        params[missing] = equivalent_circuit_fit_batch(
+            [frequencies[k] for k in missing], [impedances[k] for k in missing], circuit=circuit)
+        if memo:
+            for k in missing:
+                memo.put(keys[k], params[k])
+        return (params, seed) if full_output else params
 
+    for start in range(0, len(frequencies), WARM_BLOCK):
+        block = range(start, min(start + WARM_BLOCK, len(frequencies)))
+        keys = [memo.key(frequencies[k], impedances[k], seed, settings) if memo else None for k in block]
+        # Only usable fits are memoized, so a cached fit is a usable seed
+        usable = np.ones(len(block), dtype=bool)
+        missing = []
+        for j, key in enumerate(keys):
+            cached = memo.get(key) if memo else None
+            if cached is None:
+                missing.append(j)
+            else:
+                params[start + j] = cached
+        if missing:
+            fitted, usable[missing] = warm_fit_batch([frequencies[start + j] for j in missing],
+                                                     [impedances[start + j] for j in missing], seed, circuit)
+            for j, p, u in zip(missing, fitted, usable[missing]):
+                params[start + j] = p
+                if memo and u:
+                    memo.put(keys[j], p)
 
+        # The last spectrum with points seeds the next block
+        for j in reversed(range(len(block))):
+            k = start + j
+            if len(frequencies[k]):
+                good = usable[j] and (seed_valid is None or seed_valid[k])
+                seed = params[k] if good else circuit.initial_guess
+                break
+    return (params, seed) if full_output else params
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+from cache import sidecar_path
+
+
+def memo_path(filename):
+    # Fits live next to the column cache of the log they came from
+    return os.path.join(sidecar_path(filename), "fits.json")
+
+
+class FitMemo:
+    """
+    On-disk memo of circuit fits keyed by a hash of the spectrum, the
+    starting point and the fit settings.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.dirty = False
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def key(freqs, impedance, initial_guess, settings):
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(freqs, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(impedance, dtype=np.complex128).tobytes())
+        digest.update(np.ascontiguousarray(initial_guess, dtype=np.float64).tobytes())
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        params = self.entries.get(key)
+        return None if params is None else np.array(params)
+
+    def put(self, key, params):
+        self.entries[key] = [float(p) for p in params]
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self.entries, f)
+            os.replace(self.path + ".tmp", self.path)
+            self.dirty = False
+        except OSError as e:
+            print(f"Fit memo not written to {self.path}: {e}", file=sys.stderr)
@@ -0,0 +1,285 @@
+import os
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import profiling
+from pipeline import analyze_files, load_log, required_columns, _loaded_logs
+from selection import range_selector
+
+
+FLEET_PARAMETERS = ("Vo", "R_s", "R_p", "C_p")
+# Common frequencies the spectra of all cells are brought onto
+FLEET_FREQUENCIES = np.geomspace(0.05, 1.6, 16)
+PERCENTILES = (5, 25, 75, 95)
+
+
+def fleet_grid(axis="energy", step=None, stop=None):
+    """
+    Common grid of discharged energy [mAh] or state of charge [%].
+    """
+    if axis == "energy":
+        step = step or 100.0
+        stop = stop or 5000.0
+        return np.arange(0.0, stop + step / 2, step)
+    if axis == "soc":
+        step = step or 5.0
+        return np.arange(100.0, -step / 2, -step)
+    raise ValueError(f"Unknown grid axis {axis!r}, expected 'energy' or 'soc'")
+
+
+def _on_grid(x, values, grid):
+    # Linear interpolation without extrapolation beyond the cell's range
+    order = np.argsort(x)
+    x, values = x[order], values[order]
+    inside = (grid >= x[0]) & (grid <= x[-1])
+    result = np.full(len(grid), np.nan)
+    result[inside] = np.interp(grid[inside], x, values)
+    return result
+
+
+def _spectrum_on_grid(freqs, Z):
+    # Real and imaginary parts linear in log f, NaN outside the measured band
+    if len(freqs) < 2:
+        return np.full(len(FLEET_FREQUENCIES), np.nan + 0j)
+    log_f = np.log(freqs)
+    return (_on_grid(log_f, Z.real, np.log(FLEET_FREQUENCIES)) +
+            1j * _on_grid(log_f, Z.imag, np.log(FLEET_FREQUENCIES)))
+
+
+def cell_names(filenames):
+    """
+    Cell names from log paths relative to their common directory, since
+    every SD card numbers its logs from 000001.
+    """
+    paths = [os.path.abspath(f) for f in filenames]
+    if not paths:
+        return []
+    root = os.path.commonpath([os.path.dirname(p) for p in paths])
+    return [os.path.splitext(os.path.relpath(p, root))[0].replace(os.sep, "/") for p in paths]
+
+
+def summarize_cell(task):
+    """
+    Analyse one log and reduce it to its parameters and spectra on the
+    fleet grid. Runs in pool workers; only the reduced arrays return,
+    and the log is released before the next one is loaded.
+
+    Returns:
+        dict: cell, file, capacity [mAh], params (grid, parameters),
+        spectra (grid, FLEET_FREQUENCIES) and, with keep_results, the
+        per-iteration results; None if nothing was found.
+    """
+    filename, cell, grid, axis, iterations, method, memo, keep_results, warm_start, kk_exclude = task
+    try:
+        # The capacity needs the whole log, so it is parsed in full
+        results = analyze_files([filename], workers=1, select=range_selector(iterations), method=method,
+                                memo=memo, verbose=False, pushdown=False, warm_start=warm_start,
+                                kk_exclude=kk_exclude)
+        if not results:
+            return None
+        data, _ = load_log(filename, required_columns(method))
+        capacity = float(data["energy"][-1])
+    finally:
+        _loaded_logs.clear()
+
+    energy = np.array([r["energy"] for r in results], dtype=float)
+    x = energy if axis == "energy" else 100.0 * (1 - energy / max(capacity, 1e-12))
+
+    params = np.column_stack([_on_grid(x, np.array([r[name] for r in results], dtype=float), grid)
+                              for name in FLEET_PARAMETERS])
+
+    # Spectrum of the iteration nearest to each grid point inside the cell's range
+    spectra = np.full((len(grid), len(FLEET_FREQUENCIES)), np.nan + 0j)
+    inside = (grid >= x.min()) & (grid <= x.max())
+    nearest = np.abs(x[None, :] - grid[inside, None]).argmin(axis=1)
+    cell_spectra = [_spectrum_on_grid(r["freqs"], r["Z"]) for r in results]
+    spectra[inside] = [cell_spectra[k] for k in nearest]
+
+    return {
+        "cell": cell,
+        "file": filename,
+        "capacity": capacity,
+        "params": params,
+        "spectra": spectra,
+        "results": results if keep_results else None,
+    }
+
+
+def _profiled_cell(task):
+    # Pool worker entry when profiling: hand this cell's timings back
+    summary = summarize_cell(task)
+    return summary, profiling.take()
+
+
+def _merge_profiles(profiled):
+    for summary, profile in profiled:
+        profiling.merge(profile)
+        yield summary
+
+
+class FleetAggregate:
+    """
+    Accumulates cell summaries on a common grid.
+
+    Parameters of each cell take a few kB (grid × parameters), so exact
+    percentiles and outlier tests stay possible over hundreds of cells.
+    Spectra only update a running mean and variance per grid point and
+    frequency (Welford), so their memory does not grow with the fleet.
+    """
+    def __init__(self, grid, axis="energy"):
+        self.grid = grid
+        self.axis = axis
+        self.cells = []
+        self.capacities = []
+        self.params = []
+        shape = (len(grid), len(FLEET_FREQUENCIES))
+        self.spectrum_count = np.zeros(shape)
+        self.spectrum_mean = np.zeros(shape, dtype=complex)
+        self.spectrum_m2 = np.zeros(shape)
+
+    def add(self, summary):
+        self.cells.append(summary["cell"])
+        self.capacities.append(summary["capacity"])
+        self.params.append(summary["params"])
+
+        Z = summary["spectra"]
+        valid = ~np.isnan(Z)
+        self.spectrum_count += valid
+        delta = np.where(valid, Z - self.spectrum_mean, 0)
+        self.spectrum_mean += delta / np.maximum(self.spectrum_count, 1)
+        self.spectrum_m2 += np.where(valid, np.real(delta * np.conj(Z - self.spectrum_mean)), 0)
+
+    def spectrum_statistics(self):
+        """
+        Returns:
+            (np.ndarray, np.ndarray, np.ndarray): Cell count, mean
+            impedance and standard deviation of |Z - mean| per grid
+            point and FLEET_FREQUENCIES.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.spectrum_m2 / (self.spectrum_count - 1))
+        mean = np.where(self.spectrum_count > 0, self.spectrum_mean, np.nan)
+        return self.spectrum_count, mean, np.where(self.spectrum_count > 1, std, np.nan)
+
+    def spectrum_rows(self):
+        """
+        spectrum_statistics as rows for output.write_table, one per
+        grid point and frequency that any cell covers.
+        """
+        count, mean, std = self.spectrum_statistics()
+        rows = []
+        for g, x in enumerate(self.grid):
+            for k, f in enumerate(FLEET_FREQUENCIES):
+                if count[g, k] == 0:
+                    continue
+                rows.append({self.axis: float(x), "freq": float(f), "count": int(count[g, k]),
+                             "Z_real": float(mean[g, k].real), "Z_imag": float(mean[g, k].imag),
+                             "Z_std": float(std[g, k])})
+        return rows
+
+    def statistics(self, percentiles=PERCENTILES, fence=1.5):
+        """
+        Median, percentiles and Tukey outliers (outside Q1 - fence·IQR,
+        Q3 + fence·IQR) of every parameter at every grid point.
+
+        Returns:
+            list: One dict per grid point and parameter.
+        """
+        rows = []
+        if not self.params:
+            return rows
+        values = np.stack(self.params)  # (cells, grid, parameters)
+        count = np.sum(~np.isnan(values), axis=0)
+        with warnings.catch_warnings():
+            # All-NaN grid points, beyond every cell's range
+            warnings.simplefilter("ignore", RuntimeWarning)
+            median = np.nanmedian(values, axis=0)
+            q1, q3 = np.nanpercentile(values, [25, 75], axis=0)
+            levels = np.nanpercentile(values, percentiles, axis=0)
+            outlying = (values < q1 - fence * (q3 - q1)) | (values > q3 + fence * (q3 - q1))
+
+        for g, x in enumerate(self.grid):
+            for p, name in enumerate(FLEET_PARAMETERS):
+                if count[g, p] == 0:
+                    continue
+                row = {self.axis: float(x), "parameter": name, "count": int(count[g, p]),
+                       "median": float(median[g, p])}
+                for level, value in zip(percentiles, levels[:, g, p]):
+                    row[f"p{level:g}"] = float(value)
+                row["outliers"] = [self.cells[c] for c in np.flatnonzero(outlying[:, g, p])]
+                rows.append(row)
+        return rows
+
+    def outlier_cells(self, fence=1.5, fraction=0.25):
+        """
+        Cells whose parameters are outliers at more than `fraction` of
+        the grid points they cover, with that fraction per parameter.
+        """
+        if not self.params:
+            return {}
+        values = np.stack(self.params)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            q1, q3 = np.nanpercentile(values, [25, 75], axis=0)
+            outlying = (values < q1 - fence * (q3 - q1)) | (values > q3 + fence * (q3 - q1))
+        covered = np.maximum(np.sum(~np.isnan(values), axis=1), 1)
+        share = outlying.sum(axis=1) / covered  # (cells, parameters)
+
+        flagged = {}
+        for c, cell in enumerate(self.cells):
+            if np.any(share[c] > fraction):
+                flagged[cell] = {name: float(s) for name, s in zip(FLEET_PARAMETERS, share[c])}
+        return flagged
+
+
+def analyze_fleet(filenames, axis="energy", step=None, stop=None, iterations="", method="fft",
+                  workers=None, memo=True, on_cell=None, keep_results=False, verbose=True, warm_start=True,
+                  kk_exclude=False):
+    """
+    Stream many logs through the analysis onto one grid. Each worker
+    handles a whole log and returns only its grid summary, so memory
+    is bounded by one log per worker however many cells there are.
+
+    Parameters:
+        filenames (list): Logs, one per cell.
+        axis (str): "energy" (discharged mAh) or "soc" (% of the
+            capacity discharged in the log).
+        step (float), stop (float): Grid spacing and end, see fleet_grid.
+        iterations (str): Iteration range spec for every log.
+        warm_start (bool), kk_exclude (bool): See pipeline.fit_results.
+        on_cell (callable): Called with each cell summary as it arrives.
+        keep_results (bool): Pass the per-iteration results of a cell
+            to on_cell (e.g. for a ResultStore), dropped right after.
+
+    Returns:
+        FleetAggregate
+    """
+    grid = fleet_grid(axis, step, stop)
+    fleet = FleetAggregate(grid, axis)
+    tasks = [(filename, cell, grid, axis, iterations, method, memo, keep_results, warm_start, kk_exclude)
+             for filename, cell in zip(filenames, cell_names(filenames))]
+
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers <= 1:
+        summaries = map(summarize_cell, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, **profiling.pool_options())
+        if profiling.enabled():
+            summaries = _merge_profiles(executor.map(_profiled_cell, tasks))
+        else:
+            summaries = executor.map(summarize_cell, tasks)
+    try:
+        for filename, summary in zip(filenames, summaries):
+            if summary is None:
+                if verbose: print(f"{filename}: no EIS iterations found")
+                continue
+            with profiling.stage("fleet aggregate"):
+                fleet.add(summary)
+            if on_cell: on_cell(summary)
+            summary["results"] = None
+            if verbose: print(f"{filename}: {summary['capacity']:.0f} mAh")
+    finally:
+        if executor:
+            executor.shutdown()
+    return fleet
@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import numpy as np
+import profiling
+from loader import CHUNK_SIZE, HEADER_ROWS, SCALE, USED_COLUMNS, parse_block, read_range
+from segments import find_segments
+from equivalent_circuit import DEFAULT_CIRCUIT
+from pipeline import required_columns, fit_results, spectrum_result
+
+
+class LogFollower:
+    """
+    Incremental analysis of a log that is still being written.
+
+    Only the bytes appended since the last poll are parsed. Rows are
+    buffered for the current iteration alone. As soon as the EIS sweep
+    of an iteration is over (the first rest or discharge row after the
+    sweep, or the next iteration) its spectrum is extracted and fitted,
+    and the buffer is dropped, so memory stays bounded by one iteration.
+
+    warm_start, kk_exclude, bootstrap, confidence and circuit work as
+    in pipeline.analyze_files.
+    """
+    def __init__(self, filename, method="fft", select=None, verbose=True, warm_start=True, kk_exclude=False,
+                 bootstrap=0, confidence=0.95, circuit=None):
+        self.filename = filename
+        self.method = method
+        self.select = select
+        self.verbose = verbose
+        self.warm_start = warm_start
+        self.kk_exclude = kk_exclude
+        self.bootstrap = bootstrap
+        self.confidence = confidence
+        self.circuit = circuit or DEFAULT_CIRCUIT
+        # A multisine may start in any iteration, so I set is parsed
+        # throughout and dropped in _finish unless required_columns wants it
+        self.columns = USED_COLUMNS + ("current_set",)
+        self.offset = None
+        self.seeds = {}
+
+        self.iteration = None
+        self.buffer = []
+        self.seen_eis = False
+        self.done = False
+
+    def poll(self):
+        """
+        Parse newly appended complete lines.
+
+        Returns:
+            list: Results of iterations whose EIS sweep finished.
+        """
+        size = os.path.getsize(self.filename)
+        if self.offset is not None and size < self.offset:
+            print(f"{self.filename} shrank, following it from the start", file=sys.stderr)
+            self.offset = None
+            self.iteration = None
+            self.buffer = []
+        if self.offset is None:
+            self.offset = self._data_offset()
+            if self.offset is None:
+                return []
+
+        # Catch up chunk by chunk, so a long backlog is never held at once
+        results = []
+        while self.offset < size:
+            block = read_range(self.filename, self.offset, min(size, self.offset + CHUNK_SIZE))
+            end = block.rfind(b"\n") + 1
+            if end == 0:
+                break
+            self.offset += end
+            with profiling.stage("load: text parse"):
+                rows = parse_block(block[:end], self.columns)
+            results += self._feed(rows)
+        return results
+
+    def _data_offset(self):
+        # Wait until the header rows are complete
+        with open(self.filename, 'rb') as f:
+            for _ in range(HEADER_ROWS):
+                if not f.readline().endswith(b"\n"):
+                    return None
+            return f.tell()
+
+    def flush(self):
+        """
+        Analyse the buffered iteration, e.g. when the run was cut short
+        during its EIS sweep.
+        """
+        return self._finish()
+
+    def _feed(self, rows):
+        results = []
+        iteration = rows[:, self.columns.index("iteration")]
+        freq = rows[:, self.columns.index("freq")]
+
+        for run in np.split(np.arange(len(rows)), np.flatnonzero(np.diff(iteration)) + 1):
+            if len(run) == 0:
+                continue
+            it = iteration[run[0]]
+            if it != self.iteration:
+                results += self._finish()
+                self.iteration = it
+                self.buffer = []
+                self.seen_eis = False
+                self.done = self.select is not None and not self.select(it)
+            if self.done:
+                # Rest of an analysed or skipped iteration
+                continue
+
+            # Stepped sweeps log f > 0, multisine segments -f0
+            eis = freq[run] != 0
+            if self.seen_eis:
+                ends = np.flatnonzero(~eis)
+            else:
+                first = np.argmax(eis) if eis.any() else len(run)
+                self.seen_eis = eis.any()
+                ends = first + np.flatnonzero(~eis[first:])
+
+            if self.seen_eis and len(ends):
+                self.buffer.append(rows[run[:ends[0]]])
+                results += self._finish()
+                self.done = True
+            else:
+                self.buffer.append(rows[run])
+        return results
+
+    def _finish(self):
+        if self.done or not self.seen_eis or not self.buffer:
+            self.buffer = []
+            return []
+
+        rows = np.concatenate(self.buffer)
+        self.buffer = []
+        self.done = True
+        data = {name: rows[:, k] * SCALE[name] for k, name in enumerate(self.columns)}
+
+        with profiling.stage("segmenting"):
+            segments = find_segments(data["iteration"], data["freq"])
+        if "current_set" not in required_columns(self.method, segments):
+            del data["current_set"]
+        bootstrap = (self.bootstrap, self.confidence) if self.bootstrap else None
+        result = spectrum_result(self.filename, data, segments, self.iteration, self.method, bootstrap)
+        if len(result["freqs"]) == 0:
+            return []
+        # Fitted like a batch analysis, seeded from the iterations before
+        return fit_results([result], self.warm_start, memo=False, verbose=self.verbose, kk_exclude=self.kk_exclude,
+                           confidence=self.confidence, circuit=self.circuit, seeds=self.seeds)
+
+
+def follow(filename, on_results, method="fft", select=None, poll_interval=2.0, idle_timeout=None, verbose=True,
+           **options):
+    """
+    Follow a growing log until it has been idle for idle_timeout
+    seconds (forever if None) or until interrupted, passing each batch
+    of finished iterations to on_results. options are passed on to
+    LogFollower.
+    """
+    follower = LogFollower(filename, method, select, verbose, **options)
+    last_data = time.monotonic()
+    try:
+        while True:
+            offset = follower.offset
+            results = follower.poll()
+            if results:
+                on_results(results)
+            if follower.offset != offset:
+                last_data = time.monotonic()
+            elif idle_timeout is not None and time.monotonic() - last_data > idle_timeout:
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+    results = follower.flush()
+    if results:
+        on_results(results)
@@ -0,0 +1,188 @@
+import numpy as np
+from cache import stream_cached
+
+
+# Constant-current discharge samples: f == 0 rows above this current [A]
+CC_MIN_CURRENT = 0.05
+# Seconds skipped at the start of every discharge run, while the
+# voltage still recovers from the rest or EIS sweep before it
+SETTLE_TIME = 30.0
+
+VOLTAGE_STEP = 0.005  # V per dQ/dV bin
+VOLTAGE_RANGE = (2.5, 4.4)
+CHARGE_STEP = 10.0  # mAh per dV/dQ bin
+CHARGE_RANGE = (0.0, 6000.0)
+
+COLUMNS = ("time", "current", "voltage", "freq", "energy")
+
+
+def _bin(values, start, step, bins):
+    index = np.floor((values - start) / step).astype(np.int64)
+    inside = (index >= 0) & (index < bins)
+    return index, inside
+
+
+class IncrementalCapacity:
+    """
+    Streaming dQ/dV and dV/dQ of the constant-current discharges.
+
+    Charge and voltage increments between consecutive settled CC
+    samples are summed into bins on fixed voltage and charge grids
+    instead of differentiating sample by sample: noise only moves an
+    increment to a neighbouring bin, and the sums telescope. Each curve
+    is the ratio of the two sums in a bin, so the rows skipped while
+    the voltage settles after every rest and EIS sweep leave no dips.
+    Memory is the grids plus one chunk.
+
+    The voltage is the terminal voltage under load, so the dQ/dV
+    features sit I·R below their OCV positions.
+    """
+    def __init__(self, voltage_step=VOLTAGE_STEP, voltage_range=VOLTAGE_RANGE,
+                 charge_step=CHARGE_STEP, charge_range=CHARGE_RANGE,
+                 settle_time=SETTLE_TIME, min_current=CC_MIN_CURRENT):
+        self.voltage_step = voltage_step
+        self.voltage_start = voltage_range[0]
+        self.voltage_bins = int(round((voltage_range[1] - voltage_range[0]) / voltage_step))
+        self.charge_step = charge_step
+        self.charge_start = charge_range[0]
+        self.charge_bins = int(round((charge_range[1] - charge_range[0]) / charge_step))
+        self.settle_time = settle_time
+        self.min_current = min_current
+
+        self.charge_per_voltage = np.zeros(self.voltage_bins)  # ΣΔQ per voltage bin [mAh]
+        self.voltage_per_voltage = np.zeros(self.voltage_bins)  # ΣΔV per voltage bin [V]
+        self.voltage_per_charge = np.zeros(self.charge_bins)   # ΣΔV per charge bin [V]
+        self.charge_per_charge = np.zeros(self.charge_bins)    # ΣΔQ per charge bin [mAh]
+        self.samples = 0
+
+        # Last row of the previous chunk, whether it was CC and when its run began
+        self.previous = None
+        self.previous_cc = False
+        self.run_start = 0.0
+
+    def add(self, time, current, voltage, freq, energy):
+        """
+        Add the next chunk of a log, rows in logged order.
+        """
+        cc = (freq == 0) & (current > self.min_current)
+        continues = np.concatenate(([self.previous_cc], cc[:-1]))
+        starts = cc & ~continues
+
+        # Time each row's CC run began, carried over from the last chunk
+        positions = np.arange(len(time))
+        start_row = np.maximum.accumulate(np.where(starts, positions, -1))
+        run_start = np.where(start_row >= 0, time[np.maximum(start_row, 0)], self.run_start)
+        settled = cc & (time - run_start >= self.settle_time)
+
+        if self.previous is not None:
+            v0, q0, settled0 = self.previous
+            voltage_pairs = np.concatenate(([v0], voltage))
+            charge_pairs = np.concatenate(([q0], energy))
+            settled_pairs = np.concatenate(([settled0], settled))
+        else:
+            voltage_pairs, charge_pairs, settled_pairs = voltage, energy, settled
+        valid = settled_pairs[1:] & settled_pairs[:-1]
+        dV = np.diff(voltage_pairs)[valid]
+        dQ = np.diff(charge_pairs)[valid]
+        V = 0.5 * (voltage_pairs[1:] + voltage_pairs[:-1])[valid]
+        Q = 0.5 * (charge_pairs[1:] + charge_pairs[:-1])[valid]
+
+        index, inside = _bin(V, self.voltage_start, self.voltage_step, self.voltage_bins)
+        self.charge_per_voltage += np.bincount(index[inside], weights=dQ[inside], minlength=self.voltage_bins)
+        self.voltage_per_voltage += np.bincount(index[inside], weights=dV[inside], minlength=self.voltage_bins)
+        index, inside = _bin(Q, self.charge_start, self.charge_step, self.charge_bins)
+        self.voltage_per_charge += np.bincount(index[inside], weights=dV[inside], minlength=self.charge_bins)
+        self.charge_per_charge += np.bincount(index[inside], weights=dQ[inside], minlength=self.charge_bins)
+        self.samples += int(valid.sum())
+
+        if len(time):
+            self.previous = (voltage[-1], energy[-1], settled[-1])
+            self.previous_cc = bool(cc[-1])
+            self.run_start = float(run_start[-1])
+
+    def dqdv(self):
+        """
+        Returns:
+            (np.ndarray, np.ndarray): Voltage bin centres [V] and dQ/dV
+            [mAh/V], positive on discharge, NaN where the discharge
+            crossed less than a quarter of the bin.
+        """
+        centres = self.voltage_start + (np.arange(self.voltage_bins) + 0.5) * self.voltage_step
+        crossed = -self.voltage_per_voltage
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = np.where(crossed >= 0.25 * self.voltage_step, self.charge_per_voltage / crossed, np.nan)
+        return centres, slope
+
+    def dvdq(self):
+        """
+        Returns:
+            (np.ndarray, np.ndarray): Charge bin centres [mAh] and dV/dQ
+            [V/mAh], negative on discharge, NaN where no CC charge fell.
+        """
+        centres = self.charge_start + (np.arange(self.charge_bins) + 0.5) * self.charge_step
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = np.where(self.charge_per_charge > 0, self.voltage_per_charge / self.charge_per_charge, np.nan)
+        return centres, slope
+
+
+def find_curve_peaks(x, y, smooth=3, prominence=0.05):
+    """
+    Peaks of a binned curve after a moving average over `smooth` bins,
+    at least `prominence` of the curve's range, or of its median
+    magnitude if larger, above their surroundings, so the noise of a
+    featureless curve is not reported. Bins without data (NaN) split
+    the curve.
+
+    Returns:
+        list: (position, height, prominence) of each peak.
+    """
+    from scipy.signal import find_peaks
+
+    valid = np.isfinite(y)
+    if valid.sum() < 3:
+        return []
+    filled = np.where(valid, y, 0.0)
+    if smooth > 1:
+        kernel = np.ones(smooth)
+        counts = np.convolve(valid, kernel, mode='same')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            filled = np.where(valid, np.convolve(filled, kernel, mode='same') / counts, 0.0)
+    low, span = filled[valid].min(), np.ptp(filled[valid])
+    if span <= 0:
+        return []
+    scale = max(span, np.median(np.abs(filled[valid])))
+    peaks, properties = find_peaks(np.where(valid, filled, low), prominence=prominence * scale)
+    return [(float(x[p]), float(filled[p]), float(q)) for p, q in zip(peaks, properties["prominences"])]
+
+
+def analyze_incremental_capacity(filename, **options):
+    """
+    Stream a log through IncrementalCapacity.
+
+    Returns:
+        IncrementalCapacity
+    """
+    analysis = IncrementalCapacity(**options)
+    for chunk in stream_cached(filename, COLUMNS):
+        analysis.add(*(chunk[name] for name in COLUMNS))
+    return analysis
+
+
+def peak_rows(cell, analysis, prominence=0.05):
+    """
+    dQ/dV peaks (plateaus, by voltage) and |dV/dQ| peaks (transitions
+    between plateaus, by discharged charge) of one cell.
+
+    Returns:
+        list: Dicts with cell, curve, position, unit, height, prominence.
+    """
+    rows = []
+    voltage, dqdv = analysis.dqdv()
+    for position, height, peak_prominence in find_curve_peaks(voltage, dqdv, prominence=prominence):
+        rows.append({"cell": cell, "curve": "dQ/dV", "position": position, "unit": "V",
+                     "height": height, "prominence": peak_prominence})
+    charge, dvdq = analysis.dvdq()
+    for position, height, peak_prominence in find_curve_peaks(charge, -dvdq, prominence=prominence):
+        rows.append({"cell": cell, "curve": "dV/dQ", "position": position, "unit": "mAh",
+                     "height": -height, "prominence": peak_prominence})
+    return rows
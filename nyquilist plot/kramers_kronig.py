@@ -0,0 +1,83 @@
+from functools import lru_cache
+import numpy as np
+
+
+# RC elements of the lin-KK basis per decade of the measured band
+RC_PER_DECADE = 3
+# A point fails when its real or imaginary residual, relative to |Z|,
+# exceeds POINT_THRESHOLD. A spectrum fails when its rms residual
+# exceeds SPECTRUM_THRESHOLD or more than MAX_INVALID_SHARE of its
+# points fail.
+POINT_THRESHOLD = 0.01
+SPECTRUM_THRESHOLD = 0.005
+MAX_INVALID_SHARE = 0.2
+
+
+@lru_cache(maxsize=16)
+def _basis(freq_bytes, per_decade):
+    # Columns R_0, jωL and R_k / (1 + jωτ_k) on τ between 1/ω of the
+    # highest and lowest frequency, real and imaginary parts stacked
+    freqs = np.frombuffer(freq_bytes)
+    omega = 2 * np.pi * freqs
+    decades = np.log10(omega.max() / omega.min())
+    taus = np.logspace(-np.log10(omega.max()), -np.log10(omega.min()), max(int(np.ceil(decades * per_decade)), 1) + 1)
+    wt = omega[:, None] * taus[None, :]
+    ones, zeros = np.ones((len(freqs), 1)), np.zeros((len(freqs), 1))
+    return np.concatenate([
+        np.concatenate([ones, zeros, 1 / (1 + wt ** 2)], axis=1),
+        np.concatenate([zeros, omega[:, None], -wt / (1 + wt ** 2)], axis=1)])
+
+
+def kramers_kronig_batch(frequencies, impedances, per_decade=RC_PER_DECADE, point_threshold=POINT_THRESHOLD,
+                         spectrum_threshold=SPECTRUM_THRESHOLD, max_invalid_share=MAX_INVALID_SHARE):
+    """
+    Linear Kramers-Kronig test (Schönleber et al.) of many spectra.
+
+    Each spectrum is fitted with a series resistance, an inductance and
+    fixed-τ RC elements, a linear model that satisfies Kramers-Kronig
+    by construction, weighted by 1/|Z|. Drift or glitches during a
+    sweep leave residuals the model cannot absorb. The basis depends
+    only on the frequency grid, so it is built once per grid, and all
+    spectra on a grid are solved as one batched least-squares problem.
+
+    Returns:
+        list: One dict per spectrum: residual (complex, relative to
+        |Z|) and point_valid of each of its points, and rms and valid
+        of the whole spectrum; None for spectra with fewer points than
+        the basis has elements.
+    """
+    results = [None] * len(frequencies)
+    groups = {}
+    for k, (f, Z) in enumerate(zip(frequencies, impedances)):
+        f = np.asarray(f, dtype=float)
+        if len(f):
+            groups.setdefault(f.tobytes(), []).append(k)
+
+    for freq_bytes, members in groups.items():
+        basis = _basis(freq_bytes, per_decade)
+        if len(basis) // 2 <= basis.shape[1]:
+            continue
+        Z = np.array([np.asarray(impedances[k], dtype=complex) for k in members])
+        z = np.concatenate([Z.real, Z.imag], axis=1)
+        weight = np.tile(1 / np.maximum(np.abs(Z), 1e-300), 2)
+        finite = np.isfinite(z) & np.isfinite(weight)
+        weight = np.where(finite, weight, 0.0)
+        z = np.where(finite, z, 0.0)
+
+        # Weighted least squares of every spectrum at once
+        design = basis * weight[:, :, None]
+        coefficients = np.einsum('spm,sm->sp', np.linalg.pinv(design), z * weight)
+        relative = (z - coefficients @ basis.T) * weight
+        points = len(basis) // 2
+        residual = relative[:, :points] + 1j * relative[:, points:]
+
+        valid = np.maximum(np.abs(residual.real), np.abs(residual.imag)) <= point_threshold
+        counted = finite[:, :points] & finite[:, points:]
+        valid &= counted
+        rms = np.sqrt(np.sum(np.abs(residual) ** 2 * counted, axis=1) / np.maximum(counted.sum(axis=1), 1) / 2)
+        invalid_share = 1 - valid.sum(axis=1) / np.maximum(counted.sum(axis=1), 1)
+        spectrum_valid = (rms <= spectrum_threshold) & (invalid_share <= max_invalid_share)
+        for s, k in enumerate(members):
+            results[k] = {"residual": residual[s], "point_valid": valid[s], "rms": float(rms[s]),
+                          "valid": bool(spectrum_valid[s])}
+    return results
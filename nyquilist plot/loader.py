@@ -0,0 +1,244 @@
+import io
+import os
+from itertools import compress
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Column order written by sd_control.log_to_sd on the analyzer
+COLUMNS = ("time", "current_set", "current", "voltage", "freq", "energy", "iteration")
+
+# Columns used by every estimator, see pipeline.required_columns for I set
+USED_COLUMNS = ("time", "current", "voltage", "freq", "energy", "iteration")
+
+# Scale from logged units to SI: ms → s, mA → A, mV → V
+SCALE = {
+    "time": 1e-3,
+    "current_set": 1e-3,
+    "current": 1e-3,
+    "voltage": 1e-3,
+    "freq": 1.0,
+    "energy": 1.0,
+    "iteration": 1.0,
+}
+
+HEADER_ROWS = 2
+CHUNK_SIZE = 32 * 1024 * 1024  # bytes per parsing task
+SEARCH_BLOCK = 64 * 1024  # bytes scanned line by line at the end of a binary search
+
+
+class Selection:
+    """
+    Rows to load from a log.
+
+    Parameters:
+        iterations (list): (low, high) iteration ranges, both ends
+            inclusive and None for an open end, as returned by
+            selection.parse_ranges. None or empty loads all iterations.
+        freq (tuple): (low, high) frequency range [Hz], low inclusive,
+            high exclusive, None for an open end. None loads all rows.
+
+    Iterations are found by binary search over byte offsets, since the
+    firmware writes them in increasing order; only the byte ranges of
+    the selected iterations are read. The frequency filter parses the
+    freq column first and converts the other columns of matching rows
+    only, which pays off when it drops most rows.
+    """
+    def __init__(self, iterations=None, freq=None):
+        self.iterations = tuple(tuple(r) for r in iterations) if iterations else None
+        self.freq = tuple(freq) if freq is not None else None
+
+    def _key(self):
+        return self.iterations, self.freq
+
+    def __eq__(self, other):
+        return isinstance(other, Selection) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"Selection(iterations={self.iterations}, freq={self.freq})"
+
+    def freq_mask(self, freq):
+        low, high = self.freq
+        mask = np.ones(len(freq), dtype=bool)
+        if low is not None:
+            mask &= freq >= low
+        if high is not None:
+            mask &= freq < high
+        return mask
+
+
+def data_offset(filename, skiprows=HEADER_ROWS):
+    # Byte offset of the first data row
+    with open(filename, 'rb') as f:
+        for _ in range(skiprows):
+            if not f.readline():
+                break
+        return f.tell()
+
+
+def chunk_ranges(filename, chunk_size=CHUNK_SIZE, start=None, stop=None):
+    """
+    Split the data part of a log into (start, stop) byte ranges,
+    each beginning at a line start and ending just after a newline.
+    """
+    if start is None:
+        start = data_offset(filename)
+    if stop is None:
+        stop = os.path.getsize(filename)
+
+    ranges = []
+    with open(filename, 'rb') as f:
+        while start < stop:
+            end = min(start + chunk_size, stop)
+            if end < stop:
+                f.seek(end)
+                f.readline()
+                end = min(f.tell(), stop)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_block(block, columns=USED_COLUMNS, selection=None):
+    """
+    Parse raw log text into a (rows, len(columns)) float array.
+    Only the requested columns are converted, and with a frequency
+    selection only the rows inside its range.
+    """
+    usecols = [COLUMNS.index(name) for name in columns]
+    if not block.strip():
+        return np.empty((0, len(usecols)))
+    if selection is not None and selection.freq is not None:
+        freq = np.loadtxt(io.BytesIO(block), delimiter=',', usecols=COLUMNS.index("freq"), ndmin=1)
+        keep = selection.freq_mask(freq * SCALE["freq"])
+        if not keep.any():
+            return np.empty((0, len(usecols)))
+        if not keep.all():
+            lines = [line for line in block.split(b"\n") if line.strip()]
+            block = b"\n".join(compress(lines, keep))
+    return np.loadtxt(io.BytesIO(block), delimiter=',', usecols=usecols, ndmin=2)
+
+
+def read_range(filename, start, stop):
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        return f.read(stop - start)
+
+
+def _line_iteration(line):
+    # Iteration is the last column
+    return float(line.rsplit(b",", 1)[1]) * SCALE["iteration"]
+
+
+def iteration_offset(filename, value, start=None, stop=None, after=False):
+    """
+    Byte offset of the first row whose iteration is >= value (> value
+    with after=True), stop if there is none. Binary search over byte
+    offsets down to SEARCH_BLOCK, then a scan of the lines left.
+    """
+    if start is None:
+        start = data_offset(filename)
+    if stop is None:
+        stop = os.path.getsize(filename)
+
+    def before(line):
+        it = _line_iteration(line)
+        return it <= value if after else it < value
+
+    # Rows starting before low are all before value, the row at high is not
+    low, high = start, stop
+    with open(filename, 'rb') as f:
+        while high - low > SEARCH_BLOCK:
+            f.seek((low + high) // 2)
+            f.readline()
+            position = f.tell()
+            if position >= high:
+                break
+            line = f.readline()
+            if before(line):
+                low = position + len(line)
+            else:
+                high = position
+
+        f.seek(low)
+        for line in f.read(high - low).splitlines(keepends=True):
+            if line.strip() and not before(line):
+                return low
+            low += len(line)
+    return high
+
+
+def selected_ranges(filename, selection=None):
+    """
+    Sorted, non-overlapping (start, stop) byte ranges holding the
+    iterations of a selection, the whole data part without one.
+    """
+    start, stop = data_offset(filename), os.path.getsize(filename)
+    if selection is None or not selection.iterations:
+        return [(start, stop)]
+
+    ranges = []
+    for low, high in sorted(selection.iterations, key=lambda r: -np.inf if r[0] is None else r[0]):
+        first = start if low is None else iteration_offset(filename, low, start, stop)
+        last = stop if high is None else iteration_offset(filename, high, start, stop, after=True)
+        if first >= last:
+            continue
+        if ranges and first <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], last))
+        else:
+            ranges.append((first, last))
+    return ranges
+
+
+def _parse_range(task):
+    filename, start, stop, columns, selection = task
+    return parse_block(read_range(filename, start, stop), columns, selection)
+
+
+def load_columns(filename, columns=USED_COLUMNS, workers=None, chunk_size=CHUNK_SIZE, selection=None):
+    """
+    Load selected log columns, parsing byte-range chunks in parallel.
+
+    Parameters:
+        filename (str): Path to the SD card log.
+        columns (tuple): Column names from COLUMNS to load.
+        workers (int): Number of parser processes, defaults to os.cpu_count().
+        chunk_size (int): Approximate chunk size in bytes.
+        selection (Selection): Rows to load, None for all. Rows outside
+            it are not converted; iterations outside it are not read.
+
+    Returns:
+        dict: Column name → scaled float64 array.
+    """
+    tasks = [(filename, chunk_start, chunk_stop, columns, selection)
+             for start, stop in selected_ranges(filename, selection)
+             for chunk_start, chunk_stop in chunk_ranges(filename, chunk_size, start, stop)]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+
+    if workers <= 1:
+        parts = [_parse_range(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(_parse_range, tasks))
+
+    if parts:
+        data = np.concatenate(parts)
+    else:
+        data = np.empty((0, len(columns)))
+
+    return {name: np.ascontiguousarray(data[:, k]) * SCALE[name] for k, name in enumerate(columns)}
+
+
+def stream_columns(filename, columns=USED_COLUMNS, chunk_size=CHUNK_SIZE):
+    """
+    Parse a log chunk by chunk, holding one chunk at a time.
+
+    Yields:
+        dict: Column name → scaled float64 array of the chunk's rows.
+    """
+    for start, stop in chunk_ranges(filename, chunk_size):
+        data = _parse_range((filename, start, stop, columns, None))
+        yield {name: data[:, k] * SCALE[name] for k, name in enumerate(columns)}
@@ -1,44 +1,267 @@
-import numpy as np
+import argparse
+import glob
 import os
-from preprocess import load_data_single_freq
-from single_points import extract_impedance_points
-from plots import nyquilist_plot, output_plot
+import sys
+import profiling
+from pipeline import analyze_files, ocv_tables, ANALYSIS_VERSION
+from selection import range_selector
+from single_points import METHODS
+from output import ResultWriter, output_fields, write_results, write_fleet, write_table
+from follow import follow
+from results_store import ResultStore
+from fleet import analyze_fleet, cell_names
+from incremental_capacity import analyze_incremental_capacity, peak_rows
+from drt import drt_table
+from equivalent_circuit import DEFAULT_CIRCUIT, get_circuit
+from plotting import nyquilist_plot, output_plot, set_backend, BACKENDS, STATIC_FORMATS
 
 
-def main():
+def find_logs(paths, pattern="*.txt"):
+    """
+    Expand files and directories into a sorted list of log files.
+    """
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs.extend(sorted(f for f in glob.glob(os.path.join(path, pattern)) if os.path.isfile(f)))
+        elif os.path.isfile(path):
+            logs.append(path)
+        else:
+            raise FileNotFoundError(path)
+    return logs
+
+
+def show_plots(results, showNyqulistPlot, circuit=DEFAULT_CIRCUIT):
+    Vo_list ,R_s_list, R_p_list, C_p_list, E_list = [], [], [], [], []
+
+
+    for result in results:
+
+        if showNyqulistPlot: nyquilist_plot(result["Z"], result["fitted_impedance"], result["iteration"], result["energy"])
+        # Other circuits have no R_s, R_p and C_p to plot over the discharge
+        if circuit is not DEFAULT_CIRCUIT: continue
+
+        Vo_list.append(result["Vo"])
+        R_s_list.append(result["R_s"])
+        R_p_list.append(result["R_p"])
+        C_p_list.append(result["C_p"])
+        E_list.append((result["energy"]*1000)/1000)
+
+    if circuit is DEFAULT_CIRCUIT: output_plot(E_list, Vo_list, R_s_list, R_p_list, C_p_list)
+
+
+def interactive():
 
     filename = input("Enter path to file: ").strip()
     while not os.path.isfile(filename):
         print("File not found. Please try again.")
+        filename = input("Enter path to file: ").strip()
 
     showInputPlot = input("Show input plots? True/False: ").strip().lower() == "true"
     showFourierPlot = input("Show Fourier plots? True/False: ").strip().lower() == "true"
     showNyqulistPlot = input("Show Nyqulist plots? True/False: ").strip().lower() == "true"
+    iterations = input("Iterations to analyse, e.g. 0-18 (empty for all): ").strip()
+    method = input("Impedance estimator fft/lockin/sinefit (empty for fft): ").strip().lower() or "fft"
+    workers = input("Worker processes (empty for all cores): ").strip()
+    workers = int(workers) if workers else None
 
-    time, current, voltage, freq, energy, iterations = load_data_single_freq(filename)
+    results = analyze_files(
+        [filename], workers=workers, select=range_selector(iterations), method=method,
+        showInputPlot=showInputPlot, showFourierPlot=showFourierPlot)
 
-    all_iterations  = np.unique(iterations)
+    show_plots(results, showNyqulistPlot)
 
-    Vo_list ,R_s_list, R_p_list, C_p_list, E_list = [], [], [], [], []
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Impedance analysis of Battery Analyzer SD card logs. "
+                    "Without paths the analysis runs interactively.")
+    parser.add_argument("paths", nargs="*", help="log files or directories of logs")
+    parser.add_argument("--pattern", default="*.txt", help="log file pattern inside directories (default: *.txt)")
+    parser.add_argument("--iterations", default="", help="iterations to analyse, e.g. 0-18,25 (default: all)")
+    parser.add_argument("--method", choices=METHODS, default="fft", help="impedance estimator (default: fft)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output", default="-", help="output file, .csv or .json, - for stdout (default: -)")
+    parser.add_argument("--format", choices=("csv", "json"), default=None, help="output format (default: from extension)")
+    parser.add_argument("--circuit", default=None,
+                        help="equivalent circuit to fit, e.g. R0-p(R1,CPE1)-W1, see circuits.compile_circuit "
+                             f"(default: {DEFAULT_CIRCUIT.description} as R_s, R_p and C_p)")
+    parser.add_argument("--no-warm-start", action="store_true", help="start every fit from the default guess")
+    parser.add_argument("--no-memo", action="store_true", help="do not reuse or store fits on disk")
+    parser.add_argument("--plot", action="store_true", help="show the Nyquist and output plots")
+    parser.add_argument("--plot-backend", choices=BACKENDS, default="plotly",
+                        help="plotly opens figures in the browser, static writes them to --plot-dir (default: plotly)")
+    parser.add_argument("--plot-dir", default="plots", help="directory of static plots (default: plots)")
+    parser.add_argument("--plot-format", choices=STATIC_FORMATS, default="html",
+                        help="static plot format, png/svg/pdf need kaleido (default: html)")
+    parser.add_argument("--quiet", action="store_true", help="do not print fitted parameters")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep analysing a growing log as iterations complete, appending to the output")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="seconds between polls in --follow mode")
+    parser.add_argument("--idle-timeout", type=float, default=None,
+                        help="stop following after this many seconds without new data (default: never)")
+    parser.add_argument("--bootstrap", type=int, default=0,
+                        help="block bootstrap resamples per iteration for confidence intervals (default: none)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence level of the intervals")
+    parser.add_argument("--store", default=None, help="SQLite results store to add the spectra and fits to")
+    parser.add_argument("--cell", default=None, help="cell name in the store (default: log name without extension)")
+    parser.add_argument("--fleet", action="store_true",
+                        help="one log per cell: write median, percentiles and outliers on a common grid")
+    parser.add_argument("--axis", choices=("energy", "soc"), default="energy",
+                        help="fleet grid over discharged mAh or state of charge %% (default: energy)")
+    parser.add_argument("--grid-step", type=float, default=None, help="fleet grid step (default: 100 mAh or 5 %%)")
+    parser.add_argument("--grid-max", type=float, default=None, help="end of the energy grid (default: 5000 mAh)")
+    parser.add_argument("--fleet-spectra", default=None,
+                        help="write the fleet's mean and spread of Z per grid point and frequency to this file")
+    parser.add_argument("--ocv", default=None,
+                        help="write an OCV-SoC table fitted to the relaxation of the rests to this .csv/.json file")
+    parser.add_argument("--kk-exclude", action="store_true",
+                        help="leave points failing the Kramers-Kronig test out of the circuit fit")
+    parser.add_argument("--drt", default=None,
+                        help="write the distribution of relaxation times of every iteration to this .csv/.json file")
+    parser.add_argument("--ica", default=None,
+                        help="write dQ/dV and dV/dQ peaks of the constant-current discharges per cell to this file")
+    parser.add_argument("--profile", action="store_true", help="print time per analysis stage to stderr")
+    parser.add_argument("--profile-json", default=None, help="write the stage timings as JSON to this file")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also track peak Python memory (tracemalloc, slows the analysis)")
+    parser.add_argument("--cprofile", default=None,
+                        help="write cProfile statistics of the main process to this file (see pstats)")
+    return parser, parser.parse_args(argv)
+
+
+def main(argv=None):
+    parser, args = parse_args(argv)
+    if not args.paths:
+        interactive()
+        return
+
+    try:
+        logs = find_logs(args.paths, args.pattern)
+    except FileNotFoundError as e:
+        parser.error(f"no such file or directory: {e}")
+    if not logs:
+        parser.error("no log files found")
+    if args.fleet_spectra and not args.fleet:
+        parser.error("--fleet-spectra needs --fleet")
+    if args.fleet and args.bootstrap:
+        parser.error("--fleet writes no per-iteration intervals, so it does not take --bootstrap")
+    try:
+        args.circuit = get_circuit(args.circuit)
+    except ValueError as e:
+        parser.error(f"--circuit: {e}")
+    if args.circuit is not DEFAULT_CIRCUIT and (args.fleet or args.store):
+        parser.error("--fleet and --store keep R_s, R_p and C_p, so they need the default --circuit")
+
+    set_backend(args.plot_backend, args.plot_dir, args.plot_format)
+
+    if not (args.profile or args.profile_json or args.profile_memory or args.cprofile):
+        analyze(parser, args, logs)
+        return
+
+    profiling.enable(memory=args.profile_memory, cprofile=args.cprofile is not None)
+    try:
+        analyze(parser, args, logs)
+    finally:
+        profiler = profiling.disable()
+        if args.profile or not args.profile_json:
+            print(profiler.table(), file=sys.stderr)
+        if args.profile_json:
+            profiling.write_json(profiler, args.profile_json)
+        if args.cprofile:
+            profiler.cprofile.dump_stats(args.cprofile)
+            if args.profile: print(profiler.cprofile_stats(), file=sys.stderr)
+
+
+def write_incremental_capacity(logs, path):
+    rows = []
+    for filename, cell in zip(logs, cell_names(logs)):
+        with profiling.stage("incremental capacity"):
+            rows.extend(peak_rows(cell, analyze_incremental_capacity(filename)))
+    with profiling.stage("output"):
+        write_table(rows, path)
+
+
+def analyze(parser, args, logs):
+    store = ResultStore(args.store) if args.store else None
+
+    def store_results(results):
+        if store:
+            with profiling.stage("store"):
+                store.write(results, args.method, args.circuit.description, ANALYSIS_VERSION, args.cell,
+                            kk_exclude=args.kk_exclude, warm_start=not args.no_warm_start)
+
+    if args.fleet:
+        def on_cell(summary):
+            if store:
+                with profiling.stage("store"):
+                    store.write(summary["results"], args.method, args.circuit.description, ANALYSIS_VERSION,
+                                args.cell or summary["cell"], kk_exclude=args.kk_exclude,
+                                warm_start=not args.no_warm_start)
+
+        try:
+            fleet = analyze_fleet(
+                logs, axis=args.axis, step=args.grid_step, stop=args.grid_max, iterations=args.iterations,
+                method=args.method, workers=args.workers, memo=not args.no_memo, on_cell=on_cell,
+                keep_results=store is not None, verbose=not args.quiet and args.output != "-",
+                warm_start=not args.no_warm_start, kk_exclude=args.kk_exclude)
+        finally:
+            if store: store.close()
+        with profiling.stage("output"):
+            write_fleet(fleet.statistics(), args.output, args.format,
+                        fleet.spectrum_rows() if args.fleet_spectra else None, args.fleet_spectra)
+        if not args.quiet and args.output != "-":
+            for cell, shares in fleet.outlier_cells().items():
+                print(f"Outlier {cell}: " + ", ".join(f"{name} {share:.0%}" for name, share in shares.items()))
+        if args.ica: write_incremental_capacity(logs, args.ica)
+        return
 
-    for iteration in all_iterations:
+    if args.follow:
+        if len(logs) != 1:
+            parser.error("--follow takes a single log file")
+        writer = ResultWriter(args.output, args.format, append=True,
+                              fields=output_fields(bool(args.bootstrap), parameters=args.circuit.parameters))
 
-        if iteration > 18:
-            continue
+        def on_results(results):
+            with profiling.stage("output"):
+                writer.write(results)
+            store_results(results)
 
-        Z, fitted_impedance, first_energy, Vo, R_s, R_p, C_p = extract_impedance_points(
-            time, current, voltage, freq, energy, iterations, iteration, showInputPlot, showFourierPlot)
+        try:
+            follow(logs[0], on_results, method=args.method, select=range_selector(args.iterations),
+                   poll_interval=args.poll_interval, idle_timeout=args.idle_timeout,
+                   verbose=not args.quiet and args.output != "-", warm_start=not args.no_warm_start,
+                   kk_exclude=args.kk_exclude, bootstrap=args.bootstrap, confidence=args.confidence,
+                   circuit=args.circuit)
+        finally:
+            writer.close()
+            if store: store.close()
+        return
 
-        Vo_list.append(Vo)
-        R_s_list.append(R_s)
-        R_p_list.append(R_p)
-        C_p_list.append(C_p)
-        E_list.append((first_energy*1000)/1000)
+    results = analyze_files(
+        logs, workers=args.workers, select=range_selector(args.iterations), method=args.method,
+        warm_start=not args.no_warm_start, memo=not args.no_memo,
+        verbose=not args.quiet and args.output != "-", bootstrap=args.bootstrap, confidence=args.confidence,
+        kk_exclude=args.kk_exclude, circuit=args.circuit)
 
-        if showNyqulistPlot: nyquilist_plot(Z, fitted_impedance, iteration, first_energy)
+    with profiling.stage("output"):
+        write_results(results, args.output, args.format, args.circuit.parameters)
+    store_results(results)
+    if args.ocv:
+        rows = ocv_tables(logs, select=range_selector(args.iterations), workers=args.workers)
+        with profiling.stage("output"):
+            write_table(rows, args.ocv)
+    if args.drt:
+        with profiling.stage("drt"):
+            rows = drt_table(results)
+        with profiling.stage("output"):
+            write_table(rows, args.drt)
+    if args.ica: write_incremental_capacity(logs, args.ica)
+    if store: store.close()
 
-    output_plot(E_list, Vo_list, R_s_list, R_p_list, C_p_list)
+    if args.plot or args.plot_backend == "static":
+        with profiling.stage("plot"):
+            show_plots(results, True, args.circuit)
 
 
 if __name__ == "__main__":
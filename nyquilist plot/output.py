@@ -0,0 +1,144 @@
+import csv
+import json
+import os
+import sys
+from equivalent_circuit import DEFAULT_CIRCUIT
+
+
+# Followed by the circuit parameters, R_s, R_p and C_p by default
+RESULT_FIELDS = ("file", "iteration", "energy", "Vo")
+# Present when the spectra were checked with the Kramers-Kronig test
+KK_FIELDS = ("kk_rms", "kk_valid")
+
+
+def interval_fields(parameters=DEFAULT_CIRCUIT.parameters):
+    # Present when the analysis ran with bootstrap intervals
+    return tuple(name + suffix for name in parameters for suffix in ("_low", "_high"))
+
+
+def output_fields(intervals=False, kk=True, parameters=DEFAULT_CIRCUIT.parameters):
+    """
+    Output columns of an analysis fitting a circuit with parameters,
+    with or without bootstrap intervals and Kramers-Kronig results.
+    """
+    return (RESULT_FIELDS + tuple(parameters) + (interval_fields(parameters) if intervals else ())
+            + (KK_FIELDS if kk else ()))
+
+
+def result_fields(results, parameters=DEFAULT_CIRCUIT.parameters):
+    return output_fields(any(parameters[0] + "_low" in r for r in results), any(KK_FIELDS[0] in r for r in results),
+                         parameters)
+
+
+def result_rows(results, fields=None):
+    fields = fields or result_fields(results)
+    for result in results:
+        row = {name: result.get(name) for name in fields}
+        row["iteration"] = int(row["iteration"])
+        for name in fields[2:]:
+            if name == "kk_valid":
+                row[name] = None if row[name] is None else bool(row[name])
+            elif row[name] is not None:
+                row[name] = float(row[name])
+        yield row
+
+
+class ResultWriter:
+    """
+    Writes per-iteration parameters as CSV or JSON lines, either all at
+    once or as results arrive. With append=True an existing file is
+    extended and its CSV header kept.
+
+    Parameters:
+        path (str): Output file, "-" writes to stdout.
+        fmt (str): "csv" or "json", guessed from the extension if None.
+        append (bool): Append to an existing file.
+        fields (tuple): Columns, see output_fields. Results arriving
+            one by one need them, as the first may lack some, e.g. the
+            Kramers-Kronig results of a short spectrum. Taken from the
+            first results written if None.
+    """
+    def __init__(self, path="-", fmt=None, append=False, fields=None):
+        if fmt is None:
+            fmt = "json" if path.endswith((".json", ".jsonl")) else "csv"
+        self.fmt = fmt
+        self.fields = fields
+
+        if path == "-":
+            self.file = sys.stdout
+            self.header = True
+        else:
+            self.header = not (append and os.path.isfile(path) and os.path.getsize(path) > 0)
+            self.file = open(path, "a" if append else "w", newline="")
+
+    def write(self, results):
+        self.fields = self.fields or result_fields(results)
+        rows = result_rows(results, self.fields)
+        if self.fmt == "json":
+            for row in rows:
+                self.file.write(json.dumps(row) + "\n")
+        else:
+            writer = csv.DictWriter(self.file, fieldnames=self.fields)
+            if self.header:
+                writer.writeheader()
+                self.header = False
+            writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def write_results(results, path="-", fmt=None, parameters=DEFAULT_CIRCUIT.parameters):
+    """
+    Write per-iteration parameters as CSV or JSON lines.
+
+    Parameters:
+        results (list): Fitted results from pipeline.analyze_files.
+        path (str): Output file, "-" writes to stdout.
+        fmt (str): "csv" or "json", guessed from the extension if None.
+        parameters (tuple): Names of the fitted circuit's parameters.
+    """
+    writer = ResultWriter(path, fmt, fields=result_fields(results, parameters))
+    try:
+        writer.write(results)
+    finally:
+        writer.close()
+
+
+def write_table(rows, path="-", fmt=None, csv_row=None):
+    """
+    Write dict rows with the same keys as CSV or JSON lines.
+
+    Parameters:
+        csv_row (callable): Converts a row for CSV, e.g. to join lists.
+    """
+    if fmt is None:
+        fmt = "json" if path.endswith((".json", ".jsonl")) else "csv"
+    file = sys.stdout if path == "-" else open(path, "w", newline="")
+    try:
+        if fmt == "json":
+            for row in rows:
+                file.write(json.dumps(row) + "\n")
+        elif rows:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(map(csv_row, rows) if csv_row else rows)
+        file.flush()
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+def write_fleet(rows, path="-", fmt=None, spectrum_rows=None, spectrum_path=None):
+    """
+    Write fleet statistics from fleet.FleetAggregate.statistics, one
+    row per grid point and parameter. In CSV the outlier cells are
+    joined with ";". With a spectrum_path, the spectrum statistics of
+    FleetAggregate.spectrum_rows are written there, as CSV or JSON
+    lines like the statistics.
+    """
+    write_table(rows, path, fmt, csv_row=lambda row: dict(row, outliers=";".join(row["outliers"])))
+    if spectrum_path:
+        write_table(spectrum_rows or [], spectrum_path, fmt)
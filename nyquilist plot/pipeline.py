@@ -0,0 +1,349 @@
+import os
+import sys
+import tempfile
+import numpy as np
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+import profiling
+from cache import load_cached, load_shared, write_shared
+from loader import USED_COLUMNS, Selection
+from single_points import impedance_spectrum, print_parameters, METHODS
+from equivalent_circuit import fit_spectra, DEFAULT_CIRCUIT
+from fit_memo import FitMemo, memo_path
+from uncertainty import impedance_uncertainty, parameter_uncertainty
+from relaxation import relaxation_table
+from kramers_kronig import kramers_kronig_batch
+
+
+# Bump when a change alters extracted spectra or fits, so stored
+# results of older code can be told apart
+ANALYSIS_VERSION = 1
+
+# Logs already loaded by this process, so pool workers load each file
+# once: file name → (selection, (data, segments))
+_loaded_logs = {}
+
+
+def required_columns(method, segments=None):
+    # I set is the phase reference of the lock-in, and whatever the
+    # method it tells which components of a multisine (logged with
+    # freq = -f0) are excited
+    if method == "lockin" or (segments is not None and np.any(segments["freq"] < 0)):
+        return USED_COLUMNS + ("current_set",)
+    return USED_COLUMNS
+
+
+def load_selection(select):
+    """
+    Loader selection for an iteration selector, None unless it is a
+    selection.RangeSelector whose ranges the loader can skip to.
+    """
+    ranges = getattr(select, "ranges", None)
+    return Selection(ranges) if ranges else None
+
+
+def load_log(filename, columns=USED_COLUMNS, workers=None, selection=None, shared=None):
+    """
+    Load a log through the sidecar cache, see cache.load_cached for
+    what a selection changes. shared is a directory where the parent
+    saved the rows it parsed (see share_log), mapped instead.
+
+    Returns:
+        (dict, np.ndarray): Column name → array, and the segment table.
+    """
+    loaded = _loaded_logs.get(filename)
+    if (loaded is None or not set(columns) <= set(loaded[1][0])
+            or (loaded[0] is not None and loaded[0] != selection)):
+        _loaded_logs.clear()
+        if shared:
+            _loaded_logs[filename] = (selection, load_shared(shared, columns))
+        else:
+            _loaded_logs[filename] = (selection, load_cached(filename, columns, workers=workers, selection=selection))
+    return _loaded_logs[filename][1]
+
+
+def share_log(filename, directory):
+    """
+    Save the rows of filename this process loaded to directory unless
+    they are mapped from the sidecar, so that workers map them rather
+    than parsing the log again. That is the case after a partial parse
+    (see cache.load_cached) or when the sidecar could not be written.
+
+    Returns:
+        str: directory, or None when there is nothing to share.
+    """
+    _, (data, segments) = _loaded_logs[filename]
+    if isinstance(segments, np.memmap):
+        return None
+    try:
+        write_shared(directory, data, segments)
+    except OSError as e:
+        print(f"Parsed rows of {filename} not shared with the workers: {e}", file=sys.stderr)
+        return None
+    return directory
+
+
+def analyze_iteration(task):
+    """
+    Extract the impedance spectrum of one iteration. Runs in pool
+    workers, so it must not plot anything unless called in the parent
+    process.
+    """
+    filename, iteration, method, showInputPlot, showFourierPlot, bootstrap, selection, shared = task
+    _, segments = load_log(filename, required_columns(method), selection=selection, shared=shared)
+    data, segments = load_log(filename, required_columns(method, segments), selection=selection, shared=shared)
+    return spectrum_result(filename, data, segments, iteration, method, bootstrap, showInputPlot, showFourierPlot)
+
+
+def spectrum_result(filename, data, segments, iteration, method="fft", bootstrap=None, showInputPlot=False,
+                    showFourierPlot=False):
+    """
+    Result of one iteration of loaded log columns: its impedance
+    spectrum, with bootstrapped intervals if bootstrap is (resamples,
+    level). fit_results adds the fit.
+    """
+    columns = [data[name] for name in USED_COLUMNS]
+
+    with profiling.stage("spectrum"):
+        freqs, Z, first_energy, Vo = impedance_spectrum(
+            *columns, iteration, showInputPlot, showFourierPlot, segments,
+            method=method, current_set=data.get("current_set"))
+    profiling.count("iterations")
+
+    result = {
+        "file": filename,
+        "iteration": iteration,
+        "energy": first_energy,
+        "Vo": Vo,
+        "freqs": freqs,
+        "Z": Z,
+    }
+    if bootstrap:
+        resamples, level = bootstrap
+        with profiling.stage("bootstrap"):
+            result.update(bootstrap_intervals(data, segments, iteration, freqs, resamples, level, method))
+        profiling.count("bootstrap resamples", resamples)
+    return result
+
+
+def _profiled_iteration(task):
+    # Pool worker entry when profiling: hand this task's timings back
+    result = analyze_iteration(task)
+    result["profile"] = profiling.take()
+    return result
+
+
+def bootstrap_intervals(data, segments, iteration, freqs, resamples, level, method="fft"):
+    """
+    Confidence intervals of an iteration's impedance points, resampled
+    and estimated with method, with Z_low, Z_high and the resampled
+    spectra Z_samples (resamples, points) aligned to freqs (NaN where a
+    point has none, e.g. multisine components). fit_results turns
+    Z_samples into parameter intervals.
+    """
+    uncertainty = impedance_uncertainty(
+        data["time"], data["current"], data["voltage"], data["freq"], data["iteration"],
+        iteration, segments, resamples=resamples, level=level, method=method,
+        current_set=data.get("current_set"))
+
+    intervals = {"Z_low": np.full(len(freqs), np.nan + 0j), "Z_high": np.full(len(freqs), np.nan + 0j),
+                 "Z_samples": np.full((resamples, len(freqs)), np.nan + 0j)}
+    if uncertainty is None:
+        return intervals
+
+    found = np.isin(freqs, uncertainty["freqs"])
+    position = np.searchsorted(uncertainty["freqs"], freqs[found])
+    intervals["Z_low"][found] = uncertainty["Z_low"][position]
+    intervals["Z_high"][found] = uncertainty["Z_high"][position]
+    intervals["Z_samples"][:, found] = uncertainty["samples"][:, position]
+    return intervals
+
+
+def fit_results(results, warm_start=True, memo=True, verbose=True, kk_exclude=False, confidence=0.95,
+                circuit=None, seeds=None):
+    """
+    Fit the circuit to the spectra of all results, file by file, and
+    add its parameters (R_s, R_p, C_p by default) and fitted_impedance
+    to each result.
+
+    Every spectrum is first checked with the linear Kramers-Kronig test
+    (see kramers_kronig.kramers_kronig_batch), which adds kk_residual
+    and kk_point_valid per point and kk_rms and kk_valid per spectrum.
+
+    Parameters:
+        results (list): Results of analyze_iteration ordered by file
+            and iteration.
+        warm_start (bool): Start each fit from the previous iteration
+            that converged and passed the Kramers-Kronig test.
+        memo (bool): Reuse fits stored next to the log, so re-running
+            after a plotting-only change does no fitting.
+        verbose (bool): Print the fitted parameters of each iteration
+            and the spectra that fail the Kramers-Kronig test.
+        kk_exclude (bool): Leave the points failing the test out of
+            the fit and of its bootstrap.
+        confidence (float): Level of the parameter intervals of results
+            with bootstrapped spectra (Z_samples, which is consumed).
+        circuit (circuits.Circuit): Model to fit, DEFAULT_CIRCUIT if None.
+        seeds (dict): Optional file name → seed of its next warm-started
+            fit, read and updated, so that a caller fitting a log a few
+            iterations at a time (follow.LogFollower) starts each from
+            the iterations before.
+    """
+    circuit = circuit or DEFAULT_CIRCUIT
+    for filename, group in groupby(results, key=lambda r: r["file"]):
+        group = list(group)
+        fit_memo = FitMemo(memo_path(filename)) if memo else None
+
+        with profiling.stage("kramers-kronig"):
+            tests = kramers_kronig_batch([r["freqs"] for r in group], [r["Z"] for r in group])
+        for result, test in zip(group, tests):
+            if test is None:
+                continue
+            result.update(kk_residual=test["residual"], kk_point_valid=test["point_valid"],
+                          kk_rms=test["rms"], kk_valid=test["valid"])
+            if verbose and not test["valid"]:
+                print(f"Iteration {int(result['iteration'])} of {filename} fails the Kramers-Kronig test: "
+                      f"rms residual {test['rms']:.2%}, {int(np.sum(~test['point_valid']))} of "
+                      f"{len(test['point_valid'])} points invalid", file=sys.stderr)
+
+        kept = [np.ones(len(r["freqs"]), dtype=bool) for r in group]
+        if kk_exclude:
+            kept = [r.get("kk_point_valid", k) for r, k in zip(group, kept)]
+        frequencies = [r["freqs"][k] for r, k in zip(group, kept)]
+        impedances = [r["Z"][k] for r, k in zip(group, kept)]
+        with profiling.stage("fit"):
+            params, seed = fit_spectra(frequencies, impedances, warm_start, fit_memo, circuit,
+                                       seed_valid=[r.get("kk_valid", True) for r in group],
+                                       initial_guess=seeds.get(filename) if seeds else None, full_output=True)
+            if seeds is not None:
+                seeds[filename] = seed
+            if fit_memo:
+                fit_memo.save()
+        profiling.count("spectra fitted", len(group))
+
+        for result, fitted in zip(group, params):
+            result.update(zip(circuit.parameters, fitted))
+            result["fitted_impedance"] = circuit.impedance(result["freqs"], fitted)
+            if verbose: print_parameters(result["iteration"], result["Vo"], fitted, circuit)
+
+        for result, k, fitted in zip(group, kept, params):
+            if "Z_samples" in result:
+                parameter_intervals(result, k, fitted, confidence, circuit)
+    return results
+
+
+def parameter_intervals(result, kept, params, confidence=0.95, circuit=None):
+    """
+    Add the parameter intervals of a result with bootstrapped spectra
+    (Z_samples, which is consumed), fitted from params on its kept
+    points, or NaN if none of them was resampled.
+    """
+    circuit = circuit or DEFAULT_CIRCUIT
+    # Resample exactly the points of the fit that had any
+    samples = result.pop("Z_samples")
+    used = kept & np.all(np.isfinite(samples), axis=0)
+    result.update({name + suffix: np.nan for name in circuit.parameters for suffix in ("_low", "_high")})
+    if used.any():
+        with profiling.stage("bootstrap"):
+            result.update(parameter_uncertainty(result["freqs"][used], samples[:, used], params, confidence,
+                                                circuit))
+
+
+def plan_iterations(filename, select=None, method="fft", workers=None, selection=None):
+    _, segments = load_log(filename, required_columns(method), workers=workers, selection=selection)
+    # Load I set of multisine logs now, so the workers find it
+    load_log(filename, required_columns(method, segments), workers=workers, selection=selection)
+    iterations = np.unique(segments["iteration"]).tolist()
+    if select is not None:
+        iterations = [it for it in iterations if select(it)]
+    return iterations
+
+
+def analyze_files(
+        filenames, workers=1, select=None, method="fft",
+        showInputPlot=False, showFourierPlot=False, warm_start=True, memo=True, verbose=True,
+        bootstrap=0, confidence=0.95, pushdown=True, kk_exclude=False, circuit=None):
+    """
+    Analyse every selected iteration of every log.
+
+    Parameters:
+        filenames (list): Paths to SD card logs.
+        workers (int): Worker processes, 1 runs in this process and
+            None uses all cores.
+        select (callable): Iteration number → bool, None keeps all.
+        method (str): Impedance estimator, one of single_points.METHODS.
+        showInputPlot (bool), showFourierPlot (bool): Per-segment plots.
+            They are drawn inside impedance_spectrum, so asking
+            for them forces in-process execution.
+        warm_start (bool), memo (bool), verbose (bool), kk_exclude (bool),
+        circuit (circuits.Circuit): See fit_results.
+        bootstrap (int): Resamples per iteration for confidence
+            intervals of Z and the fitted parameters, 0 for none. They
+            are computed in the workers together with the spectra.
+        confidence (float): Confidence level of the intervals.
+        pushdown (bool): Parse only the iterations of a range selector
+            in logs without a sidecar yet (see cache.load_cached). The
+            parsed rows reach the workers through share_log.
+
+    Returns:
+        list: One result dict per iteration, ordered by file and iteration.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}")
+
+    parse_workers = workers
+    workers = workers or os.cpu_count() or 1
+    if showInputPlot or showFourierPlot:
+        workers = 1
+
+    tasks = []
+    intervals = (bootstrap, confidence) if bootstrap else None
+    selection = load_selection(select) if pushdown else None
+    with tempfile.TemporaryDirectory(prefix="battery-analyzer-", ignore_cleanup_errors=True) as scratch:
+        for k, filename in enumerate(filenames):
+            # Parse in the parent first so workers only map the sidecar,
+            # or the rows shared here if there is none
+            iterations = plan_iterations(filename, select, method, parse_workers, selection)
+            shared = None
+            if iterations and (workers > 1 or len(filenames) > 1):
+                with profiling.stage("load: share"):
+                    shared = share_log(filename, os.path.join(scratch, str(k)))
+            for iteration in iterations:
+                tasks.append((filename, iteration, method, showInputPlot, showFourierPlot, intervals, selection,
+                              shared))
+
+        workers = min(workers, len(tasks))
+        if workers <= 1:
+            results = [analyze_iteration(task) for task in tasks]
+        else:
+            profiled = profiling.enabled()
+            with ProcessPoolExecutor(max_workers=workers, **profiling.pool_options()) as executor:
+                results = list(executor.map(_profiled_iteration if profiled else analyze_iteration, tasks))
+            if profiled:
+                for result in results:
+                    profiling.merge(result.pop("profile"))
+        if any(task[-1] for task in tasks):
+            # Nothing may keep the shared rows mapped once they are deleted
+            _loaded_logs.clear()
+
+    # Fitting is cheap next to spectrum extraction, so it runs batched here
+    return fit_results(results, warm_start, memo, verbose, kk_exclude, confidence, circuit)
+
+
+def ocv_tables(filenames, select=None, terms=2, workers=None):
+    """
+    OCV-SoC table of every log from the relaxation of its rests (see
+    relaxation.relaxation_table). Each log is loaded in full, as the
+    SoC needs its total discharged energy.
+
+    Returns:
+        list: Rows of all logs, each with its file name.
+    """
+    rows = []
+    for filename in filenames:
+        data, segments = load_log(filename, workers=workers)
+        with profiling.stage("relaxation"):
+            table = relaxation_table(data["time"], data["current"], data["voltage"], data["energy"],
+                                     data["iteration"], segments, terms)
+        rows.extend(dict(file=filename, **row) for row in table if select is None or select(row["iteration"]))
+    return rows
@@ -1,5 +1,6 @@
 import plotly.graph_objects as go
 import numpy as np
+from plotting import render
 
 def input_plot(t_seg, v_seg, i_seg, f):
     fig = go.Figure()
@@ -40,7 +41,7 @@ def input_plot(t_seg, v_seg, i_seg, f):
         dragmode='zoom'
     )
     # Show the plot
-    fig.show()
+    render(fig, f"input_{f}Hz")
 
 
 def fourier_plot(freqs_fft, V_fft, I_fft, f_target):
@@ -85,7 +86,7 @@ def fourier_plot(freqs_fft, V_fft, I_fft, f_target):
 
     # Plot
     fig = go.Figure(data=[voltage_trace, current_trace, target_line], layout=layout)
-    fig.show()
+    render(fig, f"fourier_{f_target}Hz")
 
 
 def nyquilist_plot(Z, fitted_impedance, iteration, first_energy):
@@ -105,7 +106,7 @@ def nyquilist_plot(Z, fitted_impedance, iteration, first_energy):
         # Show the plot
         
 
-        fig.show()
+        render(fig, f"nyquist_{int(iteration):03d}")
 
 
 def output_plot(E_list, Vo_list, R_s_list, R_p_list, C_p_list):
@@ -163,7 +164,7 @@ def output_plot(E_list, Vo_list, R_s_list, R_p_list, C_p_list):
         dragmode='zoom'
     )
 
-    fig.show()
+    render(fig, "output")
 
 
 
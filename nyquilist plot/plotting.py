@@ -0,0 +1,119 @@
+import os
+import re
+
+
+BACKENDS = ("plotly", "static", "none")
+STATIC_FORMATS = ("html", "png", "svg", "pdf")
+
+
+class PlotlyBackend:
+    """
+    Interactive figures opened in the browser, one per plot.
+    """
+    enabled = True
+
+    def render(self, fig, name):
+        fig.show()
+
+
+class StaticBackend:
+    """
+    Figures written to files in a directory instead of shown. HTML
+    needs only plotly, png/svg/pdf also need kaleido. A name used
+    again (e.g. the input plot of the same frequency in the next
+    iteration) gets a counter instead of overwriting the first file.
+    """
+    enabled = True
+
+    def __init__(self, directory="plots", fmt="html"):
+        if fmt not in STATIC_FORMATS:
+            raise ValueError(f"Unknown plot format {fmt!r}, expected one of {STATIC_FORMATS}")
+        self.directory = directory
+        self.fmt = fmt
+        self.written = []
+        self.uses = {}
+
+    def render(self, fig, name):
+        os.makedirs(self.directory, exist_ok=True)
+        name = _file_name(name)
+        self.uses[name] = self.uses.get(name, 0) + 1
+        if self.uses[name] > 1:
+            name = f"{name}_{self.uses[name]}"
+        path = os.path.join(self.directory, f"{name}.{self.fmt}")
+        if self.fmt == "html":
+            fig.write_html(path, include_plotlyjs="cdn")
+        else:
+            fig.write_image(path)
+        self.written.append(path)
+
+
+class NullBackend:
+    """
+    No plots. Plot calls return before plots (and plotly) are imported
+    or any figure is built.
+    """
+    enabled = False
+
+    def render(self, fig, name):
+        pass
+
+
+_backend = PlotlyBackend()
+
+
+def _file_name(name):
+    return re.sub(r"[^\w.-]+", "_", name).strip("_")
+
+
+def set_backend(backend="plotly", directory="plots", fmt="html"):
+    """
+    Select where plots go: "plotly", "static" (files in directory),
+    "none", or a backend object with enabled and render(fig, name).
+    """
+    global _backend
+    if backend == "plotly":
+        _backend = PlotlyBackend()
+    elif backend == "static":
+        _backend = StaticBackend(directory, fmt)
+    elif backend == "none":
+        _backend = NullBackend()
+    elif isinstance(backend, str):
+        raise ValueError(f"Unknown plot backend {backend!r}, expected one of {BACKENDS}")
+    else:
+        _backend = backend
+    return _backend
+
+
+def get_backend():
+    return _backend
+
+
+def render(fig, name):
+    _backend.render(fig, name)
+
+
+# Entry points used by the analysis. plots builds the figures with
+# plotly, so it is imported on the first plot actually drawn.
+
+def input_plot(t_seg, v_seg, i_seg, f):
+    if _backend.enabled:
+        import plots
+        plots.input_plot(t_seg, v_seg, i_seg, f)
+
+
+def fourier_plot(freqs_fft, V_fft, I_fft, f_target):
+    if _backend.enabled:
+        import plots
+        plots.fourier_plot(freqs_fft, V_fft, I_fft, f_target)
+
+
+def nyquilist_plot(Z, fitted_impedance, iteration, first_energy):
+    if _backend.enabled:
+        import plots
+        plots.nyquilist_plot(Z, fitted_impedance, iteration, first_energy)
+
+
+def output_plot(E_list, Vo_list, R_s_list, R_p_list, C_p_list):
+    if _backend.enabled:
+        import plots
+        plots.output_plot(E_list, Vo_list, R_s_list, R_p_list, C_p_list)
@@ -1,5 +1,5 @@
 import numpy as np
-from scipy.signal import butter, filtfilt
+from functools import lru_cache
 
 
 def preprocess_data(time, voltage, current):
@@ -12,19 +12,47 @@ def preprocess_data(time, voltage, current):
     return new_time, voltage, current, sample_rate
 
 
-def low_pass_filter(signal, cutoff_freq, sample_rate, order=2):
+def normalized_cutoff(cutoff_freq, sample_rate):
     nyquist = 0.5 * sample_rate
-    normal_cutoff = min(cutoff_freq / nyquist, 0.99)
-    b, a = butter(order, normal_cutoff, btype='low', analog=False)
-    return filtfilt(b, a, signal)
-
-
-def load_data_single_freq(filename):
-    data = np.loadtxt(filename, delimiter=',', skiprows = 2)
-    time = data[:, 0] * 1e-3  # ms → s
-    current = data[:, 2] * 1e-3  # mA → A
-    voltage = data[:, 3] * 1e-3  # mV → V
-    freq = data[:, 4]  # Hz
-    energy = data[:, 5] # mAh
-    iteration = data[:, 6]
-    return time, current, voltage, freq, energy, iteration
+    # Rounded to 4 significant digits, so segments whose sample rates
+    # differ only by timestamp jitter share one filter design
+    return float(f"{min(cutoff_freq / nyquist, 0.99):.4g}")
+
+
+@lru_cache(maxsize=256)
+def butter_sos(order, normal_cutoff):
+    # scipy.signal takes most of the start-up time, so it is imported
+    # on the first filter (when profiling starts if it is on, see
+    # profiling.LAZY_IMPORTS). Shared between calls; scipy's sosfilt
+    # needs it writable, so not frozen
+    from scipy.signal import butter
+    return butter(order, normal_cutoff, btype='low', analog=False, output='sos')
+
+
+def low_pass_filter(signal, cutoff_freq, sample_rate, order=2):
+    from scipy.signal import sosfiltfilt
+    sos = butter_sos(order, normalized_cutoff(cutoff_freq, sample_rate))
+    return sosfiltfilt(sos, signal)
+
+
+_scratch = np.empty((2, 0))
+
+
+def low_pass_filter_pair(voltage, current, cutoff_freq, sample_rate, order=2):
+    """
+    Zero-phase low-pass of voltage and current in one sosfiltfilt call
+    on a reused 2-row buffer.
+    """
+    global _scratch
+    n = len(voltage)
+    if _scratch.shape[1] < n:
+        _scratch = np.empty((2, n))
+    stacked = _scratch[:, :n]
+    stacked[0] = voltage
+    stacked[1] = current
+
+    from scipy.signal import sosfiltfilt
+    sos = butter_sos(order, normalized_cutoff(cutoff_freq, sample_rate))
+    filtered = sosfiltfilt(sos, stacked, axis=-1)
+    return filtered[0], filtered[1]
+
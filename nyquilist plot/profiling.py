@@ -0,0 +1,243 @@
+import cProfile
+import importlib
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Shared by every stage() call while profiling is off, so an
+# instrumented loop pays one global lookup and nothing else
+_DISABLED = nullcontext()
+
+# Profiler of this process, None when profiling is off
+_active = None
+
+# Modules the analysis imports on first use. A profiled process imports
+# them when profiling starts, timed as "import", so their import time
+# is not charged to the first stage that needs them ("filter"); forked
+# pool workers inherit them from the parent
+LAZY_IMPORTS = ("scipy.signal",)
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    """
+    Named stage timers and counters of one analysis run.
+
+    Stages may nest (e.g. "filter" inside "spectrum") and stages timed
+    in pool workers add up over the workers, so their shares of the
+    wall time can add up to more than 100%. With memory=True
+    the peak of Python allocations is tracked through tracemalloc,
+    which slows allocation-heavy code down noticeably; the maximum
+    resident set size is always reported where the OS provides it.
+    """
+    def __init__(self, memory=False, cprofile=False):
+        self.timers = {}    # name → [calls, seconds]
+        self.counters = {}  # name → count
+        self.memory = memory
+        self.peak_memory = 0
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.started = time.perf_counter()
+        self.wall = None
+
+    def add_time(self, name, seconds, calls=1):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [calls, seconds]
+        else:
+            timer[0] += calls
+            timer[1] += seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def update_peak(self):
+        if self.memory and tracemalloc.is_tracing():
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+
+    def snapshot(self):
+        """
+        Timers, counters and peak memory as plain data, to send from a
+        pool worker to the parent.
+        """
+        self.update_peak()
+        return {"timers": {name: list(timer) for name, timer in self.timers.items()},
+                "counters": dict(self.counters), "peak_memory": self.peak_memory}
+
+    def merge(self, snapshot):
+        for name, (calls, seconds) in snapshot["timers"].items():
+            self.add_time(name, seconds, calls)
+        for name, n in snapshot["counters"].items():
+            self.count(name, n)
+        self.peak_memory = max(self.peak_memory, snapshot["peak_memory"])
+
+    def report(self):
+        """
+        Returns:
+            dict: wall time, stages (calls, seconds, mean, share of the
+            wall time) sorted by time, counters and memory in bytes.
+        """
+        self.update_peak()
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.started
+        stages = [{"stage": name, "calls": calls, "seconds": seconds, "mean": seconds / calls,
+                   "share": seconds / wall if wall > 0 else 0.0}
+                  for name, (calls, seconds) in sorted(self.timers.items(), key=lambda t: -t[1][1])]
+        memory = {}
+        if self.memory:
+            memory["python_peak"] = self.peak_memory
+        memory.update(max_rss())
+        return {"wall": wall, "stages": stages, "counters": dict(self.counters), "memory": memory}
+
+    def table(self):
+        report = self.report()
+        lines = [f"{'stage':<24}{'calls':>8}{'seconds':>11}{'mean ms':>10}{'share':>8}"]
+        for stage in report["stages"]:
+            lines.append(f"{stage['stage']:<24}{stage['calls']:>8}{stage['seconds']:>11.4f}"
+                         f"{1000 * stage['mean']:>10.3f}{stage['share']:>8.1%}")
+        lines.append(f"{'wall':<24}{'':>8}{report['wall']:>11.4f}")
+        for name, n in report["counters"].items():
+            lines.append(f"{name:<24}{n:>8,}")
+        for name, size in report["memory"].items():
+            lines.append(f"{name.replace('_', ' '):<24}{size / 1e6:>8.1f} MB")
+        return "\n".join(lines)
+
+    def cprofile_stats(self, limit=25, sort="cumulative"):
+        if self.cprofile is None:
+            return ""
+        stream = io.StringIO()
+        pstats.Stats(self.cprofile, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+def max_rss():
+    """
+    Maximum resident set size of this process and of its finished
+    children (pool workers) in bytes, empty where not available.
+    """
+    if resource is None:
+        return {}
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    unit = 1 if os.uname().sysname == "Darwin" else 1024
+    return {"max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            "max_rss_workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit}
+
+
+def enable(memory=False, cprofile=False):
+    """
+    Start profiling this process and return its Profiler.
+    """
+    global _active
+    _active = Profiler(memory, cprofile)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if _active.cprofile:
+        _active.cprofile.enable()
+    for name in LAZY_IMPORTS:
+        if name not in sys.modules:
+            with stage("import"):
+                importlib.import_module(name)
+    return _active
+
+
+def disable():
+    """
+    Stop profiling and return the Profiler, None if it was not on.
+    """
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return None
+    profiler.wall = time.perf_counter() - profiler.started
+    if profiler.cprofile:
+        profiler.cprofile.disable()
+    if profiler.memory and tracemalloc.is_tracing():
+        profiler.update_peak()
+        tracemalloc.stop()
+    return profiler
+
+
+def enabled():
+    return _active is not None
+
+
+def stage(name):
+    """
+    Time a block under name:
+
+        with profiling.stage("fit"):
+            ...
+    """
+    if _active is None:
+        return _DISABLED
+    return _Stage(_active, name)
+
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
+
+
+def init_worker(memory=False):
+    """
+    Pool initializer: profile the worker so its tasks can hand their
+    timings back with take().
+    """
+    enable(memory)
+
+
+def pool_options():
+    """
+    ProcessPoolExecutor arguments that profile the workers too when
+    profiling is on.
+    """
+    if _active is None:
+        return {}
+    return {"initializer": init_worker, "initargs": (_active.memory,)}
+
+
+def take():
+    """
+    Snapshot of this process's timings since the last take(), reset
+    afterwards, or None when profiling is off. Pool workers attach it
+    to their results and the parent merges it.
+    """
+    if _active is None:
+        return None
+    snapshot = _active.snapshot()
+    _active.timers.clear()
+    _active.counters.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    if _active is not None and snapshot is not None:
+        _active.merge(snapshot)
+
+
+def write_json(profiler, path):
+    with open(path, "w") as f:
+        json.dump(profiler.report(), f, indent=2)
@@ -0,0 +1,205 @@
+from functools import lru_cache
+from itertools import combinations
+import numpy as np
+
+
+# Rest samples: f == 0 rows with less current than this [A], the same
+# threshold Vo uses
+REST_CURRENT = 0.005
+MIN_REST_DURATION = 10.0  # s, shorter rests are not fitted
+# Log-spaced time bins each rest is averaged onto, so the fit costs the
+# same whatever the logging rate
+REST_BINS = 64
+# Time constant grid of the initial search [s]; terms closer than
+# TAU_SEPARATION grid steps are not tried, they fit as one
+TAU_GRID = np.geomspace(0.3, 600.0, 16)
+TAU_SEPARATION = 2
+# Longest time constant fitted, in rest durations. A slower term looks
+# like a slope within the rest and would send the OCV anywhere.
+MAX_TAU_DURATIONS = 2.0
+
+
+def rest_periods(time, current, segments, threshold=REST_CURRENT, min_duration=MIN_REST_DURATION):
+    """
+    Rest periods of a log: runs of rows with f == 0 and |I| below
+    threshold, found with masks over the whole log at once.
+
+    Returns:
+        (np.ndarray, np.ndarray): Start and stop rows of each rest.
+    """
+    n = len(time)
+    zero = segments[segments["freq"] == 0]
+    # +1 at every f == 0 segment start, -1 at its stop
+    marks = np.zeros(n + 1, dtype=np.int8)
+    np.add.at(marks, zero["start"], 1)
+    np.add.at(marks, zero["stop"], -1)
+    resting = (np.cumsum(marks[:-1]) > 0) & (np.abs(current) < threshold)
+
+    edges = np.flatnonzero(np.diff(resting.astype(np.int8), prepend=0, append=0))
+    starts, stops = edges[0::2], edges[1::2]
+    long_enough = time[stops - 1] - time[starts] >= min_duration
+    return starts[long_enough], stops[long_enough]
+
+
+def binned_rests(time, voltage, starts, stops, bins=REST_BINS):
+    """
+    Average every rest onto log-spaced bins of the time since it began.
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray): Mean time [s], mean
+        voltage [V] and sample count, each (rests, bins); empty bins
+        have count 0.
+    """
+    lengths = stops - starts
+    rest = np.repeat(np.arange(len(starts)), lengths)
+    rows = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+    t = time[rows] - time[starts][rest]
+    v = voltage[rows]
+
+    duration = time[stops - 1] - time[starts]
+    # The first sample lands in bin 0, the rest log-spaced up to the end
+    fraction = t / duration[rest]
+    edges = np.geomspace(1e-3, 1.0, bins)
+    index = rest * bins + np.searchsorted(edges, fraction)
+
+    size = len(starts) * bins
+    count = np.bincount(index, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = np.bincount(index, weights=t, minlength=size) / count
+        v_mean = np.bincount(index, weights=v, minlength=size) / count
+    shape = (len(starts), bins)
+    empty = count == 0
+    t_mean[empty] = 0.0
+    v_mean[empty] = 0.0
+    return t_mean.reshape(shape), v_mean.reshape(shape), count.reshape(shape).astype(float)
+
+
+@lru_cache(maxsize=8)
+def _tau_combinations(count, terms):
+    # Grid indices (from 1, 0 is the constant) of the τ tried together
+    return np.array([c for c in combinations(range(1, count + 1), terms)
+                     if all(b - a >= TAU_SEPARATION for a, b in zip(c, c[1:]))]).reshape(-1, terms)
+
+
+def fit_relaxation(t, v, w, terms=2, iterations=10, tau_grid=TAU_GRID):
+    """
+    Fit V(t) = OCV + Σ a_k exp(-t/τ_k) to every rest at once.
+
+    The time constants are first searched on a grid: for fixed τ the
+    model is linear, and the normal equations of every τ combination
+    are assembled from one Gram matrix of the grid's exponentials per
+    rest. Levenberg-Marquardt then refines OCV, amplitudes and log τ
+    of all rests together.
+
+    Parameters:
+        t, v, w (np.ndarray): (rests, points) time since the rest began
+            [s], voltage [V] and weight (0 for padding), e.g. from
+            binned_rests.
+        terms (int): Exponential terms.
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray, np.ndarray): OCV [V],
+        amplitudes [V] and time constants [s] (rests, terms) ordered
+        by τ, and the weighted RMS residual [V].
+    """
+    rests = len(t)
+    duration = np.max(np.where(w > 0, t, 0), axis=1)
+
+    # Gram matrix of [1, exp(-t/τ_g)...] for every rest
+    grid = np.concatenate([np.ones((len(t), 1, t.shape[1])), np.exp(-t[:, None] / tau_grid[:, None])], axis=1)
+    weighted = grid * w[:, None]
+    gram = weighted @ grid.transpose(0, 2, 1)
+    moments = np.einsum('ran,rn->ra', weighted, v)
+    total = np.einsum('rn,rn->r', w * v, v)
+
+    combos = _tau_combinations(len(tau_grid), terms)
+    index = np.concatenate([np.zeros((len(combos), 1), dtype=int), combos], axis=1)
+    A = gram[:, index[:, :, None], index[:, None, :]]  # (rests, combos, k, k)
+    b = moments[:, index]
+    A += 1e-12 * np.trace(A, axis1=2, axis2=3)[..., None, None] * np.eye(terms + 1)
+    coefficients = np.linalg.solve(A, b[..., None])[..., 0]
+    sse = total[:, None] - np.einsum('rck,rck->rc', coefficients, b)
+    longest = tau_grid[combos.max(axis=1) - 1]
+    sse[longest[None, :] > MAX_TAU_DURATIONS * np.maximum(duration, tau_grid[0])[:, None]] = np.inf
+    best = np.argmin(sse, axis=1)
+
+    taus = tau_grid[combos[best] - 1]
+    theta = np.concatenate([coefficients[np.arange(rests), best], np.log(taus)], axis=1)
+    low = np.log(np.full((rests, terms), tau_grid[0] / 3))
+    high = np.log(np.maximum(MAX_TAU_DURATIONS * duration, tau_grid[0]))[:, None] * np.ones(terms)
+
+    def residual(theta):
+        exps = np.exp(-t[:, None] / np.exp(theta[:, 1 + terms:, None]))
+        model = theta[:, :1] + np.einsum('rk,rkn->rn', theta[:, 1:1 + terms], exps)
+        return model - v, exps
+
+    r, exps = residual(theta)
+    cost = np.einsum('rn,rn->r', w * r, r)
+    damping = np.full(rests, 1e-3)
+    for _ in range(iterations):
+        amplitudes, tau = theta[:, 1:1 + terms], np.exp(theta[:, 1 + terms:])
+        J = np.concatenate([np.ones((rests, 1, t.shape[1])), exps,
+                            amplitudes[..., None] * exps * t[:, None] / tau[..., None]], axis=1)
+        weighted = J * w[:, None]
+        JtJ = weighted @ J.transpose(0, 2, 1)
+        gradient = np.einsum('rkn,rn->rk', weighted, r)
+        diagonal = np.einsum('rkk->rk', JtJ)
+        step = np.linalg.solve(JtJ + (damping[:, None] * (diagonal + 1e-18))[..., None] * np.eye(JtJ.shape[-1]),
+                               -gradient[..., None])[..., 0]
+
+        trial = theta + step
+        trial[:, 1 + terms:] = np.clip(trial[:, 1 + terms:], low, high)
+        r_trial, exps_trial = residual(trial)
+        cost_trial = np.einsum('rn,rn->r', w * r_trial, r_trial)
+
+        better = cost_trial < cost
+        theta[better] = trial[better]
+        r[better], exps[better], cost[better] = r_trial[better], exps_trial[better], cost_trial[better]
+        damping = np.where(better, damping / 3, damping * 4)
+
+    order = np.argsort(theta[:, 1 + terms:], axis=1)
+    amplitudes = np.take_along_axis(theta[:, 1:1 + terms], order, axis=1)
+    taus = np.exp(np.take_along_axis(theta[:, 1 + terms:], order, axis=1))
+    rms = np.sqrt(cost / np.maximum(w.sum(axis=1), 1))
+    return theta[:, 0], amplitudes, taus, rms
+
+
+def relaxation_table(time, current, voltage, energy, iteration, segments, terms=2, capacity=None):
+    """
+    OCV-SoC table from the rests of a log.
+
+    SoC is 100 % minus the share of the capacity discharged before the
+    rest; the capacity defaults to the energy discharged over the whole
+    log. An OCV extrapolated from time constants longer than the rest
+    (relaxed below 1) is less certain than last_voltage suggests.
+
+    Returns:
+        list: One dict per rest: iteration, energy [mAh], soc [%],
+        last_voltage and ocv [V], a_k [V] and tau_k [s] per term, rms
+        [V] and relaxed, the share of the slowest term decayed by the
+        end of the rest.
+    """
+    starts, stops = rest_periods(time, current, segments)
+    if len(starts) == 0:
+        return []
+    t, v, w = binned_rests(time, voltage, starts, stops)
+    ocv, amplitudes, taus, rms = fit_relaxation(t, v, w, terms)
+
+    capacity = capacity or float(energy[-1])
+    duration = time[stops - 1] - time[starts]
+    rows = []
+    for k in range(len(starts)):
+        row = {
+            "iteration": int(iteration[starts[k]]),
+            "energy": float(energy[starts[k]]),
+            "soc": 100.0 * (1 - float(energy[starts[k]]) / max(capacity, 1e-12)),
+            "last_voltage": float(voltage[stops[k] - 1]),
+            "ocv": float(ocv[k]),
+        }
+        for term in range(terms):
+            row[f"a_{term + 1}"] = float(amplitudes[k, term])
+            row[f"tau_{term + 1}"] = float(taus[k, term])
+        row["rms"] = float(rms[k])
+        row["relaxed"] = float(1 - np.exp(-duration[k] / taus[k, -1]))
+        rows.append(row)
+    return rows
@@ -0,0 +1,231 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+import numpy as np
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    cell TEXT NOT NULL,
+    file TEXT NOT NULL,
+    analysis_version INTEGER NOT NULL,
+    method TEXT NOT NULL,
+    model TEXT NOT NULL,
+    kk_exclude INTEGER NOT NULL,
+    warm_start INTEGER NOT NULL,
+    tested_at REAL NOT NULL,
+    analysed_at REAL NOT NULL,
+    UNIQUE (file, analysis_version, method, model, kk_exclude, warm_start)
+);
+CREATE INDEX IF NOT EXISTS runs_cell ON runs (cell, tested_at);
+CREATE INDEX IF NOT EXISTS runs_tested_at ON runs (tested_at);
+CREATE INDEX IF NOT EXISTS runs_version ON runs (analysis_version, method);
+
+CREATE TABLE IF NOT EXISTS iterations (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    iteration INTEGER NOT NULL,
+    energy REAL NOT NULL,
+    Vo REAL,
+    R_s REAL,
+    R_p REAL,
+    C_p REAL,
+    PRIMARY KEY (run_id, iteration)
+);
+CREATE INDEX IF NOT EXISTS iterations_energy ON iterations (run_id, energy);
+
+CREATE TABLE IF NOT EXISTS spectra (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    iteration INTEGER NOT NULL,
+    freqs BLOB NOT NULL,
+    Z BLOB NOT NULL,
+    fitted BLOB,
+    PRIMARY KEY (run_id, iteration)
+);
+"""
+
+# Queryable per-iteration values
+PARAMETERS = ("Vo", "R_s", "R_p", "C_p")
+# What besides the log tells runs apart
+RUN_KEY = ("file", "analysis_version", "method", "model", "kk_exclude", "warm_start")
+
+
+def timestamp(value):
+    """
+    Unix time of a float, a datetime or an ISO date string such as
+    "2026-09-01" or "2026-09-01T12:00".
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class ResultStore:
+    """
+    SQLite store of fitted parameters and spectra, one run per analysed
+    log, analysis version, method, circuit model and fit options
+    (RUN_KEY).
+
+    Parameters are kept apart from the spectra, so queries over many
+    cells never read the spectrum blobs. A run's tested_at is the
+    modification time of its log, i.e. when the test ended.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        # Readers may query while a --follow run keeps writing
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(SCHEMA)
+        # Runs written through this store, see write
+        self.written = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def run_id(self, filename, cell, version, method, model, kk_exclude=False, warm_start=True):
+        """
+        Id of the run of a log, created on first use. Re-analysing a log
+        with the same RUN_KEY updates the run.
+        """
+        filename = os.path.abspath(filename)
+        try:
+            tested_at = os.path.getmtime(filename)
+        except OSError:
+            tested_at = time.time()
+        key = (filename, version, method, model, int(kk_exclude), int(warm_start))
+        self.connection.execute(
+            f"INSERT INTO runs (cell, {', '.join(RUN_KEY)}, tested_at, analysed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            f"ON CONFLICT ({', '.join(RUN_KEY)}) "
+            "DO UPDATE SET cell = excluded.cell, tested_at = excluded.tested_at, analysed_at = excluded.analysed_at",
+            (cell, *key, tested_at, time.time()))
+        return self.connection.execute(
+            f"SELECT id FROM runs WHERE {' AND '.join(name + ' = ?' for name in RUN_KEY)}", key).fetchone()[0]
+
+    def write(self, results, method, model, version, cell=None, kk_exclude=False, warm_start=True):
+        """
+        Store fitted results of pipeline.analyze_files or follow mode.
+
+        The first write to a run through this store replaces what an
+        earlier analysis left in it, so iterations that are gone from a
+        rewritten log or a narrower selection do not linger. Later
+        writes, e.g. each iteration in follow mode, add to it.
+
+        Parameters:
+            results (list): Result dicts with file, iteration, energy,
+                Vo, R_s, R_p, C_p, freqs, Z and fitted_impedance.
+            method (str), model (str), version (int), kk_exclude (bool),
+            warm_start (bool): What produced them.
+            cell (str): Cell name, the log name without extension if None.
+        """
+        runs = {}
+        with self.connection:
+            for result in results:
+                filename = result["file"]
+                if filename not in runs:
+                    name = cell or os.path.splitext(os.path.basename(filename))[0]
+                    runs[filename] = self.run_id(filename, name, version, method, model, kk_exclude, warm_start)
+                    if runs[filename] not in self.written:
+                        self.connection.execute("DELETE FROM iterations WHERE run_id = ?", (runs[filename],))
+                        self.connection.execute("DELETE FROM spectra WHERE run_id = ?", (runs[filename],))
+                        self.written.add(runs[filename])
+                run_id = runs[filename]
+                iteration = int(result["iteration"])
+
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO iterations (run_id, iteration, energy, Vo, R_s, R_p, C_p) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, iteration, *(float(result[name]) for name in ("energy",) + PARAMETERS)))
+
+                fitted = result.get("fitted_impedance")
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO spectra (run_id, iteration, freqs, Z, fitted) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, iteration,
+                     np.asarray(result["freqs"], dtype=np.float64).tobytes(),
+                     np.asarray(result["Z"], dtype=np.complex128).tobytes(),
+                     None if fitted is None else np.asarray(fitted, dtype=np.complex128).tobytes()))
+
+    def _run_filter(self, cells=None, files=None, since=None, until=None, version=None, method=None,
+                    kk_exclude=None, warm_start=None):
+        clauses, values = [], []
+        if cells is not None:
+            clauses.append(f"runs.cell IN ({','.join('?' * len(cells))})")
+            values += list(cells)
+        if files is not None:
+            clauses.append(f"runs.file IN ({','.join('?' * len(files))})")
+            values += [os.path.abspath(f) for f in files]
+        if since is not None:
+            clauses.append("runs.tested_at >= ?")
+            values.append(timestamp(since))
+        if until is not None:
+            clauses.append("runs.tested_at < ?")
+            values.append(timestamp(until))
+        if version is not None:
+            clauses.append("runs.analysis_version = ?")
+            values.append(version)
+        if method is not None:
+            clauses.append("runs.method = ?")
+            values.append(method)
+        if kk_exclude is not None:
+            clauses.append("runs.kk_exclude = ?")
+            values.append(int(kk_exclude))
+        if warm_start is not None:
+            clauses.append("runs.warm_start = ?")
+            values.append(int(warm_start))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", values
+
+    def query(self, parameter, **filters):
+        """
+        One parameter against discharged energy, e.g. R_p vs mAh of all
+        cells tested since a date:
+
+            store.query("R_p", since="2026-09-01")
+
+        Filters: cells, files, since, until (see timestamp), version,
+        method, kk_exclude and warm_start.
+
+        Returns:
+            list: (cell, file, method, kk_exclude, warm_start, iteration,
+            energy, value) rows ordered by cell, test time, run and
+            energy.
+        """
+        if parameter not in PARAMETERS:
+            raise ValueError(f"Unknown parameter {parameter!r}, expected one of {PARAMETERS}")
+        where, values = self._run_filter(**filters)
+        return self.connection.execute(
+            "SELECT runs.cell, runs.file, runs.method, runs.kk_exclude, runs.warm_start, "
+            f"iterations.iteration, iterations.energy, iterations.{parameter} "
+            f"FROM runs JOIN iterations ON iterations.run_id = runs.id{where} "
+            "ORDER BY runs.cell, runs.tested_at, runs.id, iterations.energy", values).fetchall()
+
+    def spectrum(self, filename, iteration, version=None, method=None):
+        """
+        Stored spectrum of one iteration from the latest matching run.
+
+        Returns:
+            (np.ndarray, np.ndarray, np.ndarray): Frequencies, measured
+            and fitted impedance, or None if not stored.
+        """
+        where, values = self._run_filter(files=[filename], version=version, method=method)
+        row = self.connection.execute(
+            "SELECT spectra.freqs, spectra.Z, spectra.fitted FROM runs "
+            f"JOIN spectra ON spectra.run_id = runs.id{where} AND spectra.iteration = ? "
+            "ORDER BY runs.analysed_at DESC LIMIT 1", values + [int(iteration)]).fetchone()
+        if row is None:
+            return None
+        freqs, Z, fitted = row
+        return (np.frombuffer(freqs, dtype=np.float64), np.frombuffer(Z, dtype=np.complex128),
+                None if fitted is None else np.frombuffer(fitted, dtype=np.complex128))
+
+    def cells(self):
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT cell FROM runs ORDER BY cell")]
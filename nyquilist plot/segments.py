@@ -0,0 +1,67 @@
+import numpy as np
+
+
+# One row per contiguous run of samples with the same (iteration, frequency)
+SEGMENT_DTYPE = np.dtype([
+    ("iteration", np.float64),
+    ("freq", np.float64),
+    ("start", np.int64),
+    ("stop", np.int64),
+])
+
+
+def find_segments(iteration, freq):
+    """
+    Find runs of constant (iteration, frequency) in a log in one pass.
+    The firmware writes samples in order, so each EIS step and each
+    discharge block is one run.
+    """
+    n = len(iteration)
+    segments = np.empty(0, dtype=SEGMENT_DTYPE)
+    if n == 0:
+        return segments
+
+    changes = np.flatnonzero((np.diff(iteration) != 0) | (np.diff(freq) != 0)) + 1
+    starts = np.concatenate(([0], changes))
+    stops = np.concatenate((changes, [n]))
+
+    segments = np.empty(len(starts), dtype=SEGMENT_DTYPE)
+    segments["iteration"] = iteration[starts]
+    segments["freq"] = freq[starts]
+    segments["start"] = starts
+    segments["stop"] = stops
+    return segments
+
+
+def iteration_segments(segments, it):
+    return segments[segments["iteration"] == it]
+
+
+def frequency_groups(segments):
+    """
+    Group segments by frequency in ascending order.
+
+    Returns:
+        list: (frequency, segments) pairs, one pair per distinct frequency.
+    """
+    order = np.argsort(segments["freq"], kind='stable')
+    ordered = segments[order]
+    splits = np.flatnonzero(np.diff(ordered["freq"]) != 0) + 1
+    return [(group["freq"][0], group) for group in np.split(ordered, splits) if len(group)]
+
+
+def take(array, group, head=0, tail=0):
+    """
+    Samples of a segment group with `head` rows dropped from the start
+    and `tail` rows from the end. A single segment is returned as a
+    view, several segments of the same group are concatenated.
+    """
+    if len(group) == 1:
+        start, stop = group["start"][0], group["stop"][0]
+        return array[start + head:stop - tail]
+    indices = np.concatenate([np.arange(start, stop) for start, stop in zip(group["start"], group["stop"])])
+    return array[indices[head:len(indices) - tail]]
+
+
+def group_length(group):
+    return int(np.sum(group["stop"] - group["start"]))
@@ -0,0 +1,48 @@
+def parse_ranges(spec):
+    """
+    Parse a selection like "0-18,25,30-" into (low, high) pairs.
+    An open end is None. An empty spec selects everything.
+    """
+    ranges = []
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part[1:]:
+            split = part.index("-", 1)
+            low, high = part[:split], part[split + 1:]
+            ranges.append((float(low) if low else None, float(high) if high else None))
+        else:
+            ranges.append((float(part), float(part)))
+    return ranges
+
+
+def in_ranges(value, ranges):
+    if not ranges:
+        return True
+    for low, high in ranges:
+        if (low is None or value >= low) and (high is None or value <= high):
+            return True
+    return False
+
+
+class RangeSelector:
+    """
+    Callable iteration selector that keeps its ranges, so the loader
+    can skip the iterations it rejects (see loader.Selection).
+    """
+    def __init__(self, ranges):
+        self.ranges = ranges
+
+    def __call__(self, value):
+        return in_ranges(value, self.ranges)
+
+
+def range_selector(spec):
+    """
+    Iteration selector for pipeline.analyze_files from a range spec,
+    None when the spec selects everything.
+    """
+    ranges = parse_ranges(spec or "")
+    if not ranges:
+        return None
+    return RangeSelector(ranges)
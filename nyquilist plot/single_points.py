@@ -1,91 +1,179 @@
 import numpy as np
-from scipy.fft import fft, fftfreq
-from preprocess import preprocess_data, low_pass_filter
-from equivalent_circuit import equivalent_circuit_fit
-from plots import input_plot, fourier_plot
+import profiling
+from preprocess import preprocess_data, low_pass_filter_pair
+from equivalent_circuit import DEFAULT_CIRCUIT
+from segments import find_segments, iteration_segments, frequency_groups, take, group_length
+from demodulation import lockin_impedance, sine_fit_impedance, multisine_impedance
+from spectra import windowed_spectra
+from relaxation import REST_CURRENT
+from plotting import input_plot, fourier_plot
 
 
+METHODS = ("fft", "lockin", "sinefit")
 
-def extract_impedance_points(
+
+def eis_groups(groups):
+    """
+    EIS frequency groups used for the spectrum, skipping rests,
+    discharges and segments too short to analyse.
+    """
+    for f, group in groups:
+        if f > 0 and f < 1.6 and group_length(group) > 30:
+            yield f, group
+
+
+def multisine_groups(groups):
+    """
+    Multisine segments, logged by the firmware with the negated base
+    frequency, as (base frequency, segments) pairs.
+    """
+    for f, group in groups:
+        if f < 0 and group_length(group) > 30:
+            yield -f, group
+
+
+def segment_signals(time, voltage, current, group):
+    # Exclude first and last rows
+    t_seg = take(time, group, head=10, tail=1)
+    i_seg = take(current, group, head=10, tail=1)
+    v_seg = take(voltage, group, head=10, tail=1)
+    i_seg = i_seg - np.mean(i_seg)
+    v_seg = - v_seg + np.mean(v_seg)
+    return t_seg, v_seg, i_seg
+
+
+def filter_segment(t_seg, v_seg, i_seg, f):
+    with profiling.stage("resample"):
+        t_seg, v_seg, i_seg, sample_rate = preprocess_data(t_seg, v_seg, i_seg)
+
+    with profiling.stage("filter"):
+        v_seg, i_seg = low_pass_filter_pair(v_seg, i_seg, cutoff_freq=10*f, sample_rate=sample_rate)
+    return t_seg, v_seg, i_seg
+
+
+def nearest_bin_impedance(freqs_fft, V_fft, I_fft, f):
+    # Get index of closest FFT bin to target frequency
+    target_idx = np.argmin(np.abs(freqs_fft - f))
+    return V_fft[target_idx] / I_fft[target_idx]
+
+
+def impedance_spectrum(
         time, current, voltage, freq, energy, 
-        iteration, it, showInputPlot, showFourierPlot):
+        iteration, it, showInputPlot, showFourierPlot, segments=None,
+        method="fft", current_set=None):
+    """
+    Impedance spectrum of one iteration.
+
+    method selects the estimator: "fft" takes the nearest bin of a
+    windowed FFT, "lockin" demodulates at exactly f on the raw samples
+    and needs the logged set current (column 1) as phase reference,
+    "sinefit" fits a sinusoid at f plus offset and drift to the raw
+    samples, skipping the resampling and filtering of "fft".
+    Multisine segments are fitted jointly at all of their components
+    whatever the method, a single-frequency estimator would see the
+    other components as interference.
+
+    Returns:
+        (np.ndarray, np.ndarray, float, float): Frequencies, impedances,
+        energy discharged before the iteration and Vo.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}")
+    if method == "lockin" and current_set is None:
+        raise ValueError("Lock-in demodulation needs the current_set column")
     
     Z_list = []
     freq_list = []
+    fft_segments = []
+    fft_freqs = []
 
-    iteration_mask = iteration == it
-    iteration_indices = np.where(iteration_mask)[0]
-    time = time[iteration_indices]
-    current = current[iteration_indices]
-    voltage = voltage[iteration_indices]
-    freq = freq[iteration_indices]
-    energy = energy[iteration_indices]
+    # Contiguous (iteration, frequency) runs, built once per file by the caller
+    if segments is None:
+        segments = find_segments(iteration, freq)
+    it_segments = iteration_segments(segments, it)
+    groups = frequency_groups(it_segments)
 
     
-    Vo_mask = freq == 0
-    Vo_indices = np.where(Vo_mask)[0]
-    Vo_current = current[Vo_indices]
-    Vo_voltage = voltage[Vo_indices]
+    # Vo is the last low-current sample of the rests and discharges,
+    # see relaxation.py for the OCV fitted to the whole rest
     Vo = 0
-    for i, Vo_I in enumerate(Vo_current):
-        V_list = []
-        if Vo_I < 0.005:
-            V_list.append(Vo_voltage[i])
-        if len(V_list):
-            Vo = sum(V_list)/len(V_list)
-
-    unique_freqs = np.unique(freq)
-    for f in unique_freqs:
-
-        if f > 0 and f < 1.6:
-            # Mask rows for this frequency
-            mask = freq == f
-            indices = np.where(mask)[0]
-
-            # Exclude first and last rows
-            if len(indices) <= 30:
+    with profiling.stage("Vo"):
+        for f, group in groups:
+            if f != 0:
                 continue
-            idx_range = indices[10:-1]
+            low_current = np.flatnonzero(take(current, group) < REST_CURRENT)
+            if len(low_current):
+                Vo = take(voltage, group)[low_current[-1]]
 
-            t_seg = time[idx_range]
-            i_seg = current[idx_range] - np.mean(current[idx_range])
-            v_seg = - voltage[idx_range] + np.mean(voltage[idx_range])
+    for f0, group in multisine_groups(groups):
+        t_seg, v_seg, i_seg = segment_signals(time, voltage, current, group)
+        profiling.count("segments")
+        profiling.count("segment samples", len(t_seg))
 
-            t_seg, v_seg, i_seg, sample_rate = preprocess_data(t_seg, v_seg, i_seg)
+        if showInputPlot: input_plot(t_seg, v_seg, i_seg, f0)
 
-            v_seg = low_pass_filter(v_seg, cutoff_freq=10*f, sample_rate=sample_rate)
-            i_seg = low_pass_filter(i_seg, cutoff_freq=10*f, sample_rate=sample_rate)
+        i_set_seg = None if current_set is None else take(current_set, group, head=10, tail=1)
+        with profiling.stage("multisine"):
+            components, Z = multisine_impedance(t_seg, v_seg, i_seg, f0, i_set_seg)
+        Z_list.extend(Z)
+        freq_list.extend(components)
 
-            if showInputPlot: input_plot(t_seg, v_seg, i_seg, f)
-          
-            # Window to reduce leakage
-            window = np.hanning(len(t_seg))
-            i_seg *= window
-            v_seg *= window
+    for f, group in eis_groups(groups):
+
+        t_seg, v_seg, i_seg = segment_signals(time, voltage, current, group)
+        profiling.count("segments")
+        profiling.count("segment samples", len(t_seg))
 
-            # FFT
-            I_fft = fft(i_seg)
-            V_fft = fft(v_seg)
-            dt = np.mean(np.diff(t_seg))
-            freqs_fft = fftfreq(len(t_seg), dt)
+        if method == "lockin":
+            if showInputPlot: input_plot(t_seg, v_seg, i_seg, f)
 
+            i_set_seg = take(current_set, group, head=10, tail=1)
+            with profiling.stage("lockin"):
+                lockin = lockin_impedance(t_seg, v_seg, i_seg, i_set_seg, f)
+            if lockin is None:
+                continue
 
-            if showFourierPlot: fourier_plot(freqs_fft, V_fft, I_fft, f)
+            Z_list.append(lockin[0])
+            freq_list.append(f)
+            continue
 
-            # Get index of closest FFT bin to target frequency
-            target_idx = np.argmin(np.abs(freqs_fft - f))
-            Z = V_fft[target_idx] / I_fft[target_idx]
+        if method == "sinefit":
+            if showInputPlot: input_plot(t_seg, v_seg, i_seg, f)
 
-            Z_list.append(Z)
+            with profiling.stage("sinefit"):
+                Z_list.append(sine_fit_impedance(t_seg, v_seg, i_seg, f))
             freq_list.append(f)
+            continue
+
+        t_seg, v_seg, i_seg = filter_segment(t_seg, v_seg, i_seg, f)
+
+        if showInputPlot: input_plot(t_seg, v_seg, i_seg, f)
+
+        fft_segments.append((t_seg, v_seg, i_seg))
+        fft_freqs.append(f)
+
+    # Windowed FFT of all segments of the iteration at once
+    with profiling.stage("fft"):
+        fft_spectra = windowed_spectra(fft_segments)
+    for f, (freqs_fft, V_fft, I_fft) in zip(fft_freqs, fft_spectra):
+
+        if showFourierPlot: fourier_plot(freqs_fft, V_fft, I_fft, f)
 
-    impedance = np.array(Z_list)
-    freqs = np.array(freq_list)
+        Z_list.append(nearest_bin_impedance(freqs_fft, V_fft, I_fft, f))
+        freq_list.append(f)
 
-    R_s, R_p, C_p = equivalent_circuit_fit(freqs, impedance)
-    print(f"Fitted Circuit Parameters No.{int(it)}:\nVo = {Vo:.3f} V R_s = {R_s:.3f} Ω, R_p = {R_p:.3f} Ω, C_p = {C_p:.3e} F")
+    # A multisine and a stepped sweep in one iteration interleave
+    order = np.argsort(freq_list, kind='stable')
+    impedance = np.array(Z_list, dtype=complex)[order]
+    freqs = np.array(freq_list, dtype=float)[order]
 
+    return freqs, impedance, energy[it_segments["start"][0]], Vo
 
-    fitted_impedance = R_s + 1 / (1/R_p + 1j * 2 * np.pi * freqs * C_p)
 
-    return impedance, fitted_impedance, energy[0], Vo, R_s, R_p, C_p
+def print_parameters(it, Vo, params, circuit=DEFAULT_CIRCUIT):
+    if circuit is DEFAULT_CIRCUIT:
+        R_s, R_p, C_p = params
+        values = f"R_s = {R_s:.3f} Ω, R_p = {R_p:.3f} Ω, C_p = {C_p:.3e} F"
+    else:
+        values = ", ".join(f"{name} = {value:.4g}" for name, value in zip(circuit.parameters, params))
+    print(f"Fitted Circuit Parameters No.{int(it)}:\nVo = {Vo:.3f} V {values}")
@@ -0,0 +1,50 @@
+import numpy as np
+from functools import lru_cache
+from multiprocessing import parent_process
+from scipy.fft import rfft, rfftfreq
+
+
+@lru_cache(maxsize=64)
+def hann_window(n):
+    window = np.hanning(n)
+    window.setflags(write=False)
+    return window
+
+
+def windowed_spectra(segments, workers=None):
+    """
+    Hann-windowed real FFT of many segments. Segments of equal length
+    are stacked and transformed in one call, voltage and current together.
+
+    Parameters:
+        segments (list): (time, voltage, current) tuples on uniform grids.
+        workers (int): Threads used by scipy.fft, -1 uses all cores.
+            None uses all cores in the main process and one in pool
+            workers (pipeline, fleet), whose pool already fills the cores.
+
+    Returns:
+        list: (freqs_fft, V_fft, I_fft) per segment, in input order.
+    """
+    if workers is None:
+        workers = -1 if parent_process() is None else 1
+    spectra = [None] * len(segments)
+
+    by_length = {}
+    for k, (t_seg, _, _) in enumerate(segments):
+        by_length.setdefault(len(t_seg), []).append(k)
+
+    for n, members in by_length.items():
+        stacked = np.empty((2 * len(members), n))
+        for row, k in enumerate(members):
+            stacked[2 * row] = segments[k][1]
+            stacked[2 * row + 1] = segments[k][2]
+        stacked *= hann_window(n)
+
+        transformed = rfft(stacked, axis=-1, workers=workers)
+
+        for row, k in enumerate(members):
+            t_seg = segments[k][0]
+            dt = (t_seg[-1] - t_seg[0]) / (n - 1)
+            spectra[k] = rfftfreq(n, dt), transformed[2 * row], transformed[2 * row + 1]
+
+    return spectra
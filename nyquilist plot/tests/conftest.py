@@ -0,0 +1,17 @@
+import os
+import sys
+import pytest
+
+# The analysis modules import each other by name from the package
+# directory, the log generator lives in tools
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [PACKAGE, os.path.join(PACKAGE, "tools")]
+
+
+@pytest.fixture(scope="session")
+def synthetic_log(tmp_path_factory):
+    # Two iterations of a short program; the sidecar cache goes next to it
+    from synthetic_log import write_synthetic_log
+    filename = str(tmp_path_factory.mktemp("logs") / "000001.txt")
+    write_synthetic_log(filename, repetitions=2, eis_points=20, discharge_us=60_000_000)
+    return filename
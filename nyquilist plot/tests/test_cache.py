@@ -0,0 +1,55 @@
+import os
+import numpy as np
+import pytest
+
+import profiling
+from cache import load_cached, sidecar_path
+from fit_memo import FitMemo, memo_path
+from pipeline import analyze_files
+from selection import range_selector
+from synthetic_log import write_synthetic_log
+
+
+def write_log(directory, name="000001.txt"):
+    # A log with no sidecar yet
+    filename = str(directory / name)
+    write_synthetic_log(filename, repetitions=6, eis_points=8, discharge_us=30_000_000)
+    return filename
+
+
+@pytest.fixture
+def fresh_log(tmp_path):
+    return write_log(tmp_path)
+
+
+def test_fit_memo_survives_sidecar_writes(fresh_log):
+    memo = FitMemo(memo_path(fresh_log))
+    memo.put("key", [1.0, 2.0, 3.0])
+    memo.save()
+
+    load_cached(fresh_log)
+    assert os.path.isfile(os.path.join(sidecar_path(fresh_log), "meta.json"))
+    # The log grows, so the columns are stale and rewritten
+    with open(fresh_log, "a") as f:
+        f.write("999999,0,0,41000000,0,0,3\n")
+    load_cached(fresh_log)
+    np.testing.assert_array_equal(FitMemo(memo_path(fresh_log)).get("key"), [1.0, 2.0, 3.0])
+
+
+def test_partial_parse_is_shared_with_workers(tmp_path):
+    # Forked workers inherit the log the parent loaded last; the others
+    # (and all of them under spawn) come from the shared rows
+    logs = [write_log(tmp_path, "000001.txt"), write_log(tmp_path, "000002.txt")]
+    select = range_selector("1-2")
+    profiling.enable()
+    try:
+        parallel = analyze_files(logs, workers=2, select=select, memo=False, verbose=False)
+    finally:
+        profiler = profiling.disable()
+    assert profiler.timers["load: partial parse"][0] == len(logs)
+    assert not any(os.path.exists(os.path.join(sidecar_path(log), "meta.json")) for log in logs)
+
+    serial = analyze_files(logs, workers=1, select=select, memo=False, verbose=False)
+    assert [r["iteration"] for r in parallel] == [r["iteration"] for r in serial] == [1, 2, 1, 2]
+    for p, s in zip(parallel, serial):
+        np.testing.assert_allclose(p["Z"], s["Z"])
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from circuits import compile_circuit
+from equivalent_circuit import circuit_model
+
+FREQS = np.geomspace(1000, 0.01, 25)
+
+
+def test_default_topology_matches_circuit_model():
+    circuit = compile_circuit("R0-p(R1,C1)")
+    assert circuit.parameters == ("R0", "R1", "C1")
+    np.testing.assert_allclose(circuit(FREQS, [0.05, 0.03, 20.0]), circuit_model(FREQS, 0.05, 0.03, 20.0),
+                               rtol=1e-12)
+
+
+def test_elements():
+    omega = 2 * np.pi * FREQS
+    circuit = compile_circuit("R0-p(R1,CPE1)-W1-L1")
+    assert circuit.parameters == ("R0", "R1", "CPE1_Q", "CPE1_alpha", "W1", "L1")
+    params = [0.05, 0.03, 20.0, 0.9, 0.002, 1e-7]
+    cpe = 1 / (20.0 * (1j * omega) ** 0.9)
+    expected = 0.05 + 1 / (1 / 0.03 + 1 / cpe) + 0.002 * (1 - 1j) / np.sqrt(omega) + 1j * omega * 1e-7
+    np.testing.assert_allclose(circuit(FREQS, params), expected, rtol=1e-12)
+
+
+def test_jacobian_matches_finite_differences():
+    circuit = compile_circuit("R0-p(R1,CPE1)-p(R2,C2,L2)-W1")
+    params = np.array([0.05, 0.03, 20.0, 0.9, 0.01, 5.0, 1e-3, 0.002])
+    jacobian = circuit.jacobian(FREQS, params)
+    for k in range(len(circuit)):
+        step = np.zeros(len(params))
+        step[k] = 1e-6 * params[k]
+        numeric = (circuit(FREQS, params + step) - circuit(FREQS, params - step)) / (2 * step[k])
+        np.testing.assert_allclose(jacobian[:, k], numeric, rtol=1e-6, atol=1e-9 * np.abs(numeric).max())
+
+
+def test_parameter_batches_broadcast():
+    circuit = compile_circuit("R0-p(R1,C1)")
+    params = np.array([[0.05, 0.03, 20.0], [0.06, 0.02, 10.0]])
+    Z = circuit(FREQS, params)
+    assert Z.shape == (2, len(FREQS))
+    np.testing.assert_allclose(Z[1], circuit(FREQS, params[1]))
+    assert circuit.jacobian(FREQS, params).shape == (2, len(FREQS), 3)
+
+
+@pytest.mark.parametrize("description", ["R0-", "R0-p(R1)", "R0-p(R1,C1", "R0-X1", "R0-R0", "R0 C1", "p(R1,C1))"])
+def test_invalid_descriptions(description):
+    with pytest.raises(ValueError):
+        compile_circuit(description)
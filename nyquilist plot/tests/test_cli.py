@@ -0,0 +1,20 @@
+import csv
+import io
+
+import main
+from cache import sidecar_path
+from synthetic_log import write_synthetic_log
+
+
+def test_diagnostics_stay_out_of_stdout_output(tmp_path, capsys):
+    # A file where the sidecar directory belongs: neither the cache nor
+    # the fit memo can be written
+    log = str(tmp_path / "000001.txt")
+    write_synthetic_log(log, repetitions=2, eis_points=8, discharge_us=30_000_000)
+    open(sidecar_path(log), "w").close()
+
+    main.main([log, "--workers", "1"])
+    out, err = capsys.readouterr()
+    rows = list(csv.DictReader(io.StringIO(out)))
+    assert [int(row["iteration"]) for row in rows] == [0, 1]
+    assert "Cache not written" in err and "Fit memo not written" in err
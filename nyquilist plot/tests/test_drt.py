@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from scipy.optimize import nnls
+
+from drt import LAMBDAS, drt_batch, drt_kernel, solve_drt
+from equivalent_circuit import circuit_model
+
+FREQS = np.geomspace(1.5, 0.01, 20)
+
+
+def two_arc_spectra(count, seed=0):
+    rng = np.random.default_rng(seed)
+    spectra = []
+    for _ in range(count):
+        Z = (circuit_model(FREQS, 0.05, 0.03 * rng.uniform(0.5, 2), 20 * rng.uniform(0.5, 2))
+             + circuit_model(FREQS, 0, 0.01 * rng.uniform(0.5, 2), 500 * rng.uniform(0.3, 3)))
+        spectra.append(Z + rng.normal(0, 1e-4, len(FREQS)) + 1j * rng.normal(0, 1e-4, len(FREQS)))
+    return np.array(spectra)
+
+
+def test_solutions_match_nnls_across_lambdas():
+    spectra = two_arc_spectra(20)
+    kernel = drt_kernel(FREQS)
+    x, _ = solve_drt(kernel, spectra)
+    z = np.concatenate([spectra.real, spectra.imag], axis=1)
+    for l, lam in enumerate(LAMBDAS):
+        # Same problem as a non-negative least squares of the stacked system
+        regularization = np.sqrt(lam * kernel.scale) * kernel.penalty
+        design = np.vstack([kernel.matrix, regularization])
+
+        def objective(v, s):
+            return np.sum((kernel.matrix @ v - z[s]) ** 2) + lam * kernel.scale * np.sum(v[1:] ** 2)
+
+        for s in range(len(spectra)):
+            reference, _ = nnls(design, np.r_[z[s], np.zeros(len(regularization))], maxiter=10_000)
+            assert objective(x[l, s], s) <= objective(reference, s) * (1 + 1e-9)
+            np.testing.assert_allclose(x[l, s], reference, atol=1e-6 * np.abs(reference).max())
+
+
+def test_single_arc_is_recovered():
+    Z = circuit_model(FREQS, 0.05, 0.03, 20)
+    result = drt_batch([FREQS], [Z])[0]
+    assert result["R_inf"] == pytest.approx(0.05, rel=0.02)
+    assert result["R_pol"] == pytest.approx(0.03, rel=0.02)
+    # The peak sits at the arc's time constant R_p C_p
+    peak = result["taus"][np.argmax(result["gamma"])]
+    assert abs(np.log10(peak / 0.6)) < 0.15
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import equivalent_circuit
+from equivalent_circuit import (
+    circuit_model, equivalent_circuit_fit_batch, fit_spectra, get_circuit, warm_fit_batch, DEFAULT_CIRCUIT, INITIAL_GUESS)
+
+FREQS = np.geomspace(1.5, 0.01, 20)
+
+
+def run_of_spectra(count=8, seed=1):
+    # Slowly drifting cell as over the iterations of a discharge
+    rng = np.random.default_rng(seed)
+    truth = np.array([[0.05 + 0.001 * k, 0.03 + 0.001 * k, 20.0 - k] for k in range(count)])
+    spectra = [circuit_model(FREQS, *p) * (1 + rng.normal(0, 0.002, len(FREQS))) for p in truth]
+    return truth, spectra
+
+
+@pytest.mark.parametrize("poison", [
+    lambda Z: 0.05 + 1 / (2j * np.pi * FREQS * 20),  # contact lost: no R_p, fitted as R_p → ∞
+    lambda Z: -Z,                                      # leads swapped
+    lambda Z: np.zeros_like(Z),                        # no signal
+])
+@pytest.mark.parametrize("block", [1, 2, 3])
+def test_poisoned_iteration_does_not_stick(monkeypatch, poison, block):
+    # Blocks of 2 put the poisoned iteration first and of 3 last in its block
+    monkeypatch.setattr(equivalent_circuit, "WARM_BLOCK", block)
+    truth, spectra = run_of_spectra()
+    spectra[2] = poison(spectra[2])
+    warm = fit_spectra([FREQS] * len(spectra), spectra, warm_start=True)
+    cold = fit_spectra([FREQS] * len(spectra), spectra, warm_start=False)
+    np.testing.assert_allclose(warm[3:], cold[3:], rtol=1e-6)
+    np.testing.assert_allclose(warm[3:], truth[3:], rtol=0.02)
+
+
+def test_invalid_spectrum_does_not_seed(monkeypatch):
+    monkeypatch.setattr(equivalent_circuit, "WARM_BLOCK", 1)
+    truth, spectra = run_of_spectra(3)
+    params = fit_spectra([FREQS] * 3, spectra, warm_start=True, seed_valid=[True, False, True])
+    np.testing.assert_allclose(params, truth, rtol=0.02)
+
+
+def test_warm_fit_recovers_from_bad_seed():
+    truth, spectra = run_of_spectra(2)
+    params, usable = warm_fit_batch([FREQS] * 2, spectra, np.array([0.05, 1e17, 20.0]))
+    assert usable.all()
+    np.testing.assert_allclose(params, truth, rtol=0.02)
+    _, usable = warm_fit_batch([FREQS], [np.zeros(len(FREQS), dtype=complex)], INITIAL_GUESS)
+    assert not usable.any()
+
+
+def test_default_description_keeps_the_named_parameters():
+    assert get_circuit() is DEFAULT_CIRCUIT
+    assert get_circuit("R0 - p(R1, C1)") is DEFAULT_CIRCUIT
+    assert get_circuit("R0-p(R1,CPE1)").parameters == ("R0", "R1", "CPE1_Q", "CPE1_alpha")
+    truth, spectra = run_of_spectra(1)
+    np.testing.assert_allclose(DEFAULT_CIRCUIT.impedance(FREQS, truth[0]), circuit_model(FREQS, *truth[0]), rtol=1e-12)
+
+
+def test_batch_fits_spectra_of_any_length():
+    truth, spectra = run_of_spectra(4)
+    # Iterations that lost points are padded with zero weight
+    frequencies = [FREQS, FREQS[:15], FREQS[3:], FREQS[::2]]
+    impedances = [spectra[0], spectra[1][:15], spectra[2][3:], spectra[3][::2]]
+    batch = equivalent_circuit_fit_batch(frequencies, impedances)
+    np.testing.assert_allclose(batch, truth, rtol=0.02)
+    for params, f, Z in zip(batch, frequencies, impedances):
+        np.testing.assert_allclose(params, equivalent_circuit_fit_batch([f], [Z])[0], rtol=1e-6)
+
+
+def test_batch_fits_other_circuits():
+    circuit = get_circuit("R0-p(R1,CPE1)")
+    truth = np.array([[0.05, 0.03, 20.0, 0.85], [0.06, 0.02, 10.0, 0.95]])
+    params, converged = equivalent_circuit_fit_batch(
+        [FREQS] * 2, list(circuit(FREQS, truth)), circuit=circuit, full_output=True)
+    assert converged.all()
+    np.testing.assert_allclose(params, truth, rtol=1e-4)
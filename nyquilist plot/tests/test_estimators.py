@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from demodulation import lockin_phasors, sine_fit_phasors
+from equivalent_circuit import circuit_model
+from pipeline import analyze_files
+from single_points import METHODS
+
+# The cell of tools/synthetic_log.py
+TRUTH = (0.05, 0.03, 20.0)
+
+
+@pytest.fixture(scope="module")
+def spectra(synthetic_log):
+    return {method: analyze_files([synthetic_log], method=method, memo=False, verbose=False)
+            for method in METHODS}
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_estimators_recover_the_cell(spectra, method):
+    for result in spectra[method]:
+        Z = circuit_model(result["freqs"], *TRUTH)
+        assert np.max(np.abs(result["Z"] - Z) / np.abs(Z)) < 0.015
+        np.testing.assert_allclose([result["R_s"], result["R_p"], result["C_p"]], TRUTH, rtol=0.02)
+
+
+def test_estimators_agree(spectra):
+    reference = spectra["sinefit"]
+    for method in METHODS:
+        for result, expected in zip(spectra[method], reference):
+            np.testing.assert_array_equal(result["freqs"], expected["freqs"])
+            assert np.max(np.abs(result["Z"] - expected["Z"]) / np.abs(expected["Z"])) < 0.02
+
+
+def test_phasors_of_a_clean_sine():
+    # Uneven timestamps as logged, 2.5 periods on a drifting offset
+    rng = np.random.default_rng(0)
+    f = 0.2
+    time = np.concatenate([[0.0], np.sort(rng.uniform(0, 2.5 / f, 2000))])
+    signal = 0.7 * np.cos(2 * np.pi * f * time - 0.4) + 3.0 + 0.01 * time
+    expected = 0.7 * np.exp(-0.4j)
+    np.testing.assert_allclose(sine_fit_phasors(time, f, signal)[0], expected, rtol=1e-9)
+    # The Hann taper suppresses most of the drift, not all
+    np.testing.assert_allclose(lockin_phasors(time, f, signal)[0], expected, rtol=1e-2)
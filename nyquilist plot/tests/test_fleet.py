@@ -0,0 +1,44 @@
+import numpy as np
+
+import main
+from fleet import FleetAggregate, FLEET_FREQUENCIES, FLEET_PARAMETERS, fleet_grid
+from pipeline import analyze_files
+from results_store import ResultStore
+
+
+def summary(cell, params, Z):
+    grid = fleet_grid(step=1000.0, stop=2000.0)
+    return {"cell": cell, "file": cell + ".txt", "capacity": 2000.0,
+            "params": np.full((len(grid), len(FLEET_PARAMETERS)), params),
+            "spectra": np.full((len(grid), len(FLEET_FREQUENCIES)), Z)}
+
+
+def test_parameters_keep_full_precision():
+    fleet = FleetAggregate(fleet_grid(step=1000.0, stop=2000.0))
+    fleet.add(summary("a", 0.0312345678901, 0.05 - 0.01j))
+    rows = [r for r in fleet.statistics() if r["parameter"] == "R_s"]
+    assert rows[0]["median"] == 0.0312345678901
+
+
+def test_spectrum_rows():
+    fleet = FleetAggregate(fleet_grid(step=1000.0, stop=2000.0))
+    fleet.add(summary("a", 0.03, 0.05 - 0.01j))
+    fleet.add(summary("b", 0.03, 0.07 - 0.03j))
+    rows = fleet.spectrum_rows()
+    assert len(rows) == 3 * len(FLEET_FREQUENCIES)
+    row = rows[0]
+    assert row["count"] == 2
+    assert np.isclose(row["Z_real"], 0.06) and np.isclose(row["Z_imag"], -0.02)
+    # |Z - mean| is 0.01·√2 for both cells
+    assert np.isclose(row["Z_std"], 0.02)
+
+
+def test_fit_options_reach_cells_and_store(synthetic_log, tmp_path):
+    store = str(tmp_path / "store.db")
+    main.main([synthetic_log, "--fleet", "--store", store, "--no-warm-start", "--kk-exclude", "--no-memo",
+               "--quiet", "--workers", "1", "--output", str(tmp_path / "fleet.csv")])
+    expected = analyze_files([synthetic_log], memo=False, verbose=False, warm_start=False, kk_exclude=True)
+    with ResultStore(store) as results:
+        rows = results.query("R_p")
+    assert [row[3:5] for row in rows] == [(1, 0)] * len(expected)
+    np.testing.assert_allclose([row[7] for row in rows], [r["R_p"] for r in expected], rtol=1e-9)
@@ -0,0 +1,50 @@
+import csv
+import numpy as np
+
+from equivalent_circuit import get_circuit
+from follow import LogFollower
+from output import ResultWriter, output_fields
+from pipeline import analyze_files
+
+
+def test_follow_matches_batch_options(synthetic_log):
+    options = dict(warm_start=False, kk_exclude=True, bootstrap=20)
+    followed = LogFollower(synthetic_log, verbose=False, **options)
+    results = followed.poll() + followed.flush()
+    expected = analyze_files([synthetic_log], memo=False, verbose=False, **options)
+
+    assert [r["iteration"] for r in results] == [r["iteration"] for r in expected]
+    for result, batch in zip(results, expected):
+        np.testing.assert_allclose([result[name] for name in ("R_s", "R_p", "C_p")],
+                                   [batch[name] for name in ("R_s", "R_p", "C_p")], rtol=1e-6)
+        for name in ("R_s", "R_p", "C_p"):
+            assert result[name + "_low"] <= result[name] <= result[name + "_high"]
+
+
+def test_writer_header_is_fixed_up_front(tmp_path):
+    path = str(tmp_path / "results.csv")
+    writer = ResultWriter(path, fields=output_fields(intervals=True))
+    # The first result lacks the Kramers-Kronig results, the next has them
+    writer.write([{"file": "log", "iteration": 0, "energy": 0.0, "Vo": 3.7, "R_s": 0.01, "R_p": 0.02, "C_p": 1.0}])
+    writer.write([{"file": "log", "iteration": 1, "energy": 1.0, "Vo": 3.6, "R_s": 0.01, "R_p": 0.02, "C_p": 1.0,
+                   "kk_rms": 0.001, "kk_valid": True}])
+    writer.close()
+
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert tuple(rows[0]) == output_fields(intervals=True)
+    assert rows[0]["kk_valid"] == "" and rows[1]["kk_valid"] == "True"
+
+
+def test_follow_fits_the_chosen_circuit(synthetic_log):
+    circuit = get_circuit("R0-p(R1,CPE1)")
+    followed = LogFollower(synthetic_log, verbose=False, circuit=circuit)
+    results = followed.poll() + followed.flush()
+    expected = analyze_files([synthetic_log], memo=False, verbose=False, circuit=circuit)
+
+    for result, batch in zip(results, expected):
+        assert "R_p" not in result
+        np.testing.assert_allclose([result[name] for name in circuit.parameters],
+                                   [batch[name] for name in circuit.parameters], rtol=1e-6)
+        # The synthetic cell is an ideal capacitor in parallel with R_p
+        np.testing.assert_allclose([result["R0"], result["R1"], result["CPE1_alpha"]], [0.05, 0.03, 1.0], rtol=0.03)
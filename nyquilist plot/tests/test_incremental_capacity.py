@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from incremental_capacity import IncrementalCapacity, peak_rows
+
+# Discharged charge Q(V) in mAh: two logistic plateaus (V, mAh, width V) on a linear slope
+PLATEAUS = ((3.7, 1000.0, 0.02), (3.45, 800.0, 0.02))
+SLOPE = 200.0
+CURRENT, RATE, REST_S = 1.0, 2.0, 60.0
+
+
+def charge(voltage):
+    return sum(c / (1 + np.exp((voltage - v) / w)) for v, c, w in PLATEAUS) + SLOPE * (4.2 - voltage)
+
+
+@pytest.fixture(scope="module")
+def discharge():
+    # A rest, then a CC discharge from 4.2 V to 3.0 V sampled evenly in time
+    fine = np.linspace(4.2, 3.0, 200_001)
+    Q = charge(fine)
+    t = np.arange(0, (Q[-1] - Q[0]) * 3.6 / CURRENT, 1 / RATE)
+    energy = t * CURRENT / 3.6
+    rest = np.arange(-REST_S, 0, 1 / RATE)
+    return {"time": np.concatenate([rest, t]),
+            "current": np.concatenate([np.zeros(len(rest)), np.full(len(t), CURRENT)]),
+            "voltage": np.concatenate([np.full(len(rest), 4.25), np.interp(Q[0] + energy, Q, fine)]),
+            "freq": np.zeros(len(rest) + len(t)),
+            "energy": np.concatenate([np.zeros(len(rest)), energy])}
+
+
+def streamed(discharge, bounds):
+    analysis = IncrementalCapacity()
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        analysis.add(*(discharge[name][start:stop] for name in ("time", "current", "voltage", "freq", "energy")))
+    return analysis
+
+
+def test_dqdv_of_a_cc_discharge(discharge):
+    rows = len(discharge["time"])
+    analysis = streamed(discharge, [0, rows])
+    centres, dqdv = analysis.dqdv()
+    filled = np.isfinite(dqdv)
+    assert centres[filled].min() < 3.01 and centres[filled].max() > 4.1
+    # A bin holds the charge between its edges over its width
+    half = analysis.voltage_step / 2
+    expected = (charge(centres - half) - charge(centres + half)) / analysis.voltage_step
+    np.testing.assert_allclose(dqdv[filled], expected[filled], rtol=5e-3)
+
+    # Chunks of 997 rows, and a boundary in the middle of the 3.7 V plateau
+    middle = np.searchsorted(-discharge["voltage"], -3.7)
+    for bounds in ([*range(0, rows, 997), rows], [0, middle - 1, middle, middle + 1, rows]):
+        chunked = streamed(discharge, bounds)
+        np.testing.assert_allclose(chunked.dqdv()[1], dqdv, rtol=1e-12, equal_nan=True)
+        np.testing.assert_allclose(chunked.dvdq()[1], analysis.dvdq()[1], rtol=1e-12, equal_nan=True)
+
+
+def test_peaks_at_the_plateaus(discharge):
+    rows = peak_rows("cell", streamed(discharge, [0, len(discharge["time"])]))
+    plateaus = [row for row in rows if row["curve"] == "dQ/dV"]
+    assert [row["unit"] for row in plateaus] == ["V", "V"]
+    step = IncrementalCapacity().voltage_step
+    np.testing.assert_allclose(sorted(row["position"] for row in plateaus), [3.45, 3.7], atol=step)
+    # The steep stretch between the plateaus is the first dV/dQ peak
+    transitions = [row["position"] for row in rows if row["curve"] == "dV/dQ"]
+    between = charge(np.array([3.65, 3.5]))
+    assert between[0] < transitions[0] < between[1]
@@ -0,0 +1,36 @@
+import numpy as np
+
+from circuits import compile_circuit
+from equivalent_circuit import circuit_model
+from kramers_kronig import kramers_kronig_batch
+
+FREQS = np.geomspace(1.5, 0.01, 20)
+
+
+def test_causal_spectra_pass():
+    rng = np.random.default_rng(0)
+    spectra = [circuit_model(FREQS, 0.05, 0.03, 20.0) * (1 + rng.normal(0, 1e-3, len(FREQS))),
+               compile_circuit("R0-p(R1,CPE1)")(FREQS, [0.05, 0.03, 20.0, 0.8])]
+    for test in kramers_kronig_batch([FREQS] * 2, spectra):
+        assert test["valid"] and test["point_valid"].all()
+        assert test["rms"] < 0.005
+
+
+def test_drift_and_glitches_fail():
+    Z = circuit_model(FREQS, 0.05, 0.03, 20.0)
+    # The cell relaxes during the sweep, which runs from high to low f
+    drifted = Z + 0.02 * np.linspace(0, 1, len(FREQS)) ** 2
+    glitched = Z.copy()
+    glitched[7] *= 1.1
+    drift, glitch = kramers_kronig_batch([FREQS] * 2, [drifted, glitched])
+    assert not drift["valid"]
+    assert not glitch["point_valid"][7]
+
+
+def test_grids_are_tested_apart():
+    Z = circuit_model(FREQS, 0.05, 0.03, 20.0)
+    tests = kramers_kronig_batch([FREQS, FREQS[:12], FREQS[:3], []], [Z, Z[:12], Z[:3], []])
+    assert tests[0]["valid"] and tests[1]["valid"]
+    assert len(tests[1]["residual"]) == 12
+    # Fewer points than basis elements cannot be tested
+    assert tests[2] is None and tests[3] is None
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import loader
+from loader import COLUMNS, HEADER_ROWS, SCALE, Selection, load_columns
+from synthetic_log import write_synthetic_log
+
+
+@pytest.fixture(scope="module")
+def mixed_log(tmp_path_factory):
+    # Iteration 1 swept as a multisine, which is logged with freq = -f0
+    filename = str(tmp_path_factory.mktemp("loader") / "000001.txt")
+    write_synthetic_log(filename, repetitions=4, eis_points=6, discharge_us=20_000_000)
+    with open(filename) as f:
+        lines = f.readlines()
+    for k in range(HEADER_ROWS, len(lines)):
+        fields = lines[k].split(",")
+        if int(fields[-1]) == 1 and float(fields[4]) > 0:
+            fields[4] = " -0.050000"
+            lines[k] = ",".join(fields)
+    with open(filename, "w") as f:
+        f.writelines(lines)
+    return filename
+
+
+def reference(filename):
+    data = np.loadtxt(filename, delimiter=",", skiprows=HEADER_ROWS)
+    return {name: data[:, k] * SCALE[name] for k, name in enumerate(COLUMNS)}
+
+
+@pytest.mark.parametrize("selection, keep", [
+    (None, lambda d: np.ones(len(d["iteration"]), dtype=bool)),
+    (Selection([(1, 1)]), lambda d: d["iteration"] == 1),
+    (Selection([(0, 0), (2, None)]), lambda d: d["iteration"] != 1),
+    (Selection([(1, 2)], freq=(None, 0)), lambda d: (d["iteration"] >= 1) & (d["iteration"] <= 2) & (d["freq"] < 0)),
+    (Selection(freq=(0.01, None)), lambda d: d["freq"] >= 0.01),
+])
+def test_matches_loadtxt(mixed_log, monkeypatch, selection, keep):
+    # Small chunks and search blocks, so both cut through iterations
+    monkeypatch.setattr(loader, "SEARCH_BLOCK", 512)
+    expected = reference(mixed_log)
+    rows = keep(expected)
+    assert rows.any() and (selection is None or not rows.all())
+    for workers in (1, 3):
+        data = load_columns(mixed_log, ("freq", "current_set", "iteration", "time"), workers=workers,
+                            chunk_size=4096, selection=selection)
+        for name in data:
+            np.testing.assert_array_equal(data[name], expected[name][rows])
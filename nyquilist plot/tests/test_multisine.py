@@ -0,0 +1,142 @@
+import json
+import math
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+from demodulation import multisine_components, multisine_impedance
+from equivalent_circuit import circuit_model
+from pipeline import load_log, required_columns
+from single_points import impedance_spectrum
+from synthetic_log import LINE_FORMAT
+
+FIRMWARE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                        "Battery Analyzer")
+
+R_S, R_P, C_P = 0.05, 0.03, 20.0
+
+
+@pytest.fixture(scope="module")
+def firmware_waveform():
+    # Harmonics and phases exactly as discharge_control computes them for
+    # the settings.py example eis_multisine(self, 200, 0.05, 50, 20, 2).
+    # run_host patches time and gc and the firmware has its own main and
+    # settings modules, so it runs in a separate interpreter
+    script = ("import json, sys; sys.path[:0] = sys.argv[1:]; import run_host; run_host.install(1.0); "
+              "import discharge_control; print(json.dumps(discharge_control.multisine_waveform(0.05, 50, 20)))")
+    output = subprocess.run([sys.executable, "-c", script, os.path.join(FIRMWARE, "host"), FIRMWARE],
+                            capture_output=True, text=True, check=True, cwd=FIRMWARE).stdout
+    harmonics, phases, peak = json.loads(output.splitlines()[-1])
+    return 0.05, np.array(harmonics), np.array(phases), 200 * 0.5 / (peak * 1.02)
+
+
+def emulated_segment(f0, harmonics, phases, scale, periods=2, sample_rate=1070.0, flush_every=8000,
+                     flush_time=1.0, seed=0):
+    """
+    Logged multisine rows the way eis_multisine wrote them before the
+    flushes were moved out of the excitation: one row per ADC read with
+    jitter, and every flush_every rows the DAC held for flush_time.
+    """
+    rng = np.random.default_rng(seed)
+    duration = periods / f0
+    t, now, rows = [], 0.0, 0
+    while now < duration:
+        t.append(now)
+        rows += 1
+        now += (1 + rng.uniform(-0.2, 0.2)) / sample_rate
+        if rows % flush_every == 0:
+            now += flush_time
+    return cell_response(np.array(t), f0, harmonics, phases, scale, rng)
+
+
+def grid_segment(f0, harmonics, phases, scale, periods=2, buffer_size=8000, loop_time=300e-6, seed=0):
+    """
+    Logged multisine rows the way eis_multisine writes them now: the
+    excitation fits the buffer, and a row is logged at the first ADC read
+    at or after each point of a grid of buffer_size - 1 intervals.
+    """
+    rng = np.random.default_rng(seed)
+    time_us = periods * 1_000_000 / f0
+    log_interval = time_us // (buffer_size - 1) + 1
+    grid = np.arange(0, time_us, log_interval) * 1e-6
+    return cell_response(grid + rng.uniform(0, loop_time, len(grid)), f0, harmonics, phases, scale, rng)
+
+
+def cell_response(t, f0, harmonics, phases, scale, rng):
+    """
+    Set current, measured current and voltage change in mA and mV at
+    times t of a cell Rs + (Rp||Cp) driven by the held DAC current.
+    """
+    # Settle period before logging, so the RC branch starts in steady state
+    i_set = 100 + scale * np.sin(2 * np.pi * f0 * np.outer(t, harmonics) + phases).sum(axis=1)
+
+    tau = R_P * C_P
+    settle = np.linspace(-1 / f0, 0, 20000, endpoint=False)
+    v_rc = 0.0
+    for i in 100 + scale * np.sin(2 * np.pi * f0 * np.outer(settle, harmonics) + phases).sum(axis=1):
+        v_rc = R_P * i + (v_rc - R_P * i) * math.exp(-(1 / f0 / 20000) / tau)
+    voltage = np.empty(len(t))
+    for k in range(len(t)):
+        voltage[k] = -R_S * i_set[k] - v_rc
+        if k + 1 < len(t):
+            steady = R_P * i_set[k]
+            v_rc = steady + (v_rc - steady) * math.exp(-(t[k + 1] - t[k]) / tau)
+
+    current = i_set + rng.normal(0, 0.05, len(t))
+    voltage = voltage + rng.normal(0, 0.02, len(t)) * 1e-3
+    return t, voltage, current, i_set
+
+
+@pytest.mark.parametrize("use_set", [True, False])
+def test_components_match_firmware_harmonics(firmware_waveform, use_set):
+    f0, harmonics, phases, scale = firmware_waveform
+    t, voltage, current, i_set = emulated_segment(f0, harmonics, phases, scale)
+    found = multisine_components(t, i_set if use_set else current, f0)
+    np.testing.assert_allclose(found, harmonics * f0)
+
+
+def test_impedance_of_emulated_log(firmware_waveform):
+    # No flushes: a held DAC is an excitation the model does not know
+    f0, harmonics, phases, scale = firmware_waveform
+    t, voltage, current, i_set = emulated_segment(f0, harmonics, phases, scale, flush_every=10 ** 9)
+    # Signs as single_points.segment_signals passes them
+    freqs, Z = multisine_impedance(t, -(voltage - voltage.mean()), current - current.mean(), f0, i_set)
+    np.testing.assert_allclose(freqs, harmonics * f0)
+    truth = circuit_model(freqs, R_S, R_P, C_P)
+    assert np.max(np.abs(Z - truth) / np.abs(truth)) < 0.01
+
+
+def test_partial_last_period_is_used(firmware_waveform):
+    # segment_signals drops rows at both ends, so the segment is just
+    # short of two periods; both must still be analysed
+    f0, harmonics, phases, scale = firmware_waveform
+    t, voltage, current, i_set = emulated_segment(f0, harmonics, phases, scale, flush_every=10 ** 9)
+    keep = slice(10, -1)
+    np.testing.assert_allclose(multisine_components(t[keep], i_set[keep], f0), harmonics * f0)
+
+
+def test_impedance_spectrum_of_time_grid_log(firmware_waveform, tmp_path):
+    # A rest, then the multisine as logged now, written and parsed as a log
+    f0, harmonics, phases, scale = firmware_waveform
+    t, voltage, current, i_set = grid_segment(f0, harmonics, phases, scale)
+    filename = str(tmp_path / "000001.txt")
+    lines = ["Time [ms], I set[mA], I meas[mA], U meas[mV], f[Hz], E [mAh], i\n", "multisine\n"]
+    for rest in np.arange(0, 5, 0.1):
+        lines.append(LINE_FORMAT % (1e3 * rest, 0, 0, 3700, 0, 0, 0) + "\n")
+    for row in zip(1e3 * (t + 10), i_set, current, 3700 + voltage):
+        lines.append(LINE_FORMAT % (*row, -f0, 0, 0) + "\n")
+    with open(filename, "w") as f:
+        f.writelines(lines)
+
+    _, segments = load_log(filename)
+    assert "current_set" not in required_columns("fft")
+    assert "current_set" in required_columns("fft", segments)
+    data, segments = load_log(filename, required_columns("fft", segments))
+    freqs, Z, _, Vo = impedance_spectrum(data["time"], data["current"], data["voltage"], data["freq"],
+                                         data["energy"], data["iteration"], 0, False, False, segments,
+                                         current_set=data["current_set"])
+    np.testing.assert_allclose(freqs, harmonics * f0)
+    assert Vo == pytest.approx(3.7)
+    np.testing.assert_allclose(np.abs(Z), np.abs(circuit_model(freqs, R_S, R_P, C_P)), rtol=0.01)
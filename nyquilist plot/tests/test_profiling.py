@@ -0,0 +1,18 @@
+import subprocess
+import sys
+
+from conftest import PACKAGE
+
+
+def test_lazy_imports_are_not_charged_to_stages():
+    # A fresh interpreter, as scipy.signal is loaded here already
+    script = (
+        "import profiling\n"
+        "from preprocess import low_pass_filter_pair\n"
+        "import numpy as np\n"
+        "profiling.enable()\n"
+        "with profiling.stage('filter'):\n"
+        "    low_pass_filter_pair(np.zeros(100), np.zeros(100), 1.0, 100.0)\n"
+        "stages = {s['stage']: s['seconds'] for s in profiling.disable().report()['stages']}\n"
+        "assert 'import' in stages and stages['filter'] < stages['import'], stages\n")
+    subprocess.run([sys.executable, "-c", script], cwd=PACKAGE, check=True)
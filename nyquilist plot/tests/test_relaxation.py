@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from pipeline import ocv_tables
+from relaxation import binned_rests, fit_relaxation
+from synthetic_log import LINE_FORMAT
+
+# Two relaxation terms of a rest after discharge: OCV - a·exp(-t/τ)
+OCVS = (4.0, 3.8)
+AMPLITUDES = (-0.05, -0.03)
+TAUS = (5.0, 40.0)
+REST_S, DISCHARGE_S, RATE = 200.0, 100.0, 10.0
+
+
+def relaxation(t, ocv):
+    return ocv + sum(a * np.exp(-t / tau) for a, tau in zip(AMPLITUDES, TAUS))
+
+
+def test_fit_recovers_ocv_and_time_constants():
+    t_rest = np.arange(0, REST_S, 1 / RATE)
+    time = np.concatenate([t_rest, REST_S + 50 + t_rest])
+    voltage = np.concatenate([relaxation(t_rest, ocv) for ocv in OCVS])
+    starts, stops = np.array([0, len(t_rest)]), np.array([len(t_rest), 2 * len(t_rest)])
+
+    ocv, amplitudes, taus, rms = fit_relaxation(*binned_rests(time, voltage, starts, stops))
+    np.testing.assert_allclose(ocv, OCVS, atol=1e-5)
+    np.testing.assert_allclose(taus, [TAUS] * 2, rtol=1e-3)
+    np.testing.assert_allclose(amplitudes, [AMPLITUDES] * 2, rtol=1e-3)
+    assert np.all(rms < 1e-5)
+
+
+@pytest.fixture
+def rest_log(tmp_path):
+    # Per iteration a rest, then a 1 A discharge; I set, I and freq are
+    # logged as the firmware does, in mA and mV
+    filename = str(tmp_path / "000001.txt")
+    lines = ["Time [ms], I set[mA], I meas[mA], U meas[mV], f[Hz], E [mAh], i\n", "rests\n"]
+    t0, energy = 0.0, 0.0
+    for iteration, ocv in enumerate(OCVS):
+        for t in np.arange(0, REST_S, 1 / RATE):
+            lines.append(LINE_FORMAT % (1e3 * (t0 + t), 0, 0, 1e3 * relaxation(t, ocv), 0, energy, iteration) + "\n")
+        t0 += REST_S
+        for t in np.arange(0, DISCHARGE_S, 1 / RATE):
+            lines.append(LINE_FORMAT % (1e3 * (t0 + t), 1000, 1000, 1e3 * (ocv - 0.1), 0,
+                                        energy + t / 3.6, iteration) + "\n")
+        t0 += DISCHARGE_S
+        energy += DISCHARGE_S / 3.6
+    with open(filename, "w") as f:
+        f.writelines(lines)
+    return filename
+
+
+def test_ocv_table_rows(rest_log):
+    rows = ocv_tables([rest_log], workers=1)
+    assert [row["iteration"] for row in rows] == [0, 1]
+    capacity = 2 * DISCHARGE_S / 3.6 - 0.1 / 3.6
+    for row, ocv, energy in zip(rows, OCVS, (0.0, DISCHARGE_S / 3.6)):
+        assert row["file"] == rest_log
+        assert row["energy"] == pytest.approx(energy, abs=1e-6)
+        assert row["soc"] == pytest.approx(100 * (1 - energy / capacity), rel=1e-6)
+        assert row["last_voltage"] == pytest.approx(relaxation(REST_S - 1 / RATE, ocv), abs=1e-4)
+        assert row["ocv"] == pytest.approx(ocv, abs=2e-4)
+        assert [row["tau_1"], row["tau_2"]] == pytest.approx(TAUS, rel=0.02)
+        assert row["relaxed"] == pytest.approx(1 - np.exp(-(REST_S - 1 / RATE) / row["tau_2"]))
@@ -0,0 +1,38 @@
+import numpy as np
+
+from results_store import ResultStore
+
+
+def result(filename, iteration, R_p=0.02):
+    return {"file": filename, "iteration": iteration, "energy": 100.0 * iteration, "Vo": 3.7,
+            "R_s": 0.01, "R_p": R_p, "C_p": 1.0, "freqs": np.array([1.0, 10.0]),
+            "Z": np.array([0.03 - 0.01j, 0.011 - 0.001j]), "fitted_impedance": None}
+
+
+def test_rewritten_run_drops_stale_iterations(tmp_path):
+    log = str(tmp_path / "cell.txt")
+    with ResultStore(str(tmp_path / "store.db")) as store:
+        store.write([result(log, k) for k in range(3)], "fft", "R_s + R_p||C_p", 1)
+
+    # A narrower re-analysis replaces the run; later writes of the same
+    # session, as in follow mode, add to it
+    with ResultStore(str(tmp_path / "store.db")) as store:
+        store.write([result(log, 0, R_p=0.03)], "fft", "R_s + R_p||C_p", 1)
+        store.write([result(log, 1, R_p=0.03)], "fft", "R_s + R_p||C_p", 1)
+        rows = store.query("R_p")
+        assert [(row[5], row[7]) for row in rows] == [(0, 0.03), (1, 0.03)]
+        assert store.spectrum(log, 2) is None
+
+
+def test_fit_options_are_separate_runs(tmp_path):
+    log = str(tmp_path / "cell.txt")
+    with ResultStore(str(tmp_path / "store.db")) as store:
+        store.write([result(log, 0)], "fft", "R_s + R_p||C_p", 1)
+        store.write([result(log, 0, R_p=0.03)], "fft", "R_s + R_p||C_p", 1, kk_exclude=True)
+        store.write([result(log, 0, R_p=0.04)], "lockin", "R_s + R_p||C_p", 1, warm_start=False)
+
+        rows = store.query("R_p")
+        assert sorted((row[2], row[3], row[4], row[7]) for row in rows) == [
+            ("fft", 0, 1, 0.02), ("fft", 1, 1, 0.03), ("lockin", 0, 0, 0.04)]
+        assert [row[7] for row in store.query("R_p", kk_exclude=True)] == [0.03]
+
@@ -0,0 +1,25 @@
+import numpy as np
+from scipy.signal import butter, sosfiltfilt
+
+from preprocess import low_pass_filter, preprocess_data
+from single_points import filter_segment
+
+
+def test_filter_segment_matches_per_signal_filtering():
+    # Two segments, the longer first, so the second reuses part of the buffer
+    rng = np.random.default_rng(0)
+    for f, n in ((0.5, 5000), (2.0, 1200)):
+        t = np.sort(rng.uniform(0, 4 / f, n))
+        v = 3.7 + 0.01 * np.sin(2 * np.pi * f * t) + rng.normal(0, 1e-3, n)
+        i = 1.0 + 0.2 * np.sin(2 * np.pi * f * t) + rng.normal(0, 1e-2, n)
+
+        t_seg, v_seg, i_seg = filter_segment(t, v, i, f)
+        t_ref, v_ref, i_ref, sample_rate = preprocess_data(t, v, i)
+        np.testing.assert_array_equal(t_seg, t_ref)
+        np.testing.assert_allclose(v_seg, low_pass_filter(v_ref, 10 * f, sample_rate), rtol=1e-12)
+        np.testing.assert_allclose(i_seg, low_pass_filter(i_ref, 10 * f, sample_rate), rtol=1e-12)
+
+        # The cutoff is rounded to 4 digits for the shared filter designs
+        sos = butter(2, 10 * f / (0.5 * sample_rate), btype='low', output='sos')
+        np.testing.assert_allclose(v_seg, sosfiltfilt(sos, v_ref), atol=2e-6)
+        np.testing.assert_allclose(i_seg, sosfiltfilt(sos, i_ref), atol=2e-5)
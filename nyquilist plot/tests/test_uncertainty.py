@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from equivalent_circuit import circuit_model
+from pipeline import analyze_files, fit_results
+from single_points import METHODS
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_points_lie_in_their_intervals(synthetic_log, method):
+    results = analyze_files([synthetic_log], method=method, memo=False, verbose=False, bootstrap=50)
+    for result in results:
+        assert "Z_samples" not in result
+        Z, low, high = result["Z"], result["Z_low"], result["Z_high"]
+        assert np.all((low.real <= Z.real) & (Z.real <= high.real))
+        assert np.all((low.imag <= Z.imag) & (Z.imag <= high.imag))
+        for name in ("R_s", "R_p", "C_p"):
+            assert result[name + "_low"] <= result[name] <= result[name + "_high"]
+
+
+@pytest.mark.parametrize("kk_exclude", [False, True])
+def test_parameter_bootstrap_uses_the_fitted_points(kk_exclude):
+    rng = np.random.default_rng(0)
+    freqs = np.geomspace(1.5, 0.01, 20)
+    Z = circuit_model(freqs, 0.05, 0.03, 20)
+    samples = Z * (1 + rng.normal(0, 1e-3, (100, len(freqs))))
+    # One glitched point, far off in the data and in every resample
+    Z[5] *= 1.5
+    samples[:, 5] *= 1.5
+    result = {"file": "log", "iteration": 0, "energy": 0.0, "Vo": 3.7, "freqs": freqs, "Z": Z,
+              "Z_samples": samples}
+    fit_results([result], memo=False, verbose=False, kk_exclude=kk_exclude)
+
+    assert not result["kk_point_valid"][5]
+    contains = result["R_p_low"] <= 0.03 <= result["R_p_high"]
+    assert contains == kk_exclude
@@ -0,0 +1,198 @@
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_log import Battery, write_synthetic_log
+from cache import load_cached, sidecar_path, _clear_columns
+from loader import load_columns, USED_COLUMNS
+from segments import find_segments, iteration_segments, frequency_groups, take
+from single_points import eis_groups, segment_signals, filter_segment, nearest_bin_impedance
+from spectra import windowed_spectra
+from demodulation import lockin_impedance, sine_fit_impedance
+from equivalent_circuit import equivalent_circuit_fit_batch, fit_spectra
+from uncertainty import impedance_uncertainty
+from profiling import LAZY_IMPORTS
+import plotting
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, fn, *args, items=None, unit=""):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        self.stages.append({"stage": name, "seconds": elapsed, "items": items, "unit": unit})
+        return result
+
+    def table(self):
+        lines = [f"{'stage':<22}{'seconds':>10}{'throughput':>24}"]
+        for stage in self.stages:
+            rate = ""
+            if stage["items"]:
+                rate = f"{stage['items'] / max(stage['seconds'], 1e-9):,.0f} {stage['unit']}/s"
+            lines.append(f"{stage['stage']:<22}{stage['seconds']:>10.4f}{rate:>24}")
+        return "\n".join(lines)
+
+
+class DiscardBackend(plotting.NullBackend):
+    # Builds every figure like an interactive run, then drops it
+    enabled = True
+
+
+def build_plots(results):
+    """
+    Build the Nyquist and output figures without showing them.
+    Returns False when plotly is not installed.
+    """
+    if importlib.util.find_spec("plotly") is None:
+        return False
+
+    backend = plotting.get_backend()
+    plotting.set_backend(DiscardBackend())
+    try:
+        for r in results:
+            plotting.nyquilist_plot(r["Z"], r["fitted_impedance"], r["iteration"], r["energy"])
+        plotting.output_plot([r["energy"] for r in results], [r["Vo"] for r in results],
+                             [r["R_s"] for r in results], [r["R_p"] for r in results], [r["C_p"] for r in results])
+    finally:
+        plotting.set_backend(backend)
+    return True
+
+
+def benchmark(filename, battery=None, workers=None):
+    """
+    Time each stage on filename. Its sidecar columns are rewritten, so
+    main benchmarks a copy of a user's log.
+    """
+    timer = StageTimer()
+    size = os.path.getsize(filename)
+
+    data = timer.run("load (text parse)", load_columns, filename, USED_COLUMNS + ("current_set",), workers,
+                     items=size / 1e6, unit="MB")
+    rows = len(data["time"])
+
+    _clear_columns(sidecar_path(filename))
+    timer.run("cache write", load_cached, filename, USED_COLUMNS + ("current_set",), workers,
+              items=size / 1e6, unit="MB")
+    data, _ = timer.run("cache map", load_cached, filename, USED_COLUMNS + ("current_set",), workers,
+                        items=size / 1e6, unit="MB")
+
+    segments = timer.run("segmenting", find_segments, data["iteration"], data["freq"], items=rows, unit="rows")
+    iterations = np.unique(segments["iteration"])
+
+    def group_all():
+        return [(it, list(eis_groups(frequency_groups(iteration_segments(segments, it))))) for it in iterations]
+    groups = timer.run("grouping", group_all, items=len(iterations), unit="iterations")
+    eis_rows = sum(int(np.sum(g["stop"] - g["start"])) for _, gs in groups for _, g in gs)
+
+    # As with profiling, the lazily imported modules are not charged to
+    # the first stage that needs them ("filtering")
+    for name in LAZY_IMPORTS:
+        timer.run("import " + name, importlib.import_module, name)
+
+    def filter_all():
+        return [[(f, filter_segment(*segment_signals(data["time"], data["voltage"], data["current"], g), f))
+                 for f, g in gs] for _, gs in groups]
+    filtered = timer.run("filtering", filter_all, items=eis_rows, unit="rows")
+
+    def fft_all():
+        spectra = []
+        for segs in filtered:
+            ffts = windowed_spectra([s for _, s in segs])
+            freqs = np.array([f for f, _ in segs])
+            spectra.append((freqs, np.array([nearest_bin_impedance(*x, f) for f, x in zip(freqs, ffts)])))
+        return spectra
+    spectra = timer.run("fft", fft_all, items=eis_rows, unit="rows")
+
+    def lockin_all():
+        return [[lockin_impedance(*segment_signals(data["time"], data["voltage"], data["current"], g),
+                                  take(data["current_set"], g, head=10, tail=1), f) for f, g in gs]
+                for _, gs in groups]
+    timer.run("lockin", lockin_all, items=eis_rows, unit="rows")
+
+    def sine_fit_all():
+        return [[sine_fit_impedance(*segment_signals(data["time"], data["voltage"], data["current"], g), f)
+                 for f, g in gs] for _, gs in groups]
+    timer.run("sinefit", sine_fit_all, items=eis_rows, unit="rows")
+
+    def bootstrap_all():
+        return [impedance_uncertainty(data["time"], data["current"], data["voltage"], data["freq"],
+                                      data["iteration"], it, segments, resamples=200) for it in iterations]
+    timer.run("bootstrap (200)", bootstrap_all, items=len(iterations), unit="iterations")
+
+    freqs = [s[0] for s in spectra]
+    impedances = [s[1] for s in spectra]
+    timer.run("fit (batch)", equivalent_circuit_fit_batch, freqs, impedances, items=len(spectra), unit="spectra")
+    params = timer.run("fit (warm start)", fit_spectra, freqs, impedances, True, None,
+                       items=len(spectra), unit="spectra")
+
+    results = [{"iteration": it, "energy": 0.0, "Vo": 0.0, "Z": Z, "R_s": p[0], "R_p": p[1], "C_p": p[2],
+                "fitted_impedance": Z} for it, Z, p in zip(iterations, impedances, params)]
+    start = time.perf_counter()
+    if build_plots(results):
+        timer.stages.append({"stage": "plot building", "seconds": time.perf_counter() - start,
+                             "items": len(results), "unit": "figures"})
+
+    report = {"file": filename, "bytes": size, "rows": rows, "iterations": len(iterations), "stages": timer.stages}
+    if battery is not None:
+        truth = np.array([battery.R_s, battery.R_p, battery.C_p])
+        error = np.median(np.abs(params - truth) / truth, axis=0)
+        report["median_relative_error"] = dict(zip(("R_s", "R_p", "C_p"), error.tolist()))
+    return timer, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of the analysis on a synthetic log.")
+    parser.add_argument("--file", help="existing log to benchmark instead of a generated one")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--sample-rate", type=float, default=100.0)
+    parser.add_argument("--eis-points", type=int, default=40)
+    parser.add_argument("--discharge-s", type=float, default=900.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", help="write the report as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the generated log")
+    args = parser.parse_args()
+
+    battery = None
+    directory = tempfile.mkdtemp(prefix="battery-benchmark-")
+    filename = os.path.join(directory, "000001.txt")
+    if args.file:
+        # The copy gets the sidecar, the user's cache and fits stay as they are
+        shutil.copyfile(args.file, filename)
+    else:
+        start = time.perf_counter()
+        battery = write_synthetic_log(filename, args.repetitions, Battery(), args.sample_rate,
+                                      args.eis_points, int(args.discharge_s * 1_000_000))
+        print(f"Generated {filename} ({os.path.getsize(filename) / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    try:
+        timer, report = benchmark(filename, battery, args.workers)
+        report["file"] = args.file or filename
+    finally:
+        if args.file or not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{report['rows']:,} rows, {report['iterations']} iterations")
+    print(timer.table())
+    if "median_relative_error" in report:
+        print("Median relative error vs ground truth: " +
+              ", ".join(f"{k} {v:.2%}" for k, v in report["median_relative_error"].items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
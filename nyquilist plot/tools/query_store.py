@@ -0,0 +1,37 @@
+import argparse
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results_store import ResultStore, PARAMETERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print one stored parameter against discharged energy as CSV.")
+    parser.add_argument("store", help="SQLite results store written by main.py --store")
+    parser.add_argument("parameter", choices=PARAMETERS)
+    parser.add_argument("--cell", action="append", help="cell to include, repeatable (default: all)")
+    parser.add_argument("--since", help="tested on or after this date, e.g. 2026-09-01")
+    parser.add_argument("--until", help="tested before this date")
+    parser.add_argument("--method", default=None)
+    parser.add_argument("--version", type=int, default=None, help="analysis version")
+    parser.add_argument("--kk-exclude", type=int, choices=(0, 1), default=None,
+                        help="only runs fitted with (1) or without (0) the Kramers-Kronig exclusion")
+    parser.add_argument("--warm-start", type=int, choices=(0, 1), default=None,
+                        help="only runs fitted with (1) or without (0) warm starts")
+    args = parser.parse_args()
+
+    with ResultStore(args.store) as store:
+        rows = store.query(args.parameter, cells=args.cell, since=args.since, until=args.until,
+                           version=args.version, method=args.method, kk_exclude=args.kk_exclude,
+                           warm_start=args.warm_start)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(("cell", "file", "method", "kk_exclude", "warm_start", "iteration", "energy", args.parameter))
+    writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
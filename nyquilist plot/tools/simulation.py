@@ -1,6 +1,12 @@
+import os
+import sys
 import numpy as np
 import plotly.graph_objs as go
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuits import compile_circuit
+
 # Parametry modelu
 Rs = 0.02        # Ohm
 Rct = 0.05       # Ohm
@@ -8,13 +14,10 @@ Cct = 0.2        # Farad
 sigma = 0.1      # Ohm·s^(-0.5)
 
 frequencies = np.logspace(9, 0, num=100)  # Hz
-omega = 2 * np.pi * frequencies             # rad/s
 
 # Obliczenia impedancji
-Z_cdl = 1 / (1j * omega * Cct)
-Z_warburg = sigma * (1 - 1j) / np.sqrt(omega)
-Z_parallel = 1 / (1/Rct + 1/Z_cdl)
-Z_total = Rs + Z_parallel + Z_warburg
+circuit = compile_circuit("R0-p(R1,C1)-W1")
+Z_total = circuit(frequencies, [Rs, Rct, Cct, sigma])
 
 # Re/Im
 Z_real = np.real(Z_total)
@@ -0,0 +1,178 @@
+import argparse
+import math
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from equivalent_circuit import circuit_model
+
+
+# Same fields and formatting as sd_control.log_to_sd
+LINE_FORMAT = "%.3f, %.3f, %.4f, %.4f, %.6f, %.6f, %d"
+
+
+def descending_log_list(min_val, max_val, num_values):
+    # Mirrors discharge_control.descending_log_list on the analyzer
+    log_min = math.log10(min_val)
+    log_max = math.log10(max_val)
+    step = (log_max - log_min) / (num_values - 1)
+    values = [10 ** (log_max - i * step) for i in range(num_values)]
+
+    times = []
+    log_downsample_list = []
+    for x in values:
+        log_downsample = 1
+        while x * log_downsample < 0.125:
+            log_downsample = log_downsample + 1
+        log_downsample_list.append(log_downsample)
+        times.append(max(2_000_000, min((3_000_000 / x), 16_000_000*log_downsample)))
+    return values, times, log_downsample_list
+
+
+class Battery:
+    """
+    Rs + (Rp||Cp) cell with a linear open circuit voltage curve.
+    The RC branch is solved in closed form, so samples may sit at
+    arbitrary (jittered) times and the true impedance is exactly
+    equivalent_circuit.circuit_model(f, R_s, R_p, C_p).
+    """
+    def __init__(self, R_s=0.05, R_p=0.03, C_p=20.0, capacity=3000.0, full_voltage=4.2, empty_voltage=3.0):
+        self.R_s = R_s
+        self.R_p = R_p
+        self.C_p = C_p
+        self.capacity = capacity  # mAh
+        self.full_voltage = full_voltage
+        self.empty_voltage = empty_voltage
+        self.v_rc = 0.0  # V across the RC branch
+        self.energy = 0.0  # mAh discharged
+
+    def ocv(self, energy):
+        return self.full_voltage - (self.full_voltage - self.empty_voltage) * energy / self.capacity
+
+    def run(self, t, dc, amplitude=0.0, f=0.0):
+        """
+        Apply i(t) = dc + amplitude * sin(2πft) [mA] for t from 0.
+
+        Returns:
+            (np.ndarray, np.ndarray, np.ndarray): Terminal voltage [V],
+            discharged energy [mAh] and current [mA] at each time.
+        """
+        tau = self.R_p * self.C_p
+        dc_a = dc * 1e-3
+        amplitude_a = amplitude * 1e-3
+
+        # Steady state of the RC branch plus the decay of its initial state
+        steady = self.R_p * dc_a * np.ones_like(t)
+        steady_0 = self.R_p * dc_a
+        charge = dc * t
+        current = dc * np.ones_like(t)
+        if amplitude and f:
+            omega = 2 * np.pi * f
+            Z_p = circuit_model(f, 0.0, self.R_p, self.C_p)
+            steady = steady + np.imag(Z_p * amplitude_a * np.exp(1j * omega * t))
+            steady_0 = steady_0 + np.imag(Z_p * amplitude_a)
+            charge = charge + amplitude * (1 - np.cos(omega * t)) / omega
+            current = current + amplitude * np.sin(omega * t)
+        v_rc = steady + (self.v_rc - steady_0) * np.exp(-t / tau)
+
+        energy = self.energy + charge / 3600
+        voltage = self.ocv(energy) - self.R_s * current * 1e-3 - v_rc
+
+        self.v_rc = v_rc[-1] if len(t) else self.v_rc
+        self.energy = energy[-1] if len(t) else self.energy
+        return voltage, energy, current
+
+
+class SyntheticLog:
+    """
+    Writes an SD card log the way discharge_control runs
+    sdcard/settings.py, with measurement noise and timestamp jitter.
+    """
+    def __init__(self, out, battery, sample_rate=100.0, current_noise=0.05, voltage_noise=0.02,
+                 jitter=0.0005, seed=0):
+        self.out = out
+        self.battery = battery
+        self.sample_rate = sample_rate  # ADC reads per second
+        self.current_noise = current_noise  # mA
+        self.voltage_noise = voltage_noise  # mV
+        self.jitter = jitter  # s
+        self.rng = np.random.default_rng(seed)
+        self.time = 0.0
+        self.iteration = 0
+
+    def _segment(self, duration, dc, amplitude, f, log_downsample):
+        n = int(duration * self.sample_rate)
+        if n == 0:
+            return
+        t = np.arange(n) / self.sample_rate + self.rng.uniform(0, self.jitter, n)
+        voltage, energy, current = self.battery.run(t, dc, amplitude, f)
+
+        keep = slice(log_downsample - 1, None, log_downsample)
+        rows = np.column_stack([
+            np.floor((self.time + t[keep]) * 1e6) / 1e3,                  # ms
+            np.trunc(current[keep] * 1000) / 1000,                          # mA set
+            current[keep] + self.rng.normal(0, self.current_noise, len(t[keep])),   # mA
+            voltage[keep] * 1e3 + self.rng.normal(0, self.voltage_noise, len(t[keep])),  # mV
+            np.full(len(t[keep]), math.floor(f * 1_000_000) / 1_000_000),  # Hz
+            energy[keep],                                                   # mAh
+            np.full(len(t[keep]), self.iteration),
+        ])
+        np.savetxt(self.out, rows, fmt=LINE_FORMAT)
+        self.time += n / self.sample_rate
+
+    def discharge(self, current, time_us, log_downsample):
+        self._segment(time_us / 1_000_000, current, 0.0, 0.0, log_downsample)
+
+    def eis(self, current, min_freq, max_freq, measurement_points):
+        freq_list, time_list, log_downsample_list = descending_log_list(min_freq, max_freq, measurement_points)
+        for f, time_us, log_downsample in zip(freq_list, time_list, log_downsample_list):
+            self._segment(time_us / 1_000_000, current * 0.5, current * 0.5, f, log_downsample)
+
+    def program(self, repetitions, eis_points=40, rest_us=60_000_000, discharge_us=900_000_000):
+        # Header rows, skipped by the loader
+        self.out.write("Time [ms], I set[mA], I meas[mA], U meas[mV], f[Hz], E [mAh], i\n")
+        self.out.write("Synthetic log R_s=%g R_p=%g C_p=%g\n" % (self.battery.R_s, self.battery.R_p, self.battery.C_p))
+
+        self.discharge(0, 5_000_000, 10)
+        for _ in range(repetitions):
+            self.discharge(0, rest_us, 100)
+            self.eis(200, 0.05, 50, eis_points)
+            self.discharge(420, discharge_us, 20)
+            self.iteration += 1
+
+
+def write_synthetic_log(filename, repetitions=3, battery=None, sample_rate=100.0, eis_points=40,
+                        discharge_us=900_000_000, seed=0):
+    """
+    Write a synthetic log and return the Battery used for it.
+    """
+    battery = battery or Battery()
+    with open(filename, "w") as out:
+        SyntheticLog(out, battery, sample_rate=sample_rate, seed=seed).program(
+            repetitions, eis_points=eis_points, discharge_us=discharge_us)
+    return battery
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Battery Analyzer SD card log.")
+    parser.add_argument("filename")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--sample-rate", type=float, default=100.0, help="ADC reads per second")
+    parser.add_argument("--eis-points", type=int, default=40)
+    parser.add_argument("--discharge-s", type=float, default=900.0, help="CC discharge per repetition")
+    parser.add_argument("--R-s", type=float, default=0.05)
+    parser.add_argument("--R-p", type=float, default=0.03)
+    parser.add_argument("--C-p", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_synthetic_log(
+        args.filename, args.repetitions, Battery(args.R_s, args.R_p, args.C_p),
+        args.sample_rate, args.eis_points, int(args.discharge_s * 1_000_000), args.seed)
+    print(f"{args.filename}: {os.path.getsize(args.filename) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
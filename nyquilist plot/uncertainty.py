@@ -0,0 +1,147 @@
+import numpy as np
+from demodulation import lockin_phasors, sine_fit_phasors
+from equivalent_circuit import equivalent_circuit_fit_batch, DEFAULT_CIRCUIT
+from preprocess import low_pass_filter
+from segments import find_segments, iteration_segments, frequency_groups, take
+from single_points import eis_groups, segment_signals, METHODS
+from spectra import hann_window
+
+
+def block_resamples(time, voltage, current, f, resamples=200, rng=None):
+    """
+    Moving-block bootstrap of a stepped-sine segment.
+
+    Both signals are split into a fit of offset + drift + sinusoid at f
+    and its residuals. The residuals are cut into blocks one period
+    long (at most a quarter of the segment), drawn with replacement
+    from any start and added back to the fit. Voltage and current share
+    the blocks, so their correlation is kept.
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray, np.ndarray): (resamples,
+        samples) voltages and currents on the segment's timestamps, and
+        the fitted voltage and current they are built around.
+    """
+    rng = rng or np.random.default_rng()
+    t = time - time[0]
+    n = len(t)
+    omega_t = 2 * np.pi * f * t
+    drift = (t - t.mean()) / max(t[-1], 1e-12)
+    design = np.column_stack([np.cos(omega_t), np.sin(omega_t), np.ones_like(t), drift])
+
+    signals = np.column_stack([voltage, current])
+    fitted = design @ (np.linalg.pinv(design) @ signals)
+    residual = signals - fitted
+
+    length = max(1, min(int(round(n / max(t[-1] * f, 1e-12))), n // 4))
+    starts = rng.integers(0, n - length + 1, size=(resamples, -(-n // length)))
+    index = (starts[..., None] + np.arange(length)).reshape(resamples, -1)[:, :n]
+    resampled = fitted + residual[index]
+    return resampled[..., 0], resampled[..., 1], fitted[:, 0], fitted[:, 1]
+
+
+def segment_impedances(method, time, voltage, current, f):
+    """
+    Impedance at f of every row of voltage and current, estimated as
+    single_points.impedance_spectrum does for a stepped segment with
+    method. All estimators are linear in the signals on fixed
+    timestamps, so the rows go through one pass: one least-squares
+    solve, one set of lock-in weights, or one interpolation, filter
+    and windowed DFT bin for "fft".
+
+    Returns:
+        np.ndarray: (rows,) complex impedances.
+    """
+    rows = len(voltage)
+    signals = np.vstack([voltage, current])
+    if method == "sinefit":
+        phasors = sine_fit_phasors(time, f, *signals)
+    elif method == "lockin":
+        # The I set reference rotates V and I alike, so V / I needs none
+        phasors = lockin_phasors(time, f, *signals)
+    else:
+        # preprocess_data, filter_segment and the nearest windowed bin
+        n = len(time)
+        sample_rate = 1 / np.mean(np.diff(time))
+        uniform = np.linspace(time.min(), time.max(), n)
+        resampled = np.array([np.interp(uniform, time, signal) for signal in signals])
+        filtered = low_pass_filter(resampled, 10 * f, sample_rate)
+        bins = np.fft.rfftfreq(n, (uniform[-1] - uniform[0]) / (n - 1))
+        nearest = np.argmin(np.abs(bins - f))
+        phasors = filtered @ (hann_window(n) * np.exp(-2j * np.pi * nearest * np.arange(n) / n))
+    return phasors[:rows] / phasors[rows:]
+
+
+def interval(samples, level=0.95, axis=0):
+    """
+    Percentile interval, real and imaginary parts taken separately.
+    """
+    low, high = 50 * (1 - level), 50 * (1 + level)
+    if np.iscomplexobj(samples):
+        return (np.percentile(samples.real, low, axis=axis) + 1j * np.percentile(samples.imag, low, axis=axis),
+                np.percentile(samples.real, high, axis=axis) + 1j * np.percentile(samples.imag, high, axis=axis))
+    return np.percentile(samples, low, axis=axis), np.percentile(samples, high, axis=axis)
+
+
+def impedance_uncertainty(
+        time, current, voltage, freq, iteration, it, segments=None,
+        resamples=200, level=0.95, seed=0, method="fft", current_set=None):
+    """
+    Bootstrap confidence intervals of one iteration's impedance points.
+    Stepped-sine segments only; the two logged periods of a multisine
+    are too few to resample.
+
+    Each frequency is resampled independently (block_resamples) and the
+    resamples are estimated with the same method as the point values.
+    Their spread around the estimate of the fit they are built around
+    is the resampling error, which is added to the point value, so the
+    intervals describe the reported points.
+
+    Returns:
+        dict: freqs, points (the estimates of the data), samples
+        (resamples, freqs), Z_low and Z_high, or None if the iteration
+        has no stepped segments.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}")
+    if segments is None:
+        segments = find_segments(iteration, freq)
+    groups = frequency_groups(iteration_segments(segments, it))
+
+    rng = np.random.default_rng([seed, int(it)])
+    freqs, points, samples = [], [], []
+    for f, group in eis_groups(groups):
+        t_seg, v_seg, i_seg = segment_signals(time, voltage, current, group)
+        if method == "lockin" and lockin_phasors(t_seg, f, take(current_set, group, head=10, tail=1))[0] == 0:
+            continue  # no point either, see lockin_impedance
+        v_boot, i_boot, v_fit, i_fit = block_resamples(t_seg, v_seg, i_seg, f, resamples, rng)
+        Z = segment_impedances(method, t_seg, np.vstack([v_seg, v_fit, v_boot]),
+                               np.vstack([i_seg, i_fit, i_boot]), f)
+        freqs.append(f)
+        points.append(Z[0])
+        samples.append(Z[0] + Z[2:] - Z[1])
+    if not freqs:
+        return None
+    samples = np.column_stack(samples)
+    Z_low, Z_high = interval(samples, level)
+    return {"freqs": np.array(freqs), "points": np.array(points), "samples": samples, "Z_low": Z_low, "Z_high": Z_high}
+
+
+def parameter_uncertainty(freqs, samples, params, level=0.95, circuit=None):
+    """
+    Confidence intervals of the circuit parameters: every resampled
+    spectrum (a row of samples) is fitted in one batch starting from
+    params, the fit of the measured points.
+
+    Returns:
+        dict: <parameter>_low and _high for each parameter of circuit,
+        R_s, R_p and C_p of DEFAULT_CIRCUIT if None.
+    """
+    circuit = circuit or DEFAULT_CIRCUIT
+    fitted = equivalent_circuit_fit_batch([freqs] * len(samples), list(samples), params, circuit=circuit)
+    low, high = interval(fitted, level)
+    result = {}
+    for k, name in enumerate(circuit.parameters):
+        result[name + "_low"] = low[k]
+        result[name + "_high"] = high[k]
+    return result